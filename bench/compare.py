@@ -0,0 +1,39 @@
+import argparse
+import json
+
+
+def flatten(results: dict, prefix=''):
+    # nested results -> {'fill.put.ops_per_sec': value}
+    flat = dict()
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compare JSON results saved by bench.suite')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    for key in sorted(set(baseline['config']) | set(candidate['config'])):
+        if baseline['config'].get(key) != candidate['config'].get(key):
+            print('config {} differs: {} vs {}'.format(key, baseline['config'].get(key), candidate['config'].get(key)))
+
+    old, new = flatten(baseline['results']), flatten(candidate['results'])
+    print('{:<32} {:>14} {:>14} {:>9}'.format('metric', 'baseline', 'candidate', 'change'))
+    for key in sorted(set(old) & set(new)):
+        change = '{:+.1f}%'.format((new[key] - old[key]) / old[key] * 100) if old[key] else '-'
+        print('{:<32} {:>14.2f} {:>14.2f} {:>9}'.format(key, old[key], new[key], change))
+
+
+if __name__ == '__main__':
+    main()
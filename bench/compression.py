@@ -0,0 +1,60 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.packed import PackedStorage
+
+compressors = [None, 'zlib', 'lzma', 'bz2']
+
+words = [b'block', b'storage', b'dedupe', b'blob', b'hash', b'the', b'of', b'data', b'file', b'address']
+
+
+def workload(num_of_blocks: int, block_size: int, kind: str):
+    if kind == 'zero':
+        return [bytes(block_size) for i in range(num_of_blocks)]
+    if kind == 'random':
+        return [os.urandom(block_size) for i in range(num_of_blocks)]
+    blocks = []
+    for i in range(num_of_blocks):
+        text = b' '.join(random.choice(words) for j in range(block_size // 4))
+        blocks.append(text[:block_size])
+    return blocks
+
+
+def measure(blocks, block_size: int, compressor: str):
+    path = tempfile.mkdtemp(prefix='blob_bench_')
+    try:
+        storage = PackedStorage(block_size, 1024, path, DictKVStorage, compressor)
+        storage.put_data_batch(enumerate(blocks))
+        start = time.process_time()
+        storage.get_data_batch(range(len(blocks)))
+        read_time = time.process_time() - start
+        result = storage.get_compression_ratio(), storage.get_cpu_per_mb(), read_time
+        storage.close()
+        return result
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PackedStorage compression ratio and CPU cost per compressor')
+    parser.add_argument('--blocks', type=int, default=2000)
+    parser.add_argument('--block-size', type=int, default=4096)
+    args = parser.parse_args()
+
+    megabytes = args.blocks * args.block_size / 2 ** 20
+    print('{:<8} {:<8} {:>8} {:>14} {:>14}'.format('data', 'codec', 'ratio', 'write CPU s/MB', 'read CPU s/MB'))
+    for kind in ('zero', 'text', 'random'):
+        blocks = workload(args.blocks, args.block_size, kind)
+        for compressor in compressors:
+            ratio, write_cpu, read_time = measure(blocks, args.block_size, compressor)
+            print('{:<8} {:<8} {:>8.2f} {:>14.4f} {:>14.4f}'.format(kind, str(compressor), ratio, write_cpu,
+                                                                   read_time / megabytes))
+
+
+if __name__ == '__main__':
+    main()
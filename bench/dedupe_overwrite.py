@@ -0,0 +1,65 @@
+import argparse
+import time
+
+from blob.backends.allocator import Allocator
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import Storage
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.data = dict()
+        self.allocator = Allocator(self.data)
+
+    def get_data(self, address):
+        return self.data[address]
+
+    def put_data(self, address, block_data):
+        self.data[address] = block_data
+        self.allocator.use(address)
+
+    def del_data(self, address):
+        del self.data[address]
+        self.allocator.release(address)
+
+    def get_free_address(self):
+        return self.allocator.get_free_address()
+
+    def get_free_addresses(self, count):
+        return self.allocator.get_free_addresses(count)
+
+
+def block(number: int):
+    return number.to_bytes(8, 'little')
+
+
+def measure(num_of_blocks: int, num_of_overwrites: int):
+    proxy = DedupeProxy(MemoryStorage(), DictKVStorage)
+    for address in range(num_of_blocks):
+        proxy.put_data(address, block(address))
+
+    start = time.perf_counter()
+    for i in range(num_of_overwrites):
+        address = i * 7919 % num_of_blocks
+        if i % 2:
+            proxy.put_data(address, block(num_of_blocks + i))  # unique overwrite
+        else:
+            proxy.put_data(address, block((address + 1) % num_of_blocks))  # duplicate overwrite
+    return (time.perf_counter() - start) / num_of_overwrites
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DedupeProxy overwrite cost vs. volume size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--overwrites', type=int, default=10 ** 4)
+    args = parser.parse_args()
+
+    print('{:>10} {:>14}'.format('blocks', 'us/overwrite'))
+    for num_of_blocks in args.sizes:
+        cost = measure(num_of_blocks, args.overwrites)
+        print('{:>10} {:>14.2f}'.format(num_of_blocks, cost * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
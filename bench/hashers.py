@@ -0,0 +1,57 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.hashers import get_hasher
+
+modes = [
+    ('sha256 verify', 'sha256', None, True),
+    ('blake2b verify', 'blake2b', None, True),
+    ('blake2b-16 trust', 'blake2b', 16, False),
+    ('blake2s-16 trust', 'blake2s', 16, False),
+    ('crc32 prefilter', 'crc32', None, True),
+]
+
+
+def workload(num_of_blocks: int, block_size: int, duplicate_ratio: float):
+    unique = [os.urandom(block_size) for i in range(max(1, int(num_of_blocks * (1 - duplicate_ratio))))]
+    return [unique[i % len(unique)] for i in range(num_of_blocks)]
+
+
+def measure(blocks, block_size: int, hasher: str, digest_size: int, verify: bool):
+    path = tempfile.mkdtemp(prefix='blob_bench_')
+    try:
+        storage = FileStorage(block_size, 1024, path, DictKVStorage)
+        proxy = DedupeProxy(storage, DictKVStorage, get_hasher(hasher, digest_size), verify)
+        start = time.perf_counter()
+        for address, block in enumerate(blocks):
+            proxy.put_data(address, block)
+        result = time.perf_counter() - start
+        proxy.close()
+        return result
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DedupeProxy ingest throughput per hashing mode')
+    parser.add_argument('--blocks', type=int, default=20000)
+    parser.add_argument('--block-size', type=int, default=4096)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.5)
+    args = parser.parse_args()
+
+    blocks = workload(args.blocks, args.block_size, args.duplicate_ratio)
+    megabytes = args.blocks * args.block_size / 2 ** 20
+    print('{:<18} {:>10}'.format('mode', 'MB/s'))
+    for name, hasher, digest_size, verify in modes:
+        elapsed = measure(blocks, args.block_size, hasher, digest_size, verify)
+        print('{:<18} {:>10.1f}'.format(name, megabytes / elapsed))
+
+
+if __name__ == '__main__':
+    main()
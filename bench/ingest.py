@@ -0,0 +1,51 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.hashers import get_hasher
+from bench.workload import Workload
+
+
+def measure(workload: Workload, hasher: str, workers: int, processes: bool, batch: int):
+    # returns ingest throughput in MB/s
+    path = tempfile.mkdtemp(prefix='blob_bench_')
+    try:
+        storage = FileStorage(workload.block_size, 1024, path, DictKVStorage)
+        proxy = DedupeProxy(storage, DictKVStorage, get_hasher(hasher), hash_workers=workers,
+                            hash_processes=processes)
+        start = time.perf_counter()
+        count = proxy.ingest(workload.fill(), batch)
+        elapsed = time.perf_counter() - start
+        proxy.close()
+        return count * workload.block_size / elapsed / 2 ** 20
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DedupeProxy ingest throughput vs. number of hashing workers')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    parser.add_argument('--blocks', type=int, default=4000)
+    parser.add_argument('--block-size', type=int, default=65536)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.5)
+    parser.add_argument('--hasher', default='sha256')
+    parser.add_argument('--batch', type=int, default=64)
+    args = parser.parse_args()
+
+    workload = Workload(args.blocks, args.block_size, args.duplicate_ratio)
+    print('{:<8} {:>8} {:>10}'.format('pool', 'workers', 'MB/s'))
+    for processes in (False, True):
+        for workers in args.workers:
+            if workers == 0 and processes:
+                continue  # same as inline hashing with threads
+            throughput = measure(workload, args.hasher, workers, processes, args.batch)
+            pool = 'inline' if workers == 0 else 'process' if processes else 'thread'
+            print('{:<8} {:>8} {:>10.1f}'.format(pool, workers, throughput))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+from blob.backends.allocator import Allocator
+from blob.backends.compact import CompactKVStorage
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import Storage
+from blob.hashers import get_hasher
+
+# name -> function returning kv_storage factory for one stack
+kv_storages = {
+    'dict': lambda: DictKVStorage,
+    'compact': CompactKVStorage,
+}
+
+
+class NullStorage(Storage):
+    # keeps block metadata like FileStorage and drops block data, so only index memory is measured
+    def __init__(self, kv_storage):
+        self.blocks_metadata = kv_storage('blocks_metadata')
+        self.allocator = Allocator(self.blocks_metadata)
+
+    def put_data_batch(self, items):
+        for address, block_data in items:
+            self.blocks_metadata[address] = len(block_data)
+            self.allocator.use(address)
+
+    def del_data(self, address: int):
+        del self.blocks_metadata[address]
+        self.allocator.release(address)
+
+    def get_free_address(self):
+        return self.allocator.get_free_address()
+
+    def get_free_addresses(self, count: int):
+        return self.allocator.get_free_addresses(count)
+
+
+def get_rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(args):
+    # runs in fresh process, returns (bytes per block, seconds)
+    name, num_of_blocks, duplicate_ratio, batch = args
+    kv_storage = kv_storages[name]()
+    unique = max(1, int(num_of_blocks * (1 - duplicate_ratio)))
+    rss = get_rss()
+    start = time.perf_counter()
+    proxy = DedupeProxy(NullStorage(kv_storage), kv_storage, get_hasher('blake2b', 16), verify=False)
+    for first in range(0, num_of_blocks, batch):
+        proxy.put_data_batch((address, (address % unique).to_bytes(8, 'little'))
+                             for address in range(first, min(first + batch, num_of_blocks)))
+    return (get_rss() - rss) / num_of_blocks, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index memory per block of DedupeProxy and storage maps')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 6, 10 ** 7])
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0)
+    parser.add_argument('--batch', type=int, default=1024)
+    parser.add_argument('--maps', nargs='+', choices=list(kv_storages), default=list(kv_storages))
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('fork')
+    print('{:<8} {:>10} {:>14} {:>10}'.format('maps', 'blocks', 'bytes/block', 'seconds'))
+    for num_of_blocks in args.sizes:
+        for name in args.maps:
+            with context.Pool(1) as pool:
+                per_block, seconds = pool.apply(measure, [(name, num_of_blocks, args.duplicate_ratio,
+                                                           args.batch)])
+            print('{:<8} {:>10} {:>14.1f} {:>10.1f}'.format(name, num_of_blocks, per_block, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+from blob.backends.key_value import LogKVStorage
+from blob.backends.mapped import MappedKVStorage, write_index
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+
+
+def get_maps(num_of_blocks: int, block_size: int, blob_size: int):
+    # maps of volume with every block written once
+    hashes = [hashlib.sha256(i.to_bytes(8, 'little')).hexdigest() for i in range(num_of_blocks)]
+    return {
+        'blobs': dict((blob, 'blob_' + str(blob).rjust(5, '0')) for blob in range(-(-num_of_blocks // blob_size))),
+        'blocks_metadata': dict((i, block_size) for i in range(num_of_blocks)),
+        'by_address': dict((i, i) for i in range(num_of_blocks)),
+        'by_hash': dict((block_hash, [i]) for i, block_hash in enumerate(hashes)),
+        'by_storage_address': dict(enumerate(hashes)),
+        'links': dict((i, 1) for i in range(num_of_blocks)),
+    }
+
+
+def write_checkpoints(path: str, maps: dict, kv_storage: type, block_size: int, blob_size: int):
+    for file_name in maps['blobs'].values():
+        with open(os.path.join(path, file_name), 'wb') as file:
+            file.truncate(block_size * blob_size)  # sparse, data of blocks is not needed
+    for name, data in maps.items():
+        file_name = os.path.join(path, name + kv_storage.checkpoint_suffix)
+        if kv_storage is MappedKVStorage:
+            write_index(file_name, data.items())
+        else:
+            with open(file_name, 'wb') as file:
+                pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+
+
+def measure(maps: dict, kv_storage: type, block_size: int, blob_size: int):
+    # returns seconds to open volume and seconds of first write
+    path = tempfile.mkdtemp(prefix='blob_bench_')
+    try:
+        write_checkpoints(path, maps, kv_storage, block_size, blob_size)
+        factory = kv_storage.factory(path)
+        start = time.perf_counter()
+        proxy = DedupeProxy(FileStorage(block_size, blob_size, path, factory), factory)
+        open_time = time.perf_counter() - start
+        start = time.perf_counter()
+        proxy.put_data(len(maps['by_address']), os.urandom(block_size))
+        write_time = time.perf_counter() - start
+        proxy.close()
+        return open_time, write_time
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Open time of persistent volume vs. number of blocks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--block-size', type=int, default=4096)
+    parser.add_argument('--blob-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    print('{:<8} {:>10} {:>10} {:>12}'.format('maps', 'blocks', 'open s', 'first put s'))
+    for num_of_blocks in args.sizes:
+        maps = get_maps(num_of_blocks, args.block_size, args.blob_size)
+        for name, kv_storage in (('log', LogKVStorage), ('mapped', MappedKVStorage)):
+            open_time, write_time = measure(maps, kv_storage, args.block_size, args.blob_size)
+            print('{:<8} {:>10} {:>10.4f} {:>12.4f}'.format(name, num_of_blocks, open_time, write_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+
+
+def measure(blocks: int, block_size: int, read_ahead: int, delay: float):
+    # returns seconds of sequential read of all blocks and read-ahead hit rate,
+    # delay is work of reader per block which prefetching overlaps
+    path = tempfile.mkdtemp(prefix='blob_bench_')
+    try:
+        proxy = DedupeProxy(FileStorage(block_size, 1024, path, DictKVStorage), DictKVStorage,
+                            read_ahead=read_ahead)
+        proxy.put_data_batch((address, os.urandom(block_size)) for address in range(blocks))
+        proxy.storage.pool.close()  # first read of each blob opens its file again
+        os.sync()
+        for file_name in os.listdir(path):
+            # evicts blob files from page cache, so reads go to disk
+            with open(os.path.join(path, file_name), 'rb') as file:
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        start = time.perf_counter()
+        for address in range(blocks):
+            proxy.get_data(address)
+            if delay:
+                time.sleep(delay)
+        elapsed = time.perf_counter() - start
+        hit_rate = proxy.read_ahead.get_hit_rate() if proxy.read_ahead is not None else 0.0
+        proxy.close()
+        return elapsed, hit_rate
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sequential read time vs. read-ahead depth')
+    parser.add_argument('--depths', type=int, nargs='+', default=[0, 8, 32, 128])
+    parser.add_argument('--blocks', type=int, default=20000)
+    parser.add_argument('--block-size', type=int, default=4096)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds of reader work per block')
+    args = parser.parse_args()
+
+    print('{:>8} {:>10} {:>10}'.format('depth', 'read s', 'hit rate'))
+    for depth in args.depths:
+        elapsed, hit_rate = measure(args.blocks, args.block_size, depth, args.delay)
+        print('{:>8} {:>10.3f} {:>10.3f}'.format(depth, elapsed, hit_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from bench.workload import Workload
+from blob.volume import Resources, open_volume
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def open_storage(path: str, block_size: int, blob_size: int, cache_size=0, hash_workers=0, **options):
+    # volume as opened by blob.init, options are those of Volume
+    resources = Resources(cache_size=cache_size, hash_workers=hash_workers)
+    return open_volume(path, block_size, blob_size, resources=resources, own_resources=True, **options)
+
+
+def get_written_bytes():
+    # bytes passed to write calls by this process, None where not available
+    try:
+        with open('/proc/self/io') as file:
+            for line in file:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def get_max_rss():
+    # peak resident set size in bytes, None where not available
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def percentile(latencies: list, q: float):
+    # latencies should be sorted
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def summarize(latencies: list, ops: int):
+    # latencies are per call, ops are blocks read or written by all calls
+    busy = sum(latencies)
+    latencies.sort()
+    return {
+        'ops': ops,
+        'ops_per_sec': ops / busy if busy else None,
+        'p50_us': percentile(latencies, 0.5) * 10 ** 6 if latencies else None,
+        'p99_us': percentile(latencies, 0.99) * 10 ** 6 if latencies else None,
+    }
+
+
+def run_phase(volume, operations, batch: int):
+    # operations are (address, block data) for writes and (address, None) for reads,
+    # with batch > 1 consecutive operations of same kind are issued as one batch call, latency is per call
+    latencies = {'put': [], 'get': []}
+    ops = {'put': 0, 'get': 0}
+    logical_bytes = 0
+    clock = time.perf_counter
+    start = clock()
+    group = []
+    for operation in itertools.chain(operations, [None]):
+        if group and (operation is None or len(group) == batch or (operation[1] is None) != (group[0][1] is None)):
+            op_start = clock()
+            if group[0][1] is None:
+                if batch > 1:
+                    volume.get_blocks([address for address, block_data in group])
+                else:
+                    volume.get_block(group[0][0])
+                latencies['get'].append(clock() - op_start)
+                ops['get'] += len(group)
+            else:
+                if batch > 1:
+                    volume.put_blocks(group)
+                else:
+                    volume.put_block(*group[0])
+                latencies['put'].append(clock() - op_start)
+                ops['put'] += len(group)
+                logical_bytes += sum(len(block_data) for address, block_data in group)
+            group = []
+        if operation is not None:
+            group.append(operation)
+    elapsed = clock() - start
+
+    result = dict((kind, summarize(kind_latencies, ops[kind])) for kind, kind_latencies in latencies.items())
+    result['seconds'] = elapsed
+    result['ops_per_sec'] = (ops['put'] + ops['get']) / elapsed if elapsed else None
+    return result, logical_bytes
+
+
+def measure(args):
+    workload = Workload(args.blocks, args.block_size, args.duplicate_ratio, not args.random, args.read_ratio,
+                        args.ops, args.seed)
+    path = tempfile.mkdtemp(prefix='blob_bench_', dir=args.dir)
+    try:
+        written_bytes = get_written_bytes()
+        volume = open_storage(path, args.block_size, args.blob_size, args.cache_size, args.hash_workers,
+                              persistent=args.persistent, hasher=args.hasher, wal=args.wal,
+                              compressor=args.compressor, compact=args.compact, mapped=args.mapped,
+                              read_ahead=args.read_ahead)
+        fill, fill_bytes = run_phase(volume, workload.fill(), args.batch)
+        mixed, mixed_bytes = run_phase(volume, workload.mixed(), args.batch)
+
+        if args.wal:
+            volume.storage.checkpoint()
+        proxy = volume.proxy
+        dedupe_ratio = len(proxy.by_address.keys()) / max(1, len(proxy.links.keys()))
+        volume.close()
+
+        if written_bytes is not None:
+            written_bytes = get_written_bytes() - written_bytes
+        logical_bytes = fill_bytes + mixed_bytes
+        return {
+            'fill': fill,
+            'mixed': mixed,
+            'dedupe_ratio': dedupe_ratio,
+            'written_per_logical_byte': written_bytes / logical_bytes if written_bytes is not None else None,
+            'max_rss_bytes': get_max_rss(),
+        }
+    finally:
+        shutil.rmtree(path)
+
+
+def format_value(value, spec: str):
+    return format(value, spec) if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='put/get throughput, latency and dedupe ratio of blob storage')
+    parser.add_argument('--blocks', type=int, default=20000, help='number of addresses')
+    parser.add_argument('--ops', type=int, default=None, help='operations of mixed phase, --blocks by default')
+    parser.add_argument('--block-size', type=int, default=4096)
+    parser.add_argument('--blob-size', type=int, default=256)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.5)
+    parser.add_argument('--read-ratio', type=float, default=0.5, help='share of reads in mixed phase')
+    parser.add_argument('--random', action='store_true', help='random instead of sequential addresses')
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--persistent', action='store_true')
+    parser.add_argument('--mapped', action='store_true', help='persistent maps as memory-mapped checkpoints')
+    parser.add_argument('--compact', action='store_true', help='in-memory maps kept in arrays')
+    parser.add_argument('--hasher', default='sha256')
+    parser.add_argument('--hash-workers', type=int, default=0)
+    parser.add_argument('--compressor', default=None)
+    parser.add_argument('--cache-size', type=int, default=0)
+    parser.add_argument('--read-ahead', type=int, default=0, help='max blocks prefetched by sequential reads')
+    parser.add_argument('--wal', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', default=None, help='directory for temporary storage')
+    parser.add_argument('--output', default=None, help='file to save JSON results to')
+    args = parser.parse_args()
+    if args.wal and not args.persistent:
+        parser.error('--wal needs --persistent')
+    if args.compact and args.persistent:
+        parser.error('--compact maps are not persistent')
+
+    results = measure(args)
+    print('{:<6} {:<4} {:>10} {:>12} {:>10} {:>10}'.format('phase', 'op', 'ops', 'ops/s', 'p50 us', 'p99 us'))
+    for phase in ('fill', 'mixed'):
+        for kind in ('put', 'get'):
+            stats = results[phase][kind]
+            print('{:<6} {:<4} {:>10} {:>12} {:>10} {:>10}'.format(
+                phase, kind, stats['ops'], format_value(stats['ops_per_sec'], '.0f'),
+                format_value(stats['p50_us'], '.1f'), format_value(stats['p99_us'], '.1f')))
+    print('dedupe ratio {:.2f}, written per logical byte {}, max RSS {} MB'.format(
+        results['dedupe_ratio'], format_value(results['written_per_logical_byte'], '.2f'),
+        format_value(results['max_rss_bytes'] and results['max_rss_bytes'] / 2 ** 20, '.1f')))
+
+    if args.output is not None:
+        config = dict(vars(args))
+        del config['output'], config['dir']
+        with open(args.output, 'w') as file:
+            json.dump({
+                'config': config,
+                'results': results,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+
+
+def measure(num_of_threads: int, blocks_per_thread: int, block_size: int, blob_size: int, batch: int):
+    path = tempfile.mkdtemp(prefix='blob_bench_')
+    try:
+        proxy = DedupeProxy(FileStorage(block_size, blob_size, path, DictKVStorage), DictKVStorage)
+        workloads = [[(number * blocks_per_thread + i, os.urandom(block_size)) for i in range(blocks_per_thread)]
+                     for number in range(num_of_threads)]
+
+        def worker(items):
+            for i in range(0, len(items), batch):
+                proxy.put_data_batch(items[i:i + batch])
+
+        threads = [threading.Thread(target=worker, args=(items,)) for items in workloads]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        proxy.close()
+        return elapsed
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DedupeProxy write throughput vs. number of threads')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--blocks', type=int, default=20000, help='total number of blocks written')
+    parser.add_argument('--block-size', type=int, default=64 * 1024)
+    parser.add_argument('--blob-size', type=int, default=256)
+    parser.add_argument('--batch', type=int, default=16)
+    args = parser.parse_args()
+
+    print('{:>8} {:>10}'.format('threads', 'MB/s'))
+    for num_of_threads in args.threads:
+        blocks_per_thread = args.blocks // num_of_threads
+        elapsed = measure(num_of_threads, blocks_per_thread, args.block_size, args.blob_size, args.batch)
+        megabytes = blocks_per_thread * num_of_threads * args.block_size / 2 ** 20
+        print('{:>8} {:>10.1f}'.format(num_of_threads, megabytes / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import random
+
+
+class Workload:
+    # reproducible stream of operations: fill phase writes every address once, mixed phase reads and
+    # overwrites them, block contents are generated from their index so no block pool is kept in memory
+    def __init__(self, num_of_blocks: int, block_size: int, duplicate_ratio=0.5, sequential=True, read_ratio=0.5,
+                 num_of_ops: int = None, seed=0):
+        if block_size < 8:
+            raise ValueError('block_size should be at least 8 bytes')
+        if not 0 <= duplicate_ratio < 1:
+            raise ValueError('duplicate_ratio should be in [0, 1)')
+
+        self.num_of_blocks = num_of_blocks
+        self.block_size = block_size
+        self.duplicate_ratio = duplicate_ratio
+        self.sequential = sequential
+        self.read_ratio = read_ratio
+        self.num_of_ops = num_of_ops if num_of_ops is not None else num_of_blocks
+        self.seed = seed
+
+        self.num_of_unique = max(1, round(num_of_blocks * (1 - duplicate_ratio)))
+        filler = random.Random(seed).getrandbits(block_size * 8).to_bytes(block_size, 'little')
+        self.filler = filler[8:]
+
+    def get_block(self, number: int):
+        # distinct numbers give distinct blocks
+        return number.to_bytes(8, 'little') + self.filler
+
+    def get_addresses(self, rng: random.Random, count: int):
+        if self.sequential:
+            return [i % self.num_of_blocks for i in range(count)]
+        return [rng.randrange(self.num_of_blocks) for i in range(count)]
+
+    def fill(self):
+        # yields (address, block data) writing every address once
+        rng = random.Random(self.seed)
+        addresses = list(range(self.num_of_blocks))
+        if not self.sequential:
+            rng.shuffle(addresses)
+        for i, address in enumerate(addresses):
+            yield address, self.get_block(i % self.num_of_unique)
+
+    def mixed(self):
+        # yields (address, block data) for writes and (address, None) for reads
+        rng = random.Random(self.seed + 1)
+        for address in self.get_addresses(rng, self.num_of_ops):
+            if rng.random() < self.read_ratio:
+                yield address, None
+            else:
+                yield address, self.get_block(rng.randrange(self.num_of_unique))
@@ -1,20 +1,44 @@
-import os
+import shutil
+import time
 
-from blob.backends.key_value import DictKVStorage
-from blob.backends.storage import FileStorage
-from blob.backends.proxy import DedupeProxy
+from blob.metrics import Metrics
+from blob.volume import Resources, Volume, open_volume
 
+# module functions are compatibility layer over one Volume returning 0 or 1, see open_volume for several volumes
+volume = None
 storage = None
 storage_path = None
+metrics = None
+streams = None
 
 
-def init(block_size: int, blob_size: int, path='./blob_storage'):
+def init(block_size: int, blob_size: int, path='./blob_storage', persistent=False, cache_size=0,
+         hasher='sha256', verify=True, wal=False, compressor=None, metrics_sink: Metrics = None, compact=False,
+         hash_workers=0, mapped=False, read_ahead=0):
+    # metrics_sink enables metrics of all layers, see get_metrics,
+    # compact keeps in-memory maps in arrays, it saves memory with raw digest hashers (blake2b, blake2s),
+    # hash_workers threads hash blocks of put_blocks batches,
+    # mapped keeps persistent maps as memory-mapped binary checkpoints, so open time does not grow with volume,
+    # read_ahead prefetches up to that many blocks in background while blocks are read sequentially,
+    # wal logs writes before they reach storage, it needs persistent
+    global volume
     global storage
     global storage_path
-    if storage is None:
+    global metrics
+    global streams
+    if volume is None:
         try:
-            storage = DedupeProxy(FileStorage(block_size, blob_size, path, DictKVStorage), DictKVStorage)
+            resources = Resources(16, cache_size, hash_workers)
+            try:
+                volume = Volume(path, block_size, blob_size, persistent, hasher, verify, wal, compressor, compact,
+                                mapped, metrics_sink, resources, own_resources=True, read_ahead=read_ahead)
+            except Exception:
+                resources.close()
+                raise
+            storage = volume.storage
+            streams = volume.streams
             storage_path = path
+            metrics = metrics_sink
         except Exception:
             return 1
         else:
@@ -26,13 +50,35 @@ def init(block_size: int, blob_size: int, path='./blob_storage'):
 def get_block(block_id: int, block_data: bytearray):
     global storage
     if storage:
+        start = time.perf_counter() if metrics is not None else None
         try:
             data = storage.get_data(block_id)
         except Exception:
+            record('get_block', start, failed=True)
             return 1
         else:
             block_data.clear()
             block_data.extend(data)
+            record('get_block', start)
+            return 0
+    return 1
+
+
+def get_block_into(block_id: int, buffer, length: list = None):
+    # reads block straight into preallocated writable buffer, length receives number of bytes read
+    global storage
+    if storage:
+        start = time.perf_counter() if metrics is not None else None
+        try:
+            data_len = storage.get_data_into(block_id, buffer)
+        except Exception:
+            record('get_block_into', start, failed=True)
+            return 1
+        else:
+            if length is not None:
+                length.clear()
+                length.append(data_len)
+            record('get_block_into', start)
             return 0
     return 1
 
@@ -40,25 +86,145 @@ def get_block(block_id: int, block_data: bytearray):
 def put_block(block_id: int, block_data: bytes):
     global storage
     if storage:
+        start = time.perf_counter() if metrics is not None else None
         try:
             storage.put_data(block_id, block_data)
         except Exception:
+            record('put_block', start, failed=True)
             return 1
         else:
+            record('put_block', start)
             return 0
     else:
         return 1
 
 
-def delete():
+def get_blocks(block_ids: list, blocks_data: list):
+    global storage
+    if storage:
+        start = time.perf_counter() if metrics is not None else None
+        try:
+            data = storage.get_data_batch(block_ids)
+        except Exception:
+            record('get_blocks', start, failed=True)
+            return 1
+        else:
+            blocks_data.clear()
+            blocks_data.extend(data)
+            record('get_blocks', start)
+            return 0
+    return 1
+
+
+def put_blocks(blocks: list):
+    # blocks is a list of (block_id, block_data) pairs
+    global storage
+    if storage:
+        start = time.perf_counter() if metrics is not None else None
+        try:
+            storage.put_data_batch(blocks)
+        except Exception:
+            record('put_blocks', start, failed=True)
+            return 1
+        else:
+            record('put_blocks', start)
+            return 0
+    else:
+        return 1
+
+
+def put_stream(key, fileobj):
+    # stores object read from binary file object, see StreamStore
+    global streams
+    if streams:
+        start = time.perf_counter() if metrics is not None else None
+        try:
+            streams.put_stream(key, fileobj)
+        except Exception:
+            record('put_stream', start, failed=True)
+            return 1
+        else:
+            record('put_stream', start)
+            return 0
+    return 1
+
+
+def get_stream(key, fileobj):
+    # writes object to binary file object
+    global streams
+    if streams:
+        start = time.perf_counter() if metrics is not None else None
+        try:
+            with streams.get_stream(key) as stream:
+                shutil.copyfileobj(stream, fileobj)
+        except Exception:
+            record('get_stream', start, failed=True)
+            return 1
+        else:
+            record('get_stream', start)
+            return 0
+    return 1
+
+
+def del_stream(key):
+    global streams
+    if streams:
+        try:
+            streams.del_stream(key)
+        except Exception:
+            return 1
+        else:
+            return 0
+    return 1
+
+
+def get_metrics(snapshot: dict):
+    # fills snapshot with counters and latency histograms, see Metrics.snapshot
+    global metrics
+    if metrics is not None:
+        snapshot.clear()
+        snapshot.update(metrics.snapshot())
+        return 0
+    return 1
+
+
+def record(name: str, start: float, failed=False):
+    # latency and errors of blob function calls when metrics are enabled
+    if metrics is not None:
+        metrics.observe('blob.' + name, time.perf_counter() - start)
+        if failed:
+            metrics.count('blob.errors')
+
+
+def close():
+    global volume
     global storage
     global storage_path
-    if storage is not None:
-        for path in os.listdir(storage_path):
-            os.remove(os.path.join(storage_path, path))
-        os.rmdir(storage_path)
-        del storage
+    global metrics
+    global streams
+    if volume is not None:
+        volume.close()
+        volume = None
+        storage = None
+        storage_path = None
+        metrics = None
+        streams = None
+        return 0
+    else:
+        return 1
+
+
+def delete():
+    global volume
+    global storage
+    global metrics
+    global streams
+    if volume is not None:
+        volume.delete()
+        volume = None
         storage = None
+        metrics = None
+        streams = None
         return 0
     else:
         return 1
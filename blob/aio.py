@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from blob.backends.key_value import DictKVStorage, LogKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.exceptions import BlobError
+
+
+class AsyncBlobStorage:
+    # asyncio front-end of DedupeProxy, file I/O and hashing run on bounded executor,
+    # concurrent reads of one storage address share single read
+    def __init__(self, storage: DedupeProxy, max_workers=4, max_pending_writes=64, executor=None):
+        if max_pending_writes <= 0 or not isinstance(max_pending_writes, int):
+            raise BlobError('incorrect max_pending_writes')
+
+        self.storage = storage
+        self.own_executor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers)
+        self.max_pending_writes = max_pending_writes  # blocks in flight before writers have to wait
+
+        self.reads = dict()  # storage address -> future of read in progress
+        self.pending_writes = 0
+        self.writes_done = None  # condition created in running loop
+
+    @classmethod
+    def open(cls, block_size: int, blob_size: int, path='./blob_storage', persistent=False, **kwargs):
+        kv_storage = LogKVStorage.factory(path) if persistent else DictKVStorage
+        storage = DedupeProxy(FileStorage(block_size, blob_size, path, kv_storage), kv_storage)
+        return cls(storage, **kwargs)
+
+    async def get_block(self, block_id: int):
+        # proxy lock is taken on executor only, event loop never waits for writers holding it
+        loop = asyncio.get_running_loop()
+        acquired = loop.run_in_executor(self.executor, self.storage.acquire_block, block_id)
+        try:
+            storage_address, block_data = await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            acquired.add_done_callback(self.release_acquired)
+            raise
+        if block_data is not None:
+            return block_data
+
+        try:
+            future = self.reads.get(storage_address)
+            if future is None:
+                future = loop.run_in_executor(self.executor, self.storage.storage.get_data, storage_address)
+                self.reads[storage_address] = future
+                future.add_done_callback(lambda done: self.reads.pop(storage_address, None)
+                                         if self.reads.get(storage_address) is done else None)
+            return await asyncio.shield(future)
+        finally:
+            await asyncio.shield(loop.run_in_executor(self.executor, self.storage.release_block, storage_address))
+
+    def release_acquired(self, acquired: asyncio.Future):
+        # releases block acquired for cancelled get_block
+        if not acquired.cancelled() and acquired.exception() is None:
+            storage_address, block_data = acquired.result()
+            if block_data is None:
+                self.executor.submit(self.storage.release_block, storage_address)
+
+    async def get_blocks(self, block_ids):
+        return await asyncio.gather(*(self.get_block(block_id) for block_id in block_ids))
+
+    async def put_block(self, block_id: int, block_data: bytes):
+        await self.put_blocks([(block_id, block_data)])
+
+    async def put_blocks(self, blocks):
+        blocks = list(blocks)
+        await self.acquire_writes(len(blocks))
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.storage.put_data_batch, blocks)
+        finally:
+            await self.release_writes(len(blocks))
+
+    async def acquire_writes(self, count: int):
+        if self.writes_done is None:
+            self.writes_done = asyncio.Condition()
+        async with self.writes_done:
+            # batch larger than limit is let through alone
+            await self.writes_done.wait_for(lambda: self.pending_writes == 0 or
+                                            self.pending_writes + count <= self.max_pending_writes)
+            self.pending_writes += count
+
+    async def release_writes(self, count: int):
+        async with self.writes_done:
+            self.pending_writes -= count
+            self.writes_done.notify_all()
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        if self.own_executor:
+            await loop.run_in_executor(None, self.executor.shutdown)
+        await loop.run_in_executor(None, self.storage.close)
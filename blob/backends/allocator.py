@@ -0,0 +1,80 @@
+import heapq
+
+
+class Allocator:
+    # hands out the lowest address not present in used container
+    # free addresses below top are kept as a heap of [start, end) ranges,
+    # ranges are trimmed lazily when their lowest address turns out to be used,
+    # used containers with next_missing(start, end) skip used addresses faster
+    def __init__(self, used):
+        self.used = used
+        self.next_missing = getattr(used, 'next_missing', None)
+        self.free = []
+        self.top = 0  # every address >= top is free
+
+    def get_free_address(self):
+        while self.free:
+            start, end = self.free[0]
+            start = self.skip_used(start, end)
+            if start < end:
+                heapq.heapreplace(self.free, (start, end))
+                return start
+            heapq.heappop(self.free)
+        return self.top
+
+    def get_free_addresses(self, count: int):
+        # lowest count free addresses, none of them is reserved until use
+        addresses = []
+        seen = set()
+        ranges = []
+        while self.free and len(addresses) < count:
+            start, end = heapq.heappop(self.free)
+            start = self.skip_used(start, end)
+            if start < end:
+                ranges.append((start, end))
+            address = start
+            while address < end and len(addresses) < count:
+                address = self.skip_used(address, end)
+                if address < end and address not in seen:
+                    addresses.append(address)
+                    seen.add(address)
+                address += 1
+        for free_range in ranges:
+            heapq.heappush(self.free, free_range)
+
+        address = self.top
+        while len(addresses) < count:
+            addresses.append(address)
+            address += 1
+        return addresses
+
+    def skip_used(self, start: int, end: int):
+        # lowest unused address in [start, end), end if there is none
+        if self.next_missing is not None:
+            return self.next_missing(start, end)
+        while start < end and start in self.used:
+            start += 1
+        return start
+
+    def use(self, address: int):
+        if address >= self.top:
+            if address > self.top:
+                heapq.heappush(self.free, (self.top, address))
+            self.top = address + 1
+
+    def release(self, address: int):
+        if address < self.top:
+            heapq.heappush(self.free, (address, address + 1))
+
+    def rebuild(self, addresses):
+        self.free = []
+        self.top = 0
+        for address in sorted(addresses):
+            if address > self.top:
+                self.free.append((self.top, address))  # sorted list is a valid heap
+            self.top = address + 1
+
+    def rebuild_lazy(self, top: int):
+        # every address below top may be used, free ones are found on demand
+        self.free = [(0, top)] if top else []
+        self.top = top
@@ -0,0 +1,62 @@
+import hashlib
+import math
+
+from blob.exceptions import BackendError
+
+
+class BloomFilter:
+    # counting bloom filter over block hashes, one byte counter per cell to support removal,
+    # saturated counters are never decremented
+    max_counter = 255
+
+    def __init__(self, expected_items: int, fp_rate=0.01):
+        if expected_items <= 0 or not isinstance(expected_items, int):
+            raise BackendError('incorrect expected_items')
+
+        if not 0 < fp_rate < 1:
+            raise BackendError('incorrect fp_rate')
+
+        self.size = max(8, int(math.ceil(-expected_items * math.log(fp_rate) / math.log(2) ** 2)))
+        self.num_of_hashes = max(1, int(round(self.size / expected_items * math.log(2))))
+        self.counters = bytearray(self.size)
+        self.count = 0
+
+    def get_positions(self, key):
+        if isinstance(key, str):
+            key = key.encode()
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.num_of_hashes)]
+
+    def add(self, key):
+        for position in self.get_positions(key):
+            if self.counters[position] < self.max_counter:
+                self.counters[position] += 1
+        self.count += 1
+
+    def remove(self, key):
+        for position in self.get_positions(key):
+            if 0 < self.counters[position] < self.max_counter:
+                self.counters[position] -= 1
+        self.count -= 1
+
+    def __contains__(self, key):
+        counters = self.counters
+        for position in self.get_positions(key):
+            if not counters[position]:
+                return False
+        return True
+
+    def clear(self):
+        self.counters = bytearray(self.size)
+        self.count = 0
+
+    def rebuild(self, keys):
+        self.clear()
+        for key in keys:
+            self.add(key)
+
+    def get_false_positive_rate(self):
+        # expected rate for current number of items
+        return (1 - math.exp(-self.num_of_hashes * self.count / self.size)) ** self.num_of_hashes
@@ -0,0 +1,194 @@
+import threading
+from collections import OrderedDict
+
+from blob.backends.storage import Storage, copy_into
+from blob.exceptions import StorageBackendError
+
+
+class BlockCache:
+    # LRU blocks limited by total size of cached data, one cache can be shared by several CachedStorages
+    # as common budget, each of them keys its blocks by (owner, address) then
+    def __init__(self, max_bytes: int):
+        if not isinstance(max_bytes, int) or max_bytes < 0:
+            raise StorageBackendError('incorrect max_bytes')
+
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def insert(self, key, block_data: bytes):
+        if len(block_data) > self.max_bytes:
+            return
+        self.invalidate(key)
+        self.blocks[key] = block_data
+        self.size += len(block_data)
+        while self.size > self.max_bytes:
+            evicted_key, evicted_data = self.blocks.popitem(last=False)
+            self.size -= len(evicted_data)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        block_data = self.blocks.pop(key, None)
+        if block_data is not None:
+            self.size -= len(block_data)
+
+    def clear(self, owner=None):
+        # removes all blocks or blocks of one owner
+        with self.lock:
+            if owner is None:
+                self.blocks.clear()
+                self.size = 0
+            else:
+                for key in [key for key in self.blocks if key[0] is owner]:
+                    self.invalidate(key)
+
+
+class CachedStorage(Storage):
+    # LRU cache of blocks keyed by storage address limited by total size of cached data,
+    # placed in front of DedupeProxy's storage one cached block serves every deduplicated address;
+    # cache shared with other storages replaces own cache of max_bytes
+    def __init__(self, storage: Storage, max_bytes: int = None, cache: BlockCache = None):
+        self.storage = storage
+        self.owner = None if cache is None else object()
+        self.cache = BlockCache(max_bytes) if cache is None else cache
+        self.blocks = self.cache.blocks
+
+        # storage I/O runs outside of lock, block read from storage is cached only
+        # if its address was not written or deleted while it was being read
+        self.lock = self.cache.lock
+        self.loading = dict()  # key -> token of read in progress
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_bytes(self):
+        return self.cache.max_bytes
+
+    @property
+    def size(self):
+        return self.cache.size
+
+    @property
+    def evictions(self):
+        return self.cache.evictions
+
+    def get_key(self, address):
+        return address if self.owner is None else (self.owner, address)
+
+    def get_data(self, address: int):
+        return self.get_data_batch([address])[0]
+
+    def get_data_into(self, address: int, buffer):
+        key = self.get_key(address)
+        token = object()
+        with self.lock:
+            if key in self.blocks:
+                self.hits += 1
+                self.blocks.move_to_end(key)
+                block_data = self.blocks[key]
+            else:
+                self.misses += 1
+                block_data = None
+                self.loading[key] = token
+        if block_data is not None:
+            return copy_into(block_data, buffer)
+
+        data_len = None
+        try:
+            data_len = self.storage.get_data_into(address, buffer)
+        finally:
+            with self.lock:
+                if self.loading.get(key) is token:
+                    del self.loading[key]
+                    if data_len is not None and data_len <= self.max_bytes:
+                        with memoryview(buffer) as view:
+                            self.cache.insert(key, bytes(view[:data_len]))  # cache keeps its own copy
+        return data_len
+
+    def get_data_batch(self, addresses):
+        addresses = list(addresses)
+        result = dict()
+        missing = []
+        token = object()
+        with self.lock:
+            for address in addresses:
+                key = self.get_key(address)
+                if key in self.blocks:
+                    self.hits += 1
+                    self.blocks.move_to_end(key)
+                    result[address] = self.blocks[key]
+                elif address not in result:
+                    self.misses += 1
+                    missing.append(address)
+                    result[address] = None
+                    self.loading[key] = token
+
+        if missing:
+            data = None
+            try:
+                data = self.storage.get_data_batch(missing)
+                result.update(zip(missing, data))
+            finally:
+                with self.lock:
+                    for index, address in enumerate(missing):
+                        key = self.get_key(address)
+                        if self.loading.get(key) is token:
+                            del self.loading[key]
+                            if data is not None:
+                                self.cache.insert(key, data[index])
+        return [result[address] for address in addresses]
+
+    def put_data(self, address: int, block_data: bytes):
+        self.put_data_batch([(address, block_data)])
+
+    def put_data_batch(self, items):
+        items = list(items)
+        self.invalidate_all(address for address, block_data in items)
+        try:
+            self.storage.put_data_batch(items)
+        finally:
+            self.invalidate_all(address for address, block_data in items)
+
+    def del_data(self, address: int):
+        self.invalidate_all([address])
+        self.storage.del_data(address)
+
+    def get_free_address(self):
+        return self.storage.get_free_address()
+
+    def get_free_addresses(self, count: int):
+        return self.storage.get_free_addresses(count)
+
+    def insert(self, address: int, block_data: bytes):
+        # block read in progress for address is not cached over inserted one
+        key = self.get_key(address)
+        with self.lock:
+            self.cache.insert(key, block_data)
+            self.loading.pop(key, None)
+
+    def invalidate(self, address: int):
+        self.invalidate_all([address])
+
+    def invalidate_all(self, addresses):
+        with self.lock:
+            for address in addresses:
+                key = self.get_key(address)
+                self.cache.invalidate(key)
+                self.loading.pop(key, None)
+
+    def clear(self):
+        self.cache.clear(self.owner)
+
+    def get_hit_rate(self):
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def sync(self):
+        self.storage.sync()
+
+    def close(self):
+        self.clear()
+        self.storage.close()
@@ -0,0 +1,316 @@
+from array import array
+
+from blob.backends.key_value import KVStorage, DictKVStorage
+
+# array typecodes tried in order when value does not fit, largest value of each type marks missing key
+typecodes = ['B', 'H', 'I', 'Q']
+
+
+class KeysView:
+    # sized iterable of keys, like keys of dict
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __iter__(self):
+        return self.storage.iter_keys()
+
+    def __len__(self):
+        return self.storage.count + len(self.storage.overflow)
+
+    def __contains__(self, key):
+        return key in self.storage
+
+
+class ArrayKVStorage(KVStorage):
+    # dense array of non-negative ints indexed by non-negative int keys, item type grows with largest value,
+    # other keys and values (and keys far beyond end of array) are kept in overflow dict
+    def __init__(self, name=None, typecode='B'):
+        self.data = array(typecode)
+        self.missing = 2 ** (8 * self.data.itemsize) - 1
+        self.count = 0  # keys stored in data
+        self.overflow = dict()
+
+    def fits_key(self, key):
+        return type(key) is int and 0 <= key < len(self.data) + max(1024, len(self.data))
+
+    def widen(self, value: int):
+        # converts data to smallest item type holding value
+        typecode = self.data.typecode
+        while value >= self.missing:
+            typecode = typecodes[typecodes.index(typecode) + 1]
+            self.missing = 2 ** (8 * array(typecode).itemsize) - 1
+        old_missing = 2 ** (8 * self.data.itemsize) - 1
+        self.data = array(typecode, (self.missing if item == old_missing else item for item in self.data))
+
+    def __getitem__(self, key):
+        if type(key) is int and 0 <= key < len(self.data):
+            value = self.data[key]
+            if value != self.missing:
+                return value
+        return self.overflow[key]
+
+    def __setitem__(self, key, value):
+        data = self.data
+        if type(key) is int and type(value) is int and 0 <= key < len(data) and 0 <= value < self.missing:
+            if data[key] == self.missing:
+                self.count += 1
+                if self.overflow:
+                    self.overflow.pop(key, None)
+            data[key] = value
+            return
+
+        if not self.fits_key(key) or type(value) is not int or not 0 <= value < 2 ** 63:
+            self.overflow[key] = value
+            self.remove_from_data(key)
+            return
+
+        if value >= self.missing:
+            self.widen(value)
+        if key >= len(self.data):
+            # growing by eighth of size keeps appends amortized
+            grow = max(key - len(self.data) + 1, len(self.data) // 8, 64)
+            self.data.extend(array(self.data.typecode, [self.missing]) * grow)
+        if self.data[key] == self.missing:
+            self.count += 1
+            if self.overflow:
+                self.overflow.pop(key, None)
+        self.data[key] = value
+
+    def remove_from_data(self, key):
+        if type(key) is int and 0 <= key < len(self.data) and self.data[key] != self.missing:
+            self.data[key] = self.missing
+            self.count -= 1
+            return True
+        return False
+
+    def __delitem__(self, key):
+        if not self.remove_from_data(key):
+            del self.overflow[key]
+
+    def __contains__(self, key):
+        if type(key) is int and 0 <= key < len(self.data) and self.data[key] != self.missing:
+            return True
+        return key in self.overflow
+
+    def iter_keys(self):
+        missing = self.missing
+        for key, value in enumerate(self.data):
+            if value != missing:
+                yield key
+        yield from list(self.overflow)
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def count_links(self, value):
+        return sum(1 for key in self.keys() if self[key] == value)
+
+
+class DigestArrayKVStorage(KVStorage):
+    # dense table of fixed size digests indexed by non-negative int keys (storage address -> block hash),
+    # digest size is set by first stored digest, other keys and values are kept in overflow dict;
+    # digests stay in data after deletion as HashIndexKVStorage compares keys against them
+    def __init__(self, name=None):
+        self.digest_size = None
+        self.data = bytearray()
+        self.present = bytearray()
+        self.count = 0
+        self.overflow = dict()
+
+    def store(self, key, digest):
+        # writes digest to data without marking key present, returns False if it does not fit
+        if type(key) is not int or type(digest) is not bytes or key < 0:
+            return False
+        if self.digest_size is None:
+            self.digest_size = len(digest)
+        if len(digest) != self.digest_size or key >= len(self.present) + max(1024, len(self.present)):
+            return False
+
+        if key >= len(self.present):
+            grow = max(key - len(self.present) + 1, len(self.present) // 8, 64)
+            self.present.extend(bytes(grow))
+            self.data.extend(bytes(grow * self.digest_size))
+        self.data[key * self.digest_size:(key + 1) * self.digest_size] = digest
+        return True
+
+    def get_stored(self, key: int):
+        return bytes(self.data[key * self.digest_size:(key + 1) * self.digest_size])
+
+    def __getitem__(self, key):
+        if type(key) is int and 0 <= key < len(self.present) and self.present[key]:
+            return self.get_stored(key)
+        return self.overflow[key]
+
+    def __setitem__(self, key, value):
+        if not self.store(key, value):
+            self.overflow[key] = value
+            self.remove_from_data(key)
+            return
+        if not self.present[key]:
+            self.present[key] = 1
+            self.count += 1
+            if self.overflow:
+                self.overflow.pop(key, None)
+
+    def remove_from_data(self, key):
+        if type(key) is int and 0 <= key < len(self.present) and self.present[key]:
+            self.present[key] = 0
+            self.count -= 1
+            return True
+        return False
+
+    def __delitem__(self, key):
+        if not self.remove_from_data(key):
+            del self.overflow[key]
+
+    def __contains__(self, key):
+        if type(key) is int and 0 <= key < len(self.present) and self.present[key]:
+            return True
+        return key in self.overflow
+
+    def iter_keys(self):
+        for key, present in enumerate(self.present):
+            if present:
+                yield key
+        yield from list(self.overflow)
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def count_links(self, value):
+        return sum(1 for key in self.keys() if self[key] == value)
+
+
+class HashIndexKVStorage(KVStorage):
+    # block hash -> [storage address] as open addressing table of storage addresses with linear probing,
+    # keys are not stored in table but compared against digests of DigestArrayKVStorage,
+    # hashes with several storage addresses and hashes not fitting digests are kept in overflow dict
+    def __init__(self, digests: DigestArrayKVStorage, name=None):
+        self.digests = digests
+        self.table = array('I', [2 ** 32 - 1]) * 8
+        self.empty = 2 ** 32 - 1
+        self.count = 0
+        self.overflow = dict()
+
+    def get_slot(self, key: bytes):
+        # returns (slot, found) of key
+        table, empty = self.table, self.empty
+        data, size = self.digests.data, self.digests.digest_size
+        mask = len(table) - 1
+        slot = int.from_bytes(key[:8], 'little') & mask
+        while True:
+            address = table[slot]
+            if address == empty:
+                return slot, False
+            if data[address * size:(address + 1) * size] == key:
+                return slot, True
+            slot = (slot + 1) & mask
+
+    def fits(self, key):
+        return type(key) is bytes and len(key) == self.digests.digest_size
+
+    def __getitem__(self, key):
+        if self.fits(key):
+            slot, found = self.get_slot(key)
+            if found:
+                return [self.table[slot]]
+        return self.overflow[key]
+
+    def __setitem__(self, key, value):
+        if len(value) == 1 and type(value[0]) is int and value[0] < self.empty and self.digests.store(value[0], key):
+            if self.overflow:
+                self.overflow.pop(key, None)
+            slot, found = self.get_slot(key)
+            self.table[slot] = value[0]
+            if not found:
+                self.count += 1
+                if self.count * 4 > len(self.table) * 3:
+                    self.resize(len(self.table) * 2)
+        else:
+            self.remove_from_table(key)
+            self.overflow[key] = list(value)
+
+    def resize(self, size: int):
+        old_table = self.table
+        table = self.table = array('I', [self.empty]) * size
+        empty, data, digest_size = self.empty, self.digests.data, self.digests.digest_size
+        mask = size - 1
+        for address in old_table:
+            if address != empty:
+                start = address * digest_size
+                slot = int.from_bytes(data[start:start + min(8, digest_size)], 'little') & mask
+                while table[slot] != empty:
+                    slot = (slot + 1) & mask
+                table[slot] = address
+
+    def remove_from_table(self, key):
+        if not self.fits(key):
+            return False
+        slot, found = self.get_slot(key)
+        if not found:
+            return False
+
+        # backward shift deletion keeps probe sequences without tombstones
+        mask = len(self.table) - 1
+        self.table[slot] = self.empty
+        self.count -= 1
+        hole = slot
+        slot = (slot + 1) & mask
+        while self.table[slot] != self.empty:
+            address = self.table[slot]
+            home = int.from_bytes(self.digests.get_stored(address)[:8], 'little') & mask
+            if (slot - home) & mask >= (slot - hole) & mask:
+                self.table[hole] = address
+                self.table[slot] = self.empty
+                hole = slot
+            slot = (slot + 1) & mask
+        return True
+
+    def __delitem__(self, key):
+        if not self.remove_from_table(key):
+            del self.overflow[key]
+
+    def __contains__(self, key):
+        if self.fits(key) and self.get_slot(key)[1]:
+            return True
+        return key in self.overflow
+
+    def iter_keys(self):
+        for address in list(self.table):
+            if address != self.empty:
+                yield self.digests.get_stored(address)
+        yield from list(self.overflow)
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def count_links(self, value):
+        return sum(1 for key in self.keys() if self[key] == value)
+
+
+class CompactKVStorage:
+    # kv_storage factory for in-memory volumes with millions of blocks, to be passed where DictKVStorage is:
+    # int maps of storage and proxy are arrays, by_hash and by_storage_address share one digest table,
+    # compact only with hashers returning raw digests (blake2b, blake2s), other maps are dicts
+    array_maps = {'by_address', 'links', 'blocks_metadata'}
+
+    def __init__(self):
+        self.digests = None
+
+    def __call__(self, name=None):
+        if name in self.array_maps:
+            return ArrayKVStorage(name)
+        if name in ('by_hash', 'by_storage_address'):
+            if self.digests is None:
+                self.digests = DigestArrayKVStorage(name)
+            return HashIndexKVStorage(self.digests, name) if name == 'by_hash' else self.digests
+        return DictKVStorage(name)
@@ -0,0 +1,151 @@
+import time
+
+from blob.backends.cache import CachedStorage
+from blob.backends.packed import PackedStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.exceptions import BackendError
+
+
+class Compactor:
+    # moves live blocks out of sparsely used blob files into free slots of other blobs
+    # and removes blob files left empty, runs incrementally in steps limited by rate
+    def __init__(self, proxy: DedupeProxy, storage: FileStorage = None, threshold=0.5, rate: float = None,
+                 batch_size=1024):
+        if not 0 < threshold <= 1:
+            raise BackendError('incorrect threshold')
+
+        # file storage below proxy, blocks are moved between its slots
+        storage = storage if storage is not None else proxy.storage
+        while isinstance(storage, CachedStorage):
+            storage = storage.storage
+        if isinstance(storage, PackedStorage):
+            raise BackendError('packed storage is compacted by its repack')
+        if not isinstance(storage, FileStorage):
+            raise BackendError('compaction needs slot-addressed FileStorage')
+
+        self.proxy = proxy
+        self.storage = storage
+        self.threshold = threshold  # blobs with smaller share of live blocks are compacted
+        self.rate = rate  # max blocks moved per second
+        self.batch_size = batch_size  # addresses looked up per acquisition of proxy lock while planning
+
+        self.sources = set()  # blobs being evacuated
+        self.queue = []  # storage addresses to move
+        self.targets = []  # free storage addresses outside of source blobs
+        self.target_blobs = []  # blobs whose free slots are not listed in targets yet
+        self.addresses = dict()  # storage address -> addresses pointing to it
+
+        self.moved = 0
+        self.skipped = 0
+        self.removed_blobs = 0
+
+    def plan(self):
+        # plans from per-blob counts of live blocks, addresses of queued blocks are collected in batches
+        # with proxy lock released in between, so foreground reads and writes go on during planning;
+        # blocks changed meanwhile are skipped by relocate, which checks links of each block
+        blob_size = self.storage.blob_size
+        usage = self.storage.get_live_blocks()
+
+        # evacuating least used blobs while their live blocks fit into free slots of remaining blobs,
+        # higher blobs first on ties as allocator fills lower addresses first
+        candidates = sorted((live, -blob) for blob, live in usage.items() if live < blob_size * self.threshold)
+        free_slots = sum(blob_size - live for live in usage.values())
+        sources = set()
+        live_blocks = 0
+        for live, blob in candidates:
+            blob = -blob
+            remaining_free = free_slots - (blob_size - live)
+            if live_blocks + live > remaining_free:
+                break
+            sources.add(blob)
+            live_blocks += live
+            free_slots = remaining_free
+
+        self.sources = sources
+        self.queue = []
+        for blob in sorted(sources):
+            first = blob * blob_size
+            with self.storage.lock:
+                self.queue.extend(address for address in range(first, first + blob_size)
+                                  if address in self.storage.blocks_metadata)
+        self.queue.reverse()
+
+        # free slots of remaining blobs are listed blob by blob as they are needed, see get_target
+        self.target_blobs = sorted((blob for blob, live in usage.items() if blob not in sources and live < blob_size),
+                                   reverse=True)
+        self.targets = []
+
+        self.addresses = dict()
+        if not self.queue:
+            return 0
+        queued = set(self.queue)
+        with self.proxy.lock:
+            addresses = list(self.proxy.by_address.keys())
+        for i in range(0, len(addresses), self.batch_size):
+            with self.proxy.lock:
+                for address in addresses[i:i + self.batch_size]:
+                    if address in self.proxy.by_address:
+                        storage_address = self.proxy.by_address[address]
+                        if storage_address in queued:
+                            self.addresses.setdefault(storage_address, []).append(address)
+        return len(self.queue)
+
+    def get_target(self):
+        while True:
+            while self.targets:
+                address = self.targets.pop()
+                if address not in self.storage.blocks_metadata:
+                    return address
+            if not self.target_blobs:
+                return None
+            first = self.target_blobs.pop() * self.storage.blob_size
+            self.targets = list(reversed(range(first, first + self.storage.blob_size)))
+
+    def step(self, max_blocks=64):
+        moved = 0
+        with self.proxy.lock:
+            while self.queue and moved < max_blocks:
+                storage_address = self.queue.pop()
+                if storage_address not in self.storage.blocks_metadata:
+                    continue  # freed by foreground writes
+
+                target = self.get_target()
+                if target is None:
+                    self.queue.clear()
+                    break
+
+                if self.proxy.relocate(storage_address, target, self.addresses.pop(storage_address, [])):
+                    moved += 1
+                else:
+                    self.targets.append(target)
+                    self.skipped += 1
+
+            self.moved += moved
+            if not self.queue:
+                self.remove_empty_blobs()
+        return moved
+
+    def remove_empty_blobs(self):
+        for blob in sorted(self.sources):
+            first = blob * self.storage.blob_size
+            if not any(address in self.storage.blocks_metadata
+                       for address in range(first, first + self.storage.blob_size)):
+                self.storage.remove_blob(blob)
+                self.removed_blobs += 1
+        self.sources = set()
+
+    def run(self, max_blocks=64):
+        self.plan()
+        start = time.monotonic()
+        moved = 0
+        while self.queue:
+            moved += self.step(max_blocks)
+            if self.rate:
+                delay = moved / self.rate - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+        if self.sources:
+            with self.proxy.lock:
+                self.remove_empty_blobs()
+        return moved
@@ -1,3 +1,7 @@
+import functools
+import os
+import pickle
+import struct
 
 
 class KVStorage:
@@ -22,9 +26,15 @@ class KVStorage:
     def count_links(self, value):
         pass
 
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
 
 class DictKVStorage(KVStorage):
-    def __init__(self):
+    def __init__(self, name=None):
         self.data = dict()
 
     def __getitem__(self, key):
@@ -51,3 +61,105 @@ class DictKVStorage(KVStorage):
     def count_links(self, value):
         return list(self.data.values()).count(value)
 
+
+class LogKVStorage(DictKVStorage):
+    # in-memory dict persisted as checkpoint file plus append-only log of changes since checkpoint,
+    # log is compacted into new checkpoint once it grows beyond checkpoint_interval or quarter of the data
+    record_header = struct.Struct('<I')
+    checkpoint_suffix = '.kv'
+
+    def __init__(self, path: str, name: str, checkpoint_interval=100000, fsync=False):
+        super().__init__(name)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.checkpoint_interval = checkpoint_interval
+        self.fsync = fsync
+        self.checkpoint_file_name = os.path.join(path, name + self.checkpoint_suffix)
+        self.log_file_name = os.path.join(path, name + '.log')
+        self.log_records = 0
+
+        self.load()
+        self.log = open(self.log_file_name, 'ab')
+
+    @classmethod
+    def factory(cls, path: str, **kwargs):
+        # to be passed as kv_storage class parameter of storages and proxies
+        return functools.partial(cls, path, **kwargs)
+
+    def load(self):
+        self.load_checkpoint()
+        if os.path.exists(self.log_file_name):
+            with open(self.log_file_name, 'rb') as file:
+                log = file.read()
+            offset = 0
+            header_size = self.record_header.size
+            while offset + header_size <= len(log):
+                record_size, = self.record_header.unpack_from(log, offset)
+                if offset + header_size + record_size > len(log):
+                    break
+                self.apply(pickle.loads(log[offset + header_size:offset + header_size + record_size]))
+                offset += header_size + record_size
+                self.log_records += 1
+
+            if offset < len(log):
+                # dropping torn record left by interrupted write
+                with open(self.log_file_name, 'r+b') as file:
+                    file.truncate(offset)
+
+    def load_checkpoint(self):
+        if os.path.exists(self.checkpoint_file_name):
+            with open(self.checkpoint_file_name, 'rb') as file:
+                self.data = pickle.load(file)
+
+    def apply(self, record: tuple):
+        # replays log record, (key, value) sets key and (key,) deletes it
+        if len(record) == 2:
+            self.data[record[0]] = record[1]
+        else:
+            self.data.pop(record[0], None)
+
+    def write_record(self, record: tuple):
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        self.log.write(self.record_header.pack(len(payload)) + payload)
+        self.log.flush()
+        if self.fsync:
+            os.fsync(self.log.fileno())
+
+        self.log_records += 1
+        if self.log_records >= max(self.checkpoint_interval, len(self.keys()) // 4):
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.write_checkpoint()
+
+        # replaying stale log over new checkpoint is harmless, so crash before truncation is safe
+        self.log.close()
+        self.log = open(self.log_file_name, 'wb')
+        self.log_records = 0
+
+    def write_checkpoint(self):
+        tmp_file_name = self.checkpoint_file_name + '_new'
+        with open(tmp_file_name, 'wb') as file:
+            pickle.dump(self.data, file, pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file_name, self.checkpoint_file_name)
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.write_record((key, value))
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.write_record((key,))
+
+    def sync(self):
+        self.log.flush()
+        os.fsync(self.log.fileno())
+
+    def close(self):
+        if not self.log.closed:
+            if self.log_records > 0:
+                self.checkpoint()
+            self.log.close()
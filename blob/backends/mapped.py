@@ -0,0 +1,354 @@
+import bisect
+import mmap
+import os
+import pickle
+import struct
+
+from blob.backends.key_value import LogKVStorage
+from blob.exceptions import StorageBackendError
+
+# magic, version, key kind, value kind, multi, reserved, key size, value size, records, keys, extra size
+index_header = struct.Struct('<4sBBBBHIIQQQ')
+index_magic = b'BIDX'
+index_version = 1
+
+# fixed width encodings of keys and values, ints are biased so byte order matches numeric order
+kinds = ['int', 'bytes', 'str']
+int_bias = 2 ** 63
+
+
+def get_kind(item):
+    # (kind, size) of fixed width encoding of item, None if it has none
+    if type(item) is int and -int_bias <= item < int_bias:
+        return 'int', 8
+    if type(item) is bytes:
+        return 'bytes', len(item)
+    if type(item) is str:
+        return 'str', len(item.encode())
+    return None
+
+
+def encode(item, kind: str):
+    if kind == 'int':
+        return (item + int_bias).to_bytes(8, 'big')
+    if kind == 'str':
+        return item.encode()
+    return item
+
+
+def decode(data: bytes, kind: str):
+    if kind == 'int':
+        return int.from_bytes(data, 'big') - int_bias
+    if kind == 'str':
+        return data.decode()
+    return bytes(data)
+
+
+def get_schema(key, value):
+    # (key kind, key size, value kind, value size, multi) of item, lists are stored as one record per element
+    key_kind = get_kind(key)
+    multi = type(value) is list
+    values = value if multi else [value]
+    if key_kind is None or key_kind[1] == 0 or not values:
+        return None
+    value_kinds = set(map(get_kind, values))
+    if len(value_kinds) != 1 or None in value_kinds:
+        return None
+    return key_kind + value_kinds.pop() + (multi,)
+
+
+def write_index(file_name: str, items):
+    # writes items as fixed width records sorted by key, schema is taken from first item having one,
+    # items not matching it are pickled after records
+    schema = None
+    records = []
+    extra = dict()
+    num_keys = 0
+    for key, value in items:
+        item_schema = get_schema(key, value)
+        if schema is None:
+            schema = item_schema
+        if item_schema is None or item_schema != schema:
+            extra[key] = value
+            continue
+        encoded_key = encode(key, schema[0])
+        for element in (value if schema[4] else [value]):
+            records.append(encoded_key + encode(element, schema[2]))
+        num_keys += 1
+
+    key_kind, key_size, value_kind, value_size, multi = schema if schema is not None else ('int', 0, 'int', 0, False)
+    records.sort(key=lambda record: record[:key_size])  # stable, elements of lists keep their order
+    extra_data = pickle.dumps(extra, pickle.HIGHEST_PROTOCOL)
+
+    tmp_file_name = file_name + '_new'
+    with open(tmp_file_name, 'wb') as file:
+        file.write(index_header.pack(index_magic, index_version, kinds.index(key_kind), kinds.index(value_kind),
+                                     multi, 0, key_size, value_size, len(records), num_keys, len(extra_data)))
+        file.write(b''.join(records))
+        file.write(extra_data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file_name, file_name)
+
+
+class RecordKeys:
+    # keys of records of mapped index as sequence for bisect
+    def __init__(self, index: mmap.mmap, offset: int, record_size: int, key_size: int, num_records: int):
+        self.index = index
+        self.offset = offset
+        self.record_size = record_size
+        self.key_size = key_size
+        self.num_records = num_records
+
+    def __len__(self):
+        return self.num_records
+
+    def __getitem__(self, i: int):
+        start = self.offset + i * self.record_size
+        return self.index[start:start + self.key_size]
+
+
+class IndexKeysView:
+    # sized iterable of keys, like keys of dict
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __iter__(self):
+        return (key for key, value in self.storage.items())
+
+    def __len__(self):
+        return self.storage.count
+
+    def __contains__(self, key):
+        return key in self.storage
+
+
+class MappedKVStorage(LogKVStorage):
+    # LogKVStorage with binary checkpoint of fixed width records sorted by key which is memory-mapped on open
+    # and searched by bisection, so open time depends on log length only; data holds keys changed since checkpoint
+    # and deleted holds checkpoint keys deleted since then, checkpoint merges both into new index file;
+    # pickle checkpoint of LogKVStorage with same name is converted on first checkpoint
+    checkpoint_suffix = '.idx'
+
+    def load_checkpoint(self):
+        self.deleted = set()
+        self.index = None
+        self.schema = None
+        self.extra = dict()
+        self.num_records = 0
+        self.record_keys = None
+        self.count = 0  # number of keys
+
+        if os.path.exists(self.checkpoint_file_name):
+            self.open_index()
+        else:
+            old_file_name = self.get_old_file_name()
+            if os.path.exists(old_file_name):
+                with open(old_file_name, 'rb') as file:
+                    self.data = pickle.load(file)
+                self.count = len(self.data)
+                self.log_records += 1  # converting on close at the latest
+
+    def get_old_file_name(self):
+        return self.checkpoint_file_name[:-len(self.checkpoint_suffix)] + LogKVStorage.checkpoint_suffix
+
+    def open_index(self):
+        with open(self.checkpoint_file_name, 'rb') as file:
+            self.index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, key_kind, value_kind, multi, reserved, key_size, value_size, num_records, num_keys,
+         extra_size) = index_header.unpack_from(self.index)
+        if magic != index_magic or version != index_version:
+            self.close_index()
+            raise StorageBackendError('unknown index format')
+
+        self.schema = kinds[key_kind], key_size, kinds[value_kind], value_size, bool(multi)
+        self.num_records = num_records
+        self.record_keys = RecordKeys(self.index, index_header.size, key_size + value_size, key_size, num_records)
+        extra_offset = index_header.size + num_records * (key_size + value_size)
+        self.extra = pickle.loads(self.index[extra_offset:extra_offset + extra_size])
+        self.count = num_keys + len(self.extra)
+
+    def close_index(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+            self.record_keys = None
+
+    def get_record_value(self, i: int):
+        key_kind, key_size, value_kind, value_size, multi = self.schema
+        start = index_header.size + i * (key_size + value_size) + key_size
+        return decode(self.index[start:start + value_size], value_kind)
+
+    def find_record(self, key):
+        # position of first record of key, None if there is none
+        if self.num_records == 0 or get_kind(key) != self.schema[:2]:
+            return None
+        encoded_key = encode(key, self.schema[0])
+        i = bisect.bisect_left(self.record_keys, encoded_key)
+        if i < self.num_records and self.record_keys[i] == encoded_key:
+            return i
+        return None
+
+    def get_index(self, key):
+        # value of key in checkpoint, changes since checkpoint are not applied
+        if key in self.extra:
+            return self.extra[key]
+        i = self.find_record(key)
+        if i is None:
+            raise KeyError(key)
+        if not self.schema[4]:
+            return self.get_record_value(i)
+
+        encoded_key = self.record_keys[i]
+        values = []
+        while i < self.num_records and self.record_keys[i] == encoded_key:
+            values.append(self.get_record_value(i))
+            i += 1
+        return values
+
+    def in_index(self, key):
+        return key in self.extra or self.find_record(key) is not None
+
+    def iter_index(self):
+        # (key, value) items of checkpoint in key order, extra items first
+        yield from list(self.extra.items())
+        if self.num_records == 0:
+            return
+        key_kind, key_size, value_kind, value_size, multi = self.schema
+        record_size = key_size + value_size
+        index = self.index
+        offset = index_header.size
+        last_key = None
+        values = None
+        for start in range(offset, offset + self.num_records * record_size, record_size):
+            encoded_key = index[start:start + key_size]
+            value = decode(index[start + key_size:start + record_size], value_kind)
+            if not multi:
+                yield decode(encoded_key, key_kind), value
+            elif encoded_key == last_key:
+                values.append(value)
+            else:
+                if last_key is not None:
+                    yield decode(last_key, key_kind), values
+                last_key = encoded_key
+                values = [value]
+        if last_key is not None:
+            yield decode(last_key, key_kind), values
+
+    def __getitem__(self, key):
+        try:
+            return self.data[key]
+        except KeyError:
+            pass
+        if key in self.deleted:
+            raise KeyError(key)
+        return self.get_index(key)
+
+    def __contains__(self, key):
+        return key in self.data or (key not in self.deleted and self.in_index(key))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def set_local(self, key, value):
+        if key not in self.data:
+            if key in self.deleted:
+                self.deleted.discard(key)
+                self.count += 1
+            elif not self.in_index(key):
+                self.count += 1
+        self.data[key] = value
+
+    def del_local(self, key):
+        if key in self.data:
+            del self.data[key]
+            if self.in_index(key):
+                self.deleted.add(key)
+            self.count -= 1
+        elif key not in self.deleted and self.in_index(key):
+            self.deleted.add(key)
+            self.count -= 1
+        else:
+            raise KeyError(key)
+
+    def apply(self, record: tuple):
+        if len(record) == 2:
+            self.set_local(*record)
+        elif record[0] in self:
+            self.del_local(record[0])
+
+    def __setitem__(self, key, value):
+        self.set_local(key, value)
+        self.write_record((key, value))
+
+    def __delitem__(self, key):
+        self.del_local(key)
+        self.write_record((key,))
+
+    def items(self):
+        data = self.data
+        deleted = self.deleted
+        for key, value in self.iter_index():
+            if key not in data and key not in deleted:
+                yield key, value
+        yield from list(data.items())
+
+    def keys(self):
+        return IndexKeysView(self)
+
+    def values(self):
+        return [value for key, value in self.items()]
+
+    def count_links(self, value):
+        return sum(1 for key, item in self.items() if item == value)
+
+    def get_top(self):
+        # 1 + largest int key, 0 if there are none
+        top = max((key + 1 for key in self.data if type(key) is int), default=0)
+        top = max(top, max((key + 1 for key in self.extra if type(key) is int), default=0))
+        if self.num_records and self.schema[0] == 'int':
+            top = max(top, decode(self.record_keys[self.num_records - 1], 'int') + 1)
+        return top
+
+    def next_missing(self, start: int, end: int):
+        # lowest key in [start, end) not in storage, end if there is none,
+        # runs of consecutive int keys in checkpoint are skipped by bisection
+        while start < end:
+            if start in self.data or (start in self.extra and start not in self.deleted):
+                start += 1
+                continue
+            i = None if start in self.deleted else self.find_record(start)
+            if i is None:
+                return start
+            if self.schema[4]:
+                start += 1
+                continue
+
+            # last record of run of consecutive keys starting with record i
+            low, high = i, self.num_records - 1
+            while low < high:
+                middle = (low + high + 1) // 2
+                if decode(self.record_keys[middle], 'int') - start == middle - i:
+                    low = middle
+                else:
+                    high = middle - 1
+            run_end = start + low - i
+            deleted = [key for key in self.deleted if type(key) is int and start < key <= run_end]
+            if deleted:
+                return min(min(deleted), end)
+            start = run_end + 1
+        return end
+
+    def write_checkpoint(self):
+        write_index(self.checkpoint_file_name, self.items())
+        self.close_index()
+        self.data = dict()
+        self.deleted = set()
+        self.open_index()
+        old_file_name = self.get_old_file_name()
+        if os.path.exists(old_file_name):
+            os.remove(old_file_name)
+
+    def close(self):
+        super().close()
+        self.close_index()
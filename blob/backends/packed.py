@@ -0,0 +1,312 @@
+import os
+import time
+
+from blob.backends.key_value import KVStorage
+from blob.backends.pool import FilePool
+from blob.backends.storage import FileStorage, copy_into, group_reads
+from blob.compressors import get_compressor
+from blob.exceptions import StorageBackendError
+
+
+class PackedStorage(FileStorage):
+    # blocks are compressed and packed back to back into append-only blob files of blob_size * block_size bytes,
+    # metadata maps address -> (blob, offset, stored length, compressor name or None for raw block),
+    # blob file is removed once none of its blocks is live, repack moves live blocks out of sparsely used blobs
+    def __init__(self, block_size: int, blob_size: int, path: str, kv_storage: KVStorage.__class__,
+                 compressor='zlib', level: int = None, pool_size=16, use_mmap=False, metrics=None,
+                 pool: FilePool = None):
+        super().__init__(block_size, blob_size, path, kv_storage, pool_size=pool_size, use_mmap=use_mmap,
+                         metrics=metrics, pool=pool)
+
+        self.compressor = compressor
+        self.compress = get_compressor(compressor, level)[0] if compressor is not None else None
+        self.decompressors = dict()  # compressor name -> decompress, blocks may be written by other compressor
+
+        self.capacity = block_size * blob_size
+        self.usage = dict((blob, 0) for blob in self.blobs.keys())  # blob -> live and reserved bytes
+        for blob, offset, length, compressor_name in self.blocks_metadata.values():
+            if blob is not None:
+                self.usage[blob] += length
+
+        # blocks are appended to active blob at tail
+        self.active = max(self.blobs.keys()) if self.usage else None
+        self.tail = os.path.getsize(self.get_file_name(self.active)) if self.active is not None else 0
+
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.compress_time = 0.0  # thread CPU seconds spent in compression
+
+    def get_data(self, address: int):
+        return self.get_data_batch([address])[0]
+
+    def get_data_into(self, address: int, buffer):
+        # raw blocks are read straight into buffer, compressed ones are decompressed and copied
+        if address < 0:
+            raise StorageBackendError('address should be greater or equal to 0')
+
+        while True:
+            with self.lock:
+                if address not in self.blocks_metadata:
+                    raise StorageBackendError('metadata for block not found')
+                location = self.blocks_metadata[address]
+            blob, offset, length, compressor_name = location
+            if blob is None or compressor_name is not None:
+                return copy_into(self.get_data(address), buffer)
+
+            with self.get_blob_lock(blob).shared():
+                with self.lock:
+                    if address not in self.blocks_metadata or self.blocks_metadata[address] != location:
+                        continue  # block moved since lookup
+                with memoryview(buffer) as view:
+                    if length > len(view):
+                        raise StorageBackendError('buffer is smaller than block')
+                    self.pool.readinto(blob, self.get_file_name(blob), offset, view[:length])
+                return length
+
+    def get_data_batch(self, addresses):
+        # one read per run of nearby requested blocks of blob file, see group_reads
+        addresses = list(addresses)
+        for address in addresses:
+            if address < 0:
+                raise StorageBackendError('address should be greater or equal to 0')
+
+        result = dict()
+        missing = list(dict.fromkeys(addresses))
+        while missing:
+            by_blob = dict()
+            with self.lock:
+                for address in missing:
+                    if address not in self.blocks_metadata:
+                        raise StorageBackendError('metadata for block not found')
+                    location = self.blocks_metadata[address]
+                    by_blob.setdefault(location[0], dict())[address] = location
+
+            missing = []
+            for blob, locations in by_blob.items():
+                if blob is None:
+                    result.update((address, b'') for address in locations)  # empty blocks take no space
+                    continue
+
+                with self.get_blob_lock(blob).shared():
+                    with self.lock:
+                        # blocks moved since lookup are looked up again, blob can not be removed while locked
+                        for address, location in list(locations.items()):
+                            if address not in self.blocks_metadata or self.blocks_metadata[address] != location:
+                                del locations[address]
+                                missing.append(address)
+                    if not locations:
+                        continue
+
+                    extents = sorted(((offset, length, address)
+                                      for address, (blob, offset, length, compressor_name) in locations.items()),
+                                     key=lambda extent: extent[0])
+                    if self.metrics is not None:
+                        start = time.perf_counter()
+                    payloads = dict()
+                    bytes_read = 0
+                    for first, end, read_extents in group_reads(extents, self.max_read_gap * self.block_size):
+                        with self.pool.view(blob, self.get_file_name(blob), first, end - first) as raw_data:
+                            bytes_read += len(raw_data)
+                            for offset, length, address in read_extents:
+                                payloads[address] = bytes(raw_data[offset - first:offset - first + length])
+                    if self.metrics is not None:
+                        self.metrics.observe('storage.read', time.perf_counter() - start)
+                        self.metrics.count('storage.reads', len(locations))
+                        self.metrics.count('storage.bytes_read', bytes_read)
+
+                for address, payload in payloads.items():
+                    result[address] = self.decompress(payload, locations[address][3])
+        return [result[address] for address in addresses]
+
+    def put_data_batch(self, items):
+        blocks = dict()  # address -> (compressor name, payload)
+        raw_bytes = 0
+        start = time.thread_time()
+        for address, block_data in items:
+            if address < 0:
+                raise StorageBackendError('address should be greater or equal to 0')
+
+            if len(block_data) > self.block_size:
+                raise StorageBackendError('block_data is greater than allowed block_size')
+
+            blocks[address] = self.compress_block(block_data)
+            raw_bytes += len(block_data)
+        compress_time = time.thread_time() - start
+
+        if self.metrics is not None:
+            self.metrics.observe('storage.compress', compress_time)
+        self.append_blocks(blocks)
+        with self.lock:
+            self.raw_bytes += raw_bytes
+            self.stored_bytes += sum(len(payload) for compressor_name, payload in blocks.values())
+            self.compress_time += compress_time
+
+    def compress_block(self, block_data: bytes):
+        # blocks not getting smaller are stored raw
+        if self.compress is not None and block_data:
+            payload = self.compress(block_data)
+            if len(payload) < len(block_data):
+                return self.compressor, payload
+        return None, bytes(block_data)
+
+    def decompress(self, payload: bytes, compressor_name: str):
+        if compressor_name is None:
+            return payload
+        try:
+            decompress = self.decompressors[compressor_name]
+        except KeyError:
+            decompress = self.decompressors[compressor_name] = get_compressor(compressor_name)[1]
+        return decompress(payload)
+
+    def append_blocks(self, blocks: dict, expected: dict = None):
+        # blocks is address -> (compressor name, payload), blocks of expected addresses are stored only
+        # if their location did not change meanwhile, written blocks of every blob are adjacent
+        empty_blobs = []
+        by_blob = dict()
+        with self.lock:
+            for address, (compressor_name, payload) in blocks.items():
+                if payload:
+                    blob, offset = self.reserve(len(payload), empty_blobs)
+                else:
+                    blob, offset = None, 0
+                by_blob.setdefault(blob, []).append((address, offset, compressor_name, payload))
+
+        for blob, entries in by_blob.items():
+            with self.get_blob_lock(blob):
+                if blob is not None:
+                    data = b''.join(payload for address, offset, compressor_name, payload in entries)
+                    if self.metrics is not None:
+                        start = time.perf_counter()
+                    self.pool.write(blob, self.get_file_name(blob), entries[0][1], data)
+                    if self.metrics is not None:
+                        self.metrics.observe('storage.write', time.perf_counter() - start)
+                        self.metrics.count('storage.writes', len(entries))
+                        self.metrics.count('storage.bytes_written', len(data))
+
+                with self.lock:
+                    for address, offset, compressor_name, payload in entries:
+                        if expected is not None and (address not in self.blocks_metadata or
+                                                     self.blocks_metadata[address] != expected[address]):
+                            self.unuse(blob, len(payload), empty_blobs)
+                            continue
+
+                        if address in self.blocks_metadata:
+                            old_blob, old_offset, old_length, old_compressor_name = self.blocks_metadata[address]
+                            self.unuse(old_blob, old_length, empty_blobs)
+                        self.blocks_metadata[address] = (blob, offset, len(payload), compressor_name)
+                        self.allocator.use(address)
+                    if blob is not None:
+                        self.dirty_blobs.add(blob)
+
+        for blob in empty_blobs:
+            self.remove_blob(blob)
+
+    def reserve(self, length: int, empty_blobs: list):
+        # called with lock held, returns (blob, offset) of new space at the end of active blob
+        if self.active is None or self.tail + length > self.capacity:
+            if self.active is not None and self.usage[self.active] == 0:
+                empty_blobs.append(self.active)
+            self.active = max(self.blobs.keys()) + 1 if self.usage else 0
+            self.tail = 0
+            self.init_blob(self.active)
+
+        offset = self.tail
+        self.tail += length
+        self.usage[self.active] += length
+        return self.active, offset
+
+    def unuse(self, blob, length: int, empty_blobs: list):
+        if blob is None:
+            return
+        self.usage[blob] -= length
+        if self.usage[blob] == 0 and blob != self.active:
+            empty_blobs.append(blob)
+
+    def del_data(self, address: int):
+        if address < 0:
+            raise StorageBackendError('address should be greater or equal to 0')
+
+        empty_blobs = []
+        with self.lock:
+            try:
+                blob, offset, length, compressor_name = self.blocks_metadata[address]
+            except KeyError:
+                raise StorageBackendError('metadata for block not found')
+            del self.blocks_metadata[address]
+            self.allocator.release(address)
+            self.unuse(blob, length, empty_blobs)
+
+        for blob in empty_blobs:
+            self.remove_blob(blob)
+
+    def init_blob(self, blob):
+        # called with lock held for blob nobody else knows about
+        file_name = self.get_file_name(blob)
+        self.pool.invalidate(blob)
+        open(file_name, 'wb').close()
+        self.blobs[blob] = file_name
+        self.usage[blob] = 0
+
+    def remove_blob(self, blob):
+        with self.get_blob_lock(blob):
+            with self.lock:
+                if blob not in self.blobs or blob == self.active:
+                    return
+                if self.usage[blob] > 0:
+                    raise StorageBackendError('blob still contains live blocks')
+
+                self.pool.invalidate(blob)
+                os.remove(self.get_file_name(blob))
+                del self.blobs[blob]
+                del self.usage[blob]
+                self.dirty_blobs.discard(blob)
+
+    def repack(self, threshold=0.5):
+        # moves live blocks of blobs filled below threshold to active blob, returns number of removed blobs
+        with self.lock:
+            blobs = set(blob for blob, usage in self.usage.items()
+                        if blob != self.active and usage < self.capacity * threshold)
+            by_blob = dict()
+            for address in self.blocks_metadata.keys():
+                location = self.blocks_metadata[address]
+                if location[0] in blobs:
+                    by_blob.setdefault(location[0], dict())[address] = location
+
+        removed = 0
+        for blob in blobs:
+            locations = by_blob.get(blob, dict())
+            blocks = dict()
+            if locations:
+                with self.get_blob_lock(blob).shared():
+                    with self.lock:
+                        if blob not in self.blobs:
+                            continue
+                    with self.pool.view(blob, self.get_file_name(blob), 0, self.capacity) as raw_data:
+                        for address, (location_blob, offset, length, compressor_name) in locations.items():
+                            blocks[address] = compressor_name, bytes(raw_data[offset:offset + length])
+            if blocks:
+                self.append_blocks(blocks, locations)  # blob emptied by moving is removed
+            with self.lock:
+                empty = blob in self.blobs and self.usage[blob] == 0
+            if empty:
+                self.remove_blob(blob)
+
+            with self.lock:
+                if blob not in self.blobs:
+                    removed += 1
+        return removed
+
+    def get_usage(self):
+        # blob -> share of blob capacity taken by live blocks
+        with self.lock:
+            return dict((blob, usage / self.capacity) for blob, usage in self.usage.items())
+
+    def get_compression_ratio(self):
+        # raw bytes per stored byte of all blocks written
+        with self.lock:
+            return self.raw_bytes / self.stored_bytes if self.stored_bytes else 1.0
+
+    def get_cpu_per_mb(self):
+        # CPU seconds of compression per MB of raw data
+        with self.lock:
+            return self.compress_time / (self.raw_bytes / 2 ** 20) if self.raw_bytes else 0.0
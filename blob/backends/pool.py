@@ -0,0 +1,189 @@
+import contextlib
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from blob.exceptions import StorageBackendError
+
+
+class PoolEntry:
+    def __init__(self, file):
+        self.file = file
+        self.lock = threading.Lock()  # guards file position where positioned I/O is not available
+        self.map = None
+        self.users = 0  # entries in use are closed when released
+        self.evicted = False
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+class FilePool:
+    # bounded LRU pool of open blob files keyed by blob index,
+    # optionally with read-only memory map of every pooled file
+    def __init__(self, size: int = 16, use_mmap=False, metrics=None):
+        if size <= 0 or not isinstance(size, int):
+            raise StorageBackendError('incorrect pool size')
+
+        self.size = size
+        self.use_mmap = use_mmap
+        self.handles = OrderedDict()  # blob -> PoolEntry
+        self.lock = threading.Lock()
+        self.opens = 0
+        self.metrics = metrics
+
+    def acquire(self, blob, file_name: str):
+        with self.lock:
+            try:
+                entry = self.handles[blob]
+            except KeyError:
+                entry = PoolEntry(open(file_name, 'r+b', buffering=0))
+                self.opens += 1
+                if self.metrics is not None:
+                    self.metrics.count('storage.file_opens')
+                self.handles[blob] = entry
+                while len(self.handles) > self.size:
+                    self.evict(self.handles.popitem(last=False)[1])
+            else:
+                self.handles.move_to_end(blob)
+
+            if self.use_mmap and entry.map is None:
+                entry.map = mmap.mmap(entry.file.fileno(), 0, access=mmap.ACCESS_READ)
+            entry.users += 1
+            return entry
+
+    def release(self, entry: PoolEntry):
+        with self.lock:
+            entry.users -= 1
+            if entry.evicted and entry.users == 0:
+                entry.close()
+
+    def evict(self, entry: PoolEntry):
+        entry.evicted = True
+        if entry.users == 0:
+            entry.close()
+
+    def read(self, blob, file_name: str, offset: int, length: int):
+        # bytes of file, copied out of memory map where mapped, see view
+        entry = self.acquire(blob, file_name)
+        try:
+            if entry.map is not None:
+                return entry.map[offset:offset + length]
+            if hasattr(os, 'pread'):
+                return os.pread(entry.file.fileno(), length, offset)
+            with entry.lock:
+                entry.file.seek(offset)
+                return entry.file.read(length)
+        finally:
+            self.release(entry)
+
+    @contextlib.contextmanager
+    def view(self, blob, file_name: str, offset: int, length: int):
+        # memoryview of file data valid inside with block only, slice of memory map without copy where mapped,
+        # users copy data they keep, as map can not be closed while it is viewed and in-place writes change it
+        entry = self.acquire(blob, file_name)
+        try:
+            if entry.map is not None:
+                with memoryview(entry.map) as view:
+                    with view[offset:offset + length] as data:
+                        yield data
+            elif hasattr(os, 'pread'):
+                yield memoryview(os.pread(entry.file.fileno(), length, offset))
+            else:
+                with entry.lock:
+                    entry.file.seek(offset)
+                    data = entry.file.read(length)
+                yield memoryview(data)
+        finally:
+            self.release(entry)
+
+    def readinto(self, blob, file_name: str, offset: int, buffer: memoryview):
+        # fills whole buffer with file data starting at offset
+        entry = self.acquire(blob, file_name)
+        try:
+            if entry.map is not None:
+                with memoryview(entry.map) as view:
+                    buffer[:] = view[offset:offset + len(buffer)]
+            elif hasattr(os, 'preadv'):
+                if os.preadv(entry.file.fileno(), [buffer], offset) < len(buffer):
+                    raise StorageBackendError('unexpected end of blob file')
+            else:
+                with entry.lock:
+                    entry.file.seek(offset)
+                    if entry.file.readinto(buffer) < len(buffer):
+                        raise StorageBackendError('unexpected end of blob file')
+        finally:
+            self.release(entry)
+
+    def write(self, blob, file_name: str, offset: int, data: bytes):
+        entry = self.acquire(blob, file_name)
+        try:
+            if hasattr(os, 'pwrite'):
+                os.pwrite(entry.file.fileno(), data, offset)
+            else:
+                with entry.lock:
+                    entry.file.seek(offset)
+                    entry.file.write(data)
+        finally:
+            self.release(entry)
+
+    def sync(self, blob, file_name: str):
+        entry = self.acquire(blob, file_name)
+        try:
+            os.fsync(entry.file.fileno())
+        finally:
+            self.release(entry)
+
+    def invalidate(self, blob):
+        with self.lock:
+            entry = self.handles.pop(blob, None)
+            if entry is not None:
+                self.evict(entry)
+
+    def close(self):
+        with self.lock:
+            while self.handles:
+                self.evict(self.handles.popitem()[1])
+
+    def __len__(self):
+        return len(self.handles)
+
+
+class PoolView:
+    # FilePool of one storage within pool shared by several storages,
+    # blobs are keyed by (owner, blob) so storages using same blob numbers do not clash
+    def __init__(self, pool: FilePool, owner):
+        self.pool = pool
+        self.owner = owner
+
+    def read(self, blob, file_name: str, offset: int, length: int):
+        return self.pool.read((self.owner, blob), file_name, offset, length)
+
+    def view(self, blob, file_name: str, offset: int, length: int):
+        return self.pool.view((self.owner, blob), file_name, offset, length)
+
+    def readinto(self, blob, file_name: str, offset: int, buffer: memoryview):
+        self.pool.readinto((self.owner, blob), file_name, offset, buffer)
+
+    def write(self, blob, file_name: str, offset: int, data: bytes):
+        self.pool.write((self.owner, blob), file_name, offset, data)
+
+    def sync(self, blob, file_name: str):
+        self.pool.sync((self.owner, blob), file_name)
+
+    def invalidate(self, blob):
+        self.pool.invalidate((self.owner, blob))
+
+    def close(self):
+        # closes files of this storage only
+        with self.pool.lock:
+            keys = [key for key in self.pool.handles if key[0] == self.owner]
+        for key in keys:
+            self.pool.invalidate(key)
+
+    def __len__(self):
+        with self.pool.lock:
+            return sum(1 for key in self.pool.handles if key[0] == self.owner)
@@ -1,69 +1,473 @@
-from blob.backends.storage import Storage
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from blob.backends.bloom import BloomFilter
+from blob.backends.readahead import ReadAhead
+from blob.backends.storage import Storage, copy_into
 from blob.backends.key_value import KVStorage
 from blob.hashers import *
-from blob.exceptions import StorageBackendError
+from blob.exceptions import StorageBackendError, HasherError
+
+
+def hash_blocks(hasher, blocks):
+    # module level function so process pool can run it
+    return [hasher(block_data) for block_data in blocks]
 
 
 class DedupeProxy(Storage):
-    def __init__(self, storage: Storage, kv_storage: KVStorage.__class__, hasher=sha256):
+    def __init__(self, storage: Storage, kv_storage: KVStorage.__class__, hasher=sha256, verify=True,
+                 expected_blocks: int = None, metrics=None, hash_workers=0, hash_processes=False,
+                 hash_executor=None, read_ahead=0, read_ahead_executor=None):
+        if not verify and not is_strong(hasher):
+            raise HasherError('only strong hasher can be trusted without verification')
+
         self.storage = storage
         self.hasher = hasher
+        self.verify = verify  # compare block contents on hash match, otherwise trust the hash
+        self.metrics = metrics  # blob.metrics.Metrics or None
+
+        # pool hashing parts of batches and batches queued by ingest, hashlib releases GIL for blocks
+        # over 2 KiB so threads scale with big blocks, processes also with small ones at cost of copying data;
+        # executor shared with other proxies can be passed instead, batches are split into hash_workers parts
+        self.hash_workers = hash_workers
+        self.own_executor = hash_executor is None
+        self.hash_executor = hash_executor
+        if hash_executor is None and hash_workers > 0:
+            self.hash_executor = (ProcessPoolExecutor if hash_processes else ThreadPoolExecutor)(hash_workers)
 
-        self.by_address = kv_storage()
-        self.by_hash = kv_storage()
+        # read_ahead is largest number of blocks prefetched for sequential run of reads, 0 disables it
+        self.read_ahead = ReadAhead(self, read_ahead, executor=read_ahead_executor) if read_ahead > 0 else None
+
+        self.by_address = kv_storage('by_address')
+        self.by_hash = kv_storage('by_hash')
+        self.by_storage_address = kv_storage('by_storage_address')  # storage address -> hash
+        self.links = kv_storage('links')  # storage address -> number of addresses pointing to it
+
+        # filter of known hashes, definite misses skip by_hash lookup
+        self.bloom_filter = None
+        if expected_blocks is not None:
+            self.bloom_filter = BloomFilter(expected_blocks)
+            self.bloom_filter.rebuild(self.by_hash.keys())
+
+        # lock guards all maps above, storage I/O of writes, reads and read-backs of duplicates runs outside of it:
+        # blocks being written are served from in_flight and are never rewritten in place by other writers,
+        # pinned blocks are never rewritten in place either,
+        # unreferenced blocks are deleted only when they are neither in flight nor pinned by readers
+        self.lock = threading.RLock()
+        self.in_flight = dict()  # storage address -> block data being written to storage
+        self.pins = dict()  # storage address -> number of reads in progress
+        self.deferred = set()  # unreferenced storage addresses waiting for deletion
 
     def get_data(self, address: int):
-        try:
-            storage_address = self.by_address[address]
-        except KeyError:
-            raise StorageBackendError('no block found with such address')
+        if self.metrics is not None:
+            start = time.perf_counter()
+        storage_address, block_data = self.acquire_block(address)
+        if block_data is None:
+            try:
+                if self.read_ahead is not None:
+                    block_data = self.read_ahead.get_data(address, storage_address)
+                if block_data is None:
+                    block_data = self.storage.get_data(storage_address)
+            finally:
+                self.release_block(storage_address)
 
-        return self.storage.get_data(storage_address)
+        if self.metrics is not None:
+            self.metrics.observe('proxy.get', time.perf_counter() - start)
+            self.metrics.count('proxy.gets')
+        return block_data
 
-    def put_data(self, address: int, block_data: bytes):
-        block_hash = self.hasher(block_data)
-        duplicate_address = self.check_duplicate(block_data, block_hash)
-        if duplicate_address is not None:
-            if address in self.by_address:
-                storage_address = self.by_address[address]
-                if self.by_address.count_links(storage_address) == 1 and storage_address != duplicate_address:
-                    self.storage.del_data(storage_address)
-            self.by_address[address] = duplicate_address
+    def get_data_into(self, address: int, buffer):
+        storage_address, block_data = self.acquire_block(address)
+        if block_data is not None:
+            return copy_into(block_data, buffer)
 
-        else:
+        try:
+            if self.read_ahead is not None:
+                block_data = self.read_ahead.get_data(address, storage_address)
+                if block_data is not None:
+                    return copy_into(block_data, buffer)
+            return self.storage.get_data_into(storage_address, buffer)
+        finally:
+            self.release_block(storage_address)
+
+    def acquire_block(self, address: int):
+        # resolves address to storage address pinned until release_block,
+        # returns block data instead for blocks being written
+        with self.lock:
             try:
                 storage_address = self.by_address[address]
             except KeyError:
-                storage_address = self.storage.get_free_address()
+                raise StorageBackendError('no block found with such address')
+
+            if storage_address in self.in_flight:
+                return storage_address, self.in_flight[storage_address]
+            self.pin(storage_address)
+            return storage_address, None
+
+    def release_block(self, storage_address: int):
+        with self.lock:
+            self.unpin(storage_address)
+
+    def get_data_batch(self, addresses):
+        addresses = list(addresses)
+        data = dict()
+        storage_addresses = []
+        with self.lock:
+            for address in addresses:
+                try:
+                    storage_addresses.append(self.by_address[address])
+                except KeyError:
+                    raise StorageBackendError('no block found with such address')
+
+            # deduplicated addresses are read once
+            unique_addresses = []
+            for storage_address in dict.fromkeys(storage_addresses):
+                if storage_address in self.in_flight:
+                    data[storage_address] = self.in_flight[storage_address]
+                else:
+                    unique_addresses.append(storage_address)
+            for storage_address in unique_addresses:
+                self.pin(storage_address)
+
+        try:
+            if self.read_ahead is not None:
+                data.update(self.read_ahead.get_data_batch(addresses, storage_addresses))
+            missing = [storage_address for storage_address in unique_addresses if storage_address not in data]
+            if missing:
+                data.update(zip(missing, self.storage.get_data_batch(missing)))
+        finally:
+            with self.lock:
+                for storage_address in unique_addresses:
+                    self.unpin(storage_address)
+        return [data[storage_address] for storage_address in storage_addresses]
+
+    def put_data(self, address: int, block_data: bytes):
+        self.put_data_batch([(address, block_data)])
+
+    def put_data_batch(self, items, hashes=None):
+        # hashes of blocks can be passed when already known
+        items = list(items)
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        if hashes is None:
+            hashes = self.get_hashes([block_data for address, block_data in items])  # outside of lock
+        if metrics is not None:
+            metrics.observe('proxy.hash', time.perf_counter() - start)
+        pending = dict()  # storage address -> block data, written to storage in one batch
+        new_addresses = set()  # storage addresses allocated in this batch
+
+        read_back = dict()  # storage address -> block data, pinned until blocks are indexed
+        if metrics is not None:
+            start = time.perf_counter()
+        try:
+            while True:
+                self.read_back(hashes, read_back)
+                with self.lock:
+                    if self.get_read_back_candidates(hashes, read_back):
+                        continue  # blocks stored meanwhile by other writers are read back too
+                    dedupe_hits = self.index_blocks(items, hashes, read_back, pending, new_addresses)
+                    self.in_flight.update(pending)
+                    if self.read_ahead is not None:
+                        for storage_address in pending:
+                            self.read_ahead.invalidate(storage_address)  # blocks with one link are rewritten in place
+                    break
+        finally:
+            if read_back:
+                with self.lock:
+                    for storage_address in read_back:
+                        self.unpin(storage_address)
+
+        if metrics is not None:
+            metrics.observe('proxy.index', time.perf_counter() - start)
+            metrics.count('proxy.puts', len(items))
+            metrics.count('proxy.dedupe_hits', dedupe_hits)
+            start = time.perf_counter()
+        try:
+            if pending:
+                self.storage.put_data_batch(pending.items())
+        finally:
+            with self.lock:
+                for storage_address in pending:
+                    del self.in_flight[storage_address]
+                    if storage_address in self.deferred:
+                        self.free(storage_address)
+        if metrics is not None and pending:
+            metrics.observe('proxy.write', time.perf_counter() - start)
+            metrics.count('proxy.bytes_written', sum(map(len, pending.values())))
+
+    def index_blocks(self, items: list, hashes: list, read_back: dict, pending: dict, new_addresses: set):
+        # called with lock held, maps addresses of batch to duplicates or to storage addresses
+        # of blocks to be written which are added to pending; returns number of duplicates
+        dedupe_hits = 0
+        free_addresses = []
+        for index, (address, block_data) in enumerate(items):
+            block_hash = hashes[index]
+            duplicate_address = self.check_duplicate(block_data, block_hash, pending, read_back)
+            if duplicate_address is not None:
+                dedupe_hits += 1
+                if address in self.by_address:
+                    storage_address = self.by_address[address]
+                    if storage_address == duplicate_address:
+                        continue
+                    if self.unlink(storage_address):
+                        self.free(storage_address, pending, new_addresses)
+                self.by_address[address] = duplicate_address
+                self.links[duplicate_address] += 1
+
             else:
-                if self.by_address.count_links(storage_address) > 1:
-                    storage_address = self.storage.get_free_address()
+                try:
+                    storage_address = self.by_address[address]
+                except KeyError:
+                    storage_address = None
                 else:
-                    # removing old hash link to storage address
-                    old_hash = None
-                    for key in self.by_hash.keys():
-                        if storage_address in self.by_hash[key]:
-                            old_hash = key
-                            break
-                    if len(self.by_hash[old_hash]) > 1:
-                        self.by_hash[old_hash].remove(storage_address)
+                    if (self.links[storage_address] > 1 or storage_address in self.in_flight or
+                            self.pins.get(storage_address)):
+                        if self.unlink(storage_address):
+                            self.free(storage_address, pending, new_addresses)
+                        storage_address = None
                     else:
-                        del self.by_hash[old_hash]
+                        # removing old hash link to storage address, block is rewritten in place,
+                        # pinned blocks are never rewritten so readers and read-backs see stable data
+                        self.remove_hash_link(storage_address)
 
-            self.by_address[address] = storage_address
-            if block_hash in self.by_hash:
-                self.by_hash[block_hash].append(storage_address)
-            else:
-                self.by_hash[block_hash] = [storage_address]
+                if storage_address is None:
+                    if not free_addresses:
+                        # every remaining block needs at most one new address
+                        count = len(items) - index
+                        free_addresses = [addr for addr in
+                                          self.storage.get_free_addresses(count + len(self.in_flight))
+                                          if addr not in self.in_flight][:count]
+                        free_addresses.reverse()
+                    storage_address = free_addresses.pop()
+                    new_addresses.add(storage_address)
 
-            self.storage.put_data(storage_address, block_data)
+                self.by_address[address] = storage_address
+                self.links[storage_address] = 1
+                self.add_hash_link(storage_address, block_hash)
+                pending[storage_address] = block_data
+        return dedupe_hits
+
+    def get_hashes(self, blocks: list):
+        if self.hash_executor is None or len(blocks) < 2:
+            return hash_blocks(self.hasher, blocks)
+        size = -(-len(blocks) // self.hash_workers)
+        futures = [self.hash_executor.submit(hash_blocks, self.hasher, blocks[i:i + size])
+                   for i in range(0, len(blocks), size)]
+        return [block_hash for future in futures for block_hash in future.result()]
+
+    def ingest(self, items, batch=256, max_pending_batches: int = None):
+        # writes iterable of (address, block data) in order and returns number of blocks,
+        # pool hashes next batches while caller thread deduplicates and writes current one,
+        # batches are applied one by one so later writes to same address win
+        if max_pending_batches is None:
+            max_pending_batches = 2 * max(1, self.hash_workers)
+        items = iter(items)
+        pending = deque()  # (batch items, future of hashes or None)
+        count = 0
+        try:
+            for batch_items in iter(lambda: list(itertools.islice(items, batch)), []):
+                hashes = None
+                if self.hash_executor is not None:
+                    hashes = self.hash_executor.submit(hash_blocks, self.hasher,
+                                                       [block_data for address, block_data in batch_items])
+                pending.append((batch_items, hashes))
+                count += len(batch_items)
+                while len(pending) > max_pending_batches:
+                    self.put_hashed_batch(*pending.popleft())
+            while pending:
+                self.put_hashed_batch(*pending.popleft())
+        finally:
+            for batch_items, hashes in pending:
+                if hashes is not None:
+                    hashes.cancel()
+        return count
+
+    def put_hashed_batch(self, items, hashes=None):
+        self.put_data_batch(items, None if hashes is None else hashes.result())
+
+    def del_data(self, address: int):
+        with self.lock:
+            try:
+                storage_address = self.by_address[address]
+            except KeyError:
+                raise StorageBackendError('no block found with such address')
+            del self.by_address[address]
+            if self.unlink(storage_address):
+                self.free(storage_address)
+
+    def unlink(self, storage_address: int):
+        # returns True when storage address is not referenced anymore
+        links = self.links[storage_address] - 1
+        if links > 0:
+            self.links[storage_address] = links
+            return False
+        del self.links[storage_address]
+        self.remove_hash_link(storage_address)
+        return True
+
+    def free(self, storage_address: int, pending=None, new_addresses=()):
+        # deletes unreferenced block from storage unless it is still used by other threads
+        if pending:
+            pending.pop(storage_address, None)
+        if storage_address in new_addresses:
+            return  # never written
+
+        if storage_address in self.in_flight or self.pins.get(storage_address):
+            self.deferred.add(storage_address)
+        else:
+            self.deferred.discard(storage_address)
+            if self.read_ahead is not None:
+                self.read_ahead.invalidate(storage_address)
+            self.storage.del_data(storage_address)
+
+    def pin(self, storage_address: int):
+        self.pins[storage_address] = self.pins.get(storage_address, 0) + 1
+
+    def unpin(self, storage_address: int):
+        pins = self.pins[storage_address] - 1
+        if pins > 0:
+            self.pins[storage_address] = pins
+        else:
+            del self.pins[storage_address]
+            if storage_address in self.deferred and storage_address not in self.in_flight:
+                self.free(storage_address)
+
+    def add_hash_link(self, storage_address: int, block_hash):
+        if block_hash in self.by_hash:
+            self.by_hash[block_hash] = self.by_hash[block_hash] + [storage_address]
+        else:
+            self.by_hash[block_hash] = [storage_address]
+            if self.bloom_filter is not None:
+                self.bloom_filter.add(block_hash)
+        self.by_storage_address[storage_address] = block_hash
+
+    def remove_hash_link(self, storage_address: int):
+        block_hash = self.by_storage_address[storage_address]
+        del self.by_storage_address[storage_address]
+        storage_address_list = self.by_hash[block_hash]
+        if len(storage_address_list) > 1:
+            self.by_hash[block_hash] = [addr for addr in storage_address_list if addr != storage_address]
+        else:
+            del self.by_hash[block_hash]
+            if self.bloom_filter is not None:
+                self.bloom_filter.remove(block_hash)
+
+    def get_read_back_candidates(self, hashes: list, read_back: dict):
+        # called with lock held, stored blocks having hash of some block of batch which were not read back yet
+        if not self.verify:
+            return []
+        storage_addresses = dict()  # ordered set
+        for block_hash in dict.fromkeys(hashes):
+            if self.bloom_filter is not None and block_hash not in self.bloom_filter:
+                continue
+            if block_hash not in self.by_hash:
+                continue
+            for storage_address in self.by_hash[block_hash]:
+                if storage_address not in self.in_flight and storage_address not in read_back:
+                    storage_addresses[storage_address] = None
+        return list(storage_addresses)
+
+    def read_back(self, hashes: list, read_back: dict):
+        # pins and reads candidates into read_back, so check_duplicate compares contents
+        # without storage I/O under lock
+        with self.lock:
+            storage_addresses = self.get_read_back_candidates(hashes, read_back)
+            for storage_address in storage_addresses:
+                self.pin(storage_address)
+        if not storage_addresses:
+            return
+
+        data = None
+        try:
+            if self.metrics is not None:
+                start = time.perf_counter()
+            data = self.storage.get_data_batch(storage_addresses)
+            if self.metrics is not None:
+                self.metrics.observe('proxy.read_back', time.perf_counter() - start)
+        finally:
+            if data is None:
+                with self.lock:
+                    for storage_address in storage_addresses:
+                        self.unpin(storage_address)
+        read_back.update(zip(storage_addresses, data))
+
+    def check_duplicate(self, block_data: bytes, block_hash: str, pending=None, read_back: dict = None):
+        # read_back holds blocks read by read_back, without it blocks are read from storage
+        if self.bloom_filter is not None and block_hash not in self.bloom_filter:
+            return None
 
-    def check_duplicate(self, block_data: bytes, block_hash: str):
         if block_hash in self.by_hash:
-            # then compare content to avoid hash collisions
             storage_address_list = self.by_hash[block_hash]
+            if not self.verify:
+                return storage_address_list[0]
+
+            # then compare content to avoid hash collisions
             for addr in storage_address_list:
-                data = self.storage.get_data(addr)
+                if pending and addr in pending:
+                    data = pending[addr]
+                elif addr in self.in_flight:
+                    data = self.in_flight[addr]
+                elif read_back is not None:
+                    if addr not in read_back:
+                        continue
+                    data = read_back[addr]
+                elif self.metrics is not None:
+                    start = time.perf_counter()
+                    data = self.storage.get_data(addr)
+                    self.metrics.observe('proxy.read_back', time.perf_counter() - start)
+                else:
+                    data = self.storage.get_data(addr)
                 if data == block_data:
                     return addr
+            if self.metrics is not None:
+                self.metrics.count('proxy.collisions')  # same hash, different content
         return None
+
+    def relocate(self, storage_address: int, new_storage_address: int, addresses):
+        # moves block to new storage address, addresses are all addresses expected to point to the block,
+        # returns False without changes when they do not match current links
+        with self.lock:
+            if storage_address in self.in_flight or new_storage_address in self.in_flight:
+                return False
+
+            addresses = [address for address in addresses
+                         if address in self.by_address and self.by_address[address] == storage_address]
+            if storage_address not in self.links or self.links[storage_address] != len(addresses):
+                return False
+
+            self.storage.put_data(new_storage_address, self.storage.get_data(storage_address))
+            for address in addresses:
+                self.by_address[address] = new_storage_address
+            self.links[new_storage_address] = self.links[storage_address]
+            del self.links[storage_address]
+            self.add_hash_link(new_storage_address, self.by_storage_address[storage_address])
+            self.remove_hash_link(storage_address)
+            self.free(storage_address)
+            return True
+
+    def rebuild_bloom_filter(self):
+        if self.bloom_filter is not None:
+            self.bloom_filter.rebuild(self.by_hash.keys())
+
+    def sync(self):
+        with self.lock:
+            self.by_address.sync()
+            self.by_hash.sync()
+            self.by_storage_address.sync()
+            self.links.sync()
+        self.storage.sync()
+
+    def close(self):
+        if self.read_ahead is not None:
+            self.read_ahead.close()
+        self.by_address.close()
+        self.by_hash.close()
+        self.by_storage_address.close()
+        self.links.close()
+        self.storage.close()
+        if self.hash_executor is not None and self.own_executor:
+            self.hash_executor.shutdown()
@@ -0,0 +1,226 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from blob.exceptions import StorageBackendError
+
+
+def get_next_address(address):
+    # address following address in sequential read, None if there is none:
+    # ints and tuples ending with int, like (key, version, chunk) addresses of streams
+    if type(address) is int:
+        return address + 1
+    if type(address) is tuple and address and type(address[-1]) is int:
+        return address[:-1] + (address[-1] + 1,)
+    return None
+
+
+class Run:
+    # sequential run of reads, position counts reads of run and prefetched is position prefetch reached
+    def __init__(self, depth: int, wasted: int):
+        self.position = 0
+        self.prefetched = 0
+        self.depth = depth
+        self.wasted = wasted  # wasted counter of ReadAhead when window of run was last sized
+
+
+class ReadAhead:
+    # read-ahead of DedupeProxy: runs of reads of consecutive addresses are detected, several at once
+    # like interleaved streams, and blocks of next addresses are resolved by by_address and prefetched
+    # in background by one get_data_batch of storage, so blocks sharing blob file are read by single read;
+    # window of run starts at min_depth blocks, doubles while prefetched blocks are hit and halves
+    # when prefetched blocks were evicted unused, next window is prefetched once run is halfway through
+    # current one; blocks are kept until evicted or freed by proxy
+    def __init__(self, proxy, max_depth=32, min_depth=2, max_runs=8, max_blocks: int = None, executor=None):
+        if not isinstance(max_depth, int) or max_depth <= 0:
+            raise StorageBackendError('incorrect max_depth')
+        if not isinstance(min_depth, int) or not 0 < min_depth <= max_depth:
+            raise StorageBackendError('incorrect min_depth')
+        if not isinstance(max_runs, int) or max_runs <= 0:
+            raise StorageBackendError('incorrect max_runs')
+
+        self.proxy = proxy
+        self.max_depth = max_depth
+        self.min_depth = min_depth
+        self.max_runs = max_runs
+        self.max_blocks = max_blocks if max_blocks is not None else max_depth * max_runs
+        self.own_executor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(1)
+
+        # lock guards state below, proxy lock is always acquired before it
+        self.lock = threading.Lock()
+        self.runs = OrderedDict()  # next expected address -> Run
+        self.blocks = OrderedDict()  # storage address -> [block data, used]
+        self.loading = dict()  # storage address -> event set when its prefetch is done
+        self.discarded = set()  # storage addresses being prefetched which were invalidated meanwhile
+
+        self.hits = 0  # reads served by prefetched blocks
+        self.misses = 0  # reads continuing run which were not
+        self.prefetched = 0
+        self.wasted = 0  # prefetched blocks evicted unused
+
+    def get_data(self, address, storage_address: int):
+        # prefetched block of address resolved to pinned storage address or None, read continues runs
+        block_data = self.get_block(storage_address)
+        self.prefetch(self.observe(address, block_data is not None))
+        return block_data
+
+    def get_data_batch(self, addresses: list, storage_addresses: list):
+        # storage address -> prefetched block of pinned storage addresses of batch
+        data = dict()
+        for storage_address in dict.fromkeys(storage_addresses):
+            block_data = self.get_block(storage_address)
+            if block_data is not None:
+                data[storage_address] = block_data
+        prefetch = []
+        for address, storage_address in zip(addresses, storage_addresses):
+            prefetch.extend(self.observe(address, storage_address in data))
+        self.prefetch(prefetch)
+        return data
+
+    def get_block(self, storage_address: int):
+        with self.lock:
+            loading = self.loading.get(storage_address)
+        if loading is not None:
+            loading.wait()  # reading it again would not be faster
+        with self.lock:
+            entry = self.blocks.get(storage_address)
+            if entry is None:
+                return None
+            entry[1] = True
+            self.blocks.move_to_end(storage_address)
+            return entry[0]
+
+    def observe(self, address, hit: bool):
+        # records read of address, returns addresses to prefetch
+        next_address = get_next_address(address)
+        if next_address is None:
+            return []
+
+        with self.lock:
+            run = self.runs.pop(address, None)
+            if run is None:
+                run = Run(self.min_depth, self.wasted)
+            else:
+                run.position += 1
+            self.runs[next_address] = run
+            while len(self.runs) > self.max_runs:
+                self.runs.popitem(last=False)
+
+            if run.position > 0:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                self.count('readahead.hits' if hit else 'readahead.misses')
+            if run.position == 0 or run.prefetched - run.position > run.depth // 2:
+                return []
+
+            if self.wasted > run.wasted:
+                run.depth = max(run.depth // 2, self.min_depth)
+            elif hit:
+                run.depth = min(run.depth * 2, self.max_depth)
+            run.wasted = self.wasted
+            start = max(run.position + 1, run.prefetched)
+            run.prefetched = run.position + 1 + run.depth
+
+        addresses = []
+        for position in range(run.position + 1, run.prefetched):
+            if position >= start:
+                addresses.append(next_address)
+            next_address = get_next_address(next_address)
+        return addresses
+
+    def prefetch(self, addresses: list):
+        if not addresses:
+            return
+        proxy = self.proxy
+        storage_addresses = []
+        loaded = threading.Event()
+        with proxy.lock:
+            with self.lock:
+                for address in addresses:
+                    if address not in proxy.by_address:
+                        break  # end of run
+                    storage_address = proxy.by_address[address]
+                    if (storage_address in proxy.in_flight or storage_address in self.blocks or
+                            storage_address in self.loading):
+                        continue
+                    self.loading[storage_address] = loaded
+                    storage_addresses.append(storage_address)
+            for storage_address in storage_addresses:
+                proxy.pin(storage_address)  # block cannot be freed and reused while it is read
+        if not storage_addresses:
+            return
+        try:
+            self.executor.submit(self.load, storage_addresses, loaded)
+        except Exception:
+            # executor shut down, blocks are neither loaded nor kept pinned
+            with proxy.lock:
+                with self.lock:
+                    for storage_address in storage_addresses:
+                        del self.loading[storage_address]
+                        self.discarded.discard(storage_address)
+                for storage_address in storage_addresses:
+                    proxy.unpin(storage_address)
+                loaded.set()
+            raise
+
+    def load(self, storage_addresses: list, loaded: threading.Event):
+        data = None
+        try:
+            data = self.proxy.storage.get_data_batch(storage_addresses)
+        finally:
+            # failed prefetch leaves reads to readers
+            with self.proxy.lock:
+                with self.lock:
+                    for index, storage_address in enumerate(storage_addresses):
+                        del self.loading[storage_address]
+                        if storage_address in self.discarded:
+                            self.discarded.discard(storage_address)
+                        elif data is not None:
+                            self.blocks[storage_address] = [data[index], False]
+                    if data is not None:
+                        self.prefetched += len(data)
+                        self.count('readahead.prefetched', len(data))
+                    while len(self.blocks) > self.max_blocks:
+                        storage_address, (block_data, used) = self.blocks.popitem(last=False)
+                        if not used:
+                            self.wasted += 1
+                            self.count('readahead.wasted')
+                for storage_address in storage_addresses:
+                    self.proxy.unpin(storage_address)
+                loaded.set()
+
+    def invalidate(self, storage_address: int):
+        # called by proxy before block is rewritten or freed
+        with self.lock:
+            self.blocks.pop(storage_address, None)
+            if storage_address in self.loading:
+                self.discarded.add(storage_address)
+
+    def count(self, name: str, value=1):
+        if self.proxy.metrics is not None:
+            self.proxy.metrics.count(name, value)
+
+    def get_hit_rate(self):
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def get_stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.get_hit_rate(),
+                    'prefetched': self.prefetched, 'wasted': self.wasted, 'runs': len(self.runs),
+                    'depths': [run.depth for run in self.runs.values()]}
+
+    def close(self):
+        if self.own_executor:
+            self.executor.shutdown()
+        else:
+            with self.lock:
+                loading = set(self.loading.values())
+            for loaded in loading:
+                loaded.wait()
+        with self.lock:
+            self.blocks.clear()
+            self.runs.clear()
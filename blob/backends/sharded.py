@@ -0,0 +1,173 @@
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from blob.backends.key_value import DictKVStorage, LogKVStorage
+from blob.backends.storage import Storage, FileStorage
+from blob.exceptions import StorageBackendError
+
+
+def serve_shard(connection, args, kwargs):
+    # worker process loop serving calls of ShardClient
+    storage = FileStorage(*args, **kwargs)
+    while True:
+        method, call_args = connection.recv()
+        if method is None:
+            storage.close()
+            connection.send((True, None))
+            break
+        try:
+            result = getattr(storage, method)(*call_args)
+        except Exception as e:
+            connection.send((False, e))
+        else:
+            connection.send((True, result))
+    connection.close()
+
+
+class ShardClient(Storage):
+    # FileStorage running in its own worker process
+    def __init__(self, *args, **kwargs):
+        context = multiprocessing.get_context('spawn')
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=serve_shard, args=(child_connection, args, kwargs), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.lock = threading.Lock()
+
+    def call(self, method, *args):
+        with self.lock:
+            if self.connection.closed:
+                raise StorageBackendError('shard is closed')
+            self.connection.send((method, args))
+            success, result = self.connection.recv()
+        if not success:
+            raise result
+        return result
+
+    def get_data(self, address: int):
+        return self.call('get_data', address)
+
+    def get_data_batch(self, addresses):
+        return self.call('get_data_batch', list(addresses))
+
+    def put_data(self, address: int, block_data: bytes):
+        self.call('put_data', address, block_data)
+
+    def put_data_batch(self, items):
+        self.call('put_data_batch', list(items))
+
+    def del_data(self, address: int):
+        self.call('del_data', address)
+
+    def get_free_address(self):
+        return self.call('get_free_address')
+
+    def get_free_addresses(self, count: int):
+        return self.call('get_free_addresses', count)
+
+    def sync(self):
+        self.call('sync')
+
+    def close(self):
+        with self.lock:
+            if not self.connection.closed:
+                self.connection.send((None, None))
+                self.connection.recv()
+                self.connection.close()
+        self.process.join()
+
+
+class ShardedStorage(Storage):
+    # stripes storage addresses over shards: address -> (address % shards, address // shards),
+    # storage above sees single address space so DedupeProxy dedupes across all shards
+    def __init__(self, shards: list):
+        if not shards:
+            raise StorageBackendError('no shards')
+
+        self.shards = shards
+        self.executor = ThreadPoolExecutor(len(shards)) if len(shards) > 1 else None
+
+    @classmethod
+    def create(cls, block_size: int, blob_size: int, paths: list, persistent=False, processes=False, **kwargs):
+        # one FileStorage per path, in worker processes if processes is True
+        shards = []
+        for path in paths:
+            kv_storage = LogKVStorage.factory(path) if persistent else DictKVStorage
+            if processes:
+                shards.append(ShardClient(block_size, blob_size, path, kv_storage, **kwargs))
+            else:
+                shards.append(FileStorage(block_size, blob_size, path, kv_storage, **kwargs))
+        return cls(shards)
+
+    def get_shard_address(self, address: int):
+        if address < 0:
+            raise StorageBackendError('address should be greater or equal to 0')
+        return address % len(self.shards), address // len(self.shards)
+
+    def get_address(self, shard: int, shard_address: int):
+        return shard_address * len(self.shards) + shard
+
+    def map_shards(self, function, by_shard: dict):
+        # runs function(shard, arg) for every shard in parallel
+        if self.executor is None or len(by_shard) == 1:
+            return dict((shard, function(shard, arg)) for shard, arg in by_shard.items())
+        futures = dict((shard, self.executor.submit(function, shard, arg)) for shard, arg in by_shard.items())
+        return dict((shard, future.result()) for shard, future in futures.items())
+
+    def get_data(self, address: int):
+        shard, shard_address = self.get_shard_address(address)
+        return self.shards[shard].get_data(shard_address)
+
+    def get_data_into(self, address: int, buffer):
+        shard, shard_address = self.get_shard_address(address)
+        return self.shards[shard].get_data_into(shard_address, buffer)
+
+    def get_data_batch(self, addresses):
+        addresses = list(addresses)
+        by_shard = dict()
+        for address in addresses:
+            shard, shard_address = self.get_shard_address(address)
+            by_shard.setdefault(shard, []).append(shard_address)
+
+        results = self.map_shards(lambda shard, shard_addresses: self.shards[shard].get_data_batch(shard_addresses),
+                                  by_shard)
+        results = dict((shard, iter(data)) for shard, data in results.items())
+        return [next(results[address % len(self.shards)]) for address in addresses]
+
+    def put_data(self, address: int, block_data: bytes):
+        shard, shard_address = self.get_shard_address(address)
+        self.shards[shard].put_data(shard_address, block_data)
+
+    def put_data_batch(self, items):
+        by_shard = dict()
+        for address, block_data in items:
+            shard, shard_address = self.get_shard_address(address)
+            by_shard.setdefault(shard, []).append((shard_address, block_data))
+
+        self.map_shards(lambda shard, shard_items: self.shards[shard].put_data_batch(shard_items), by_shard)
+
+    def del_data(self, address: int):
+        shard, shard_address = self.get_shard_address(address)
+        self.shards[shard].del_data(shard_address)
+
+    def get_free_address(self):
+        return min(self.get_address(shard, storage.get_free_address()) for shard, storage in enumerate(self.shards))
+
+    def get_free_addresses(self, count: int):
+        # lowest free addresses of every shard merged, each shard can not contribute more than count of them
+        addresses = []
+        for shard, storage in enumerate(self.shards):
+            addresses.extend(self.get_address(shard, shard_address)
+                             for shard_address in storage.get_free_addresses(count))
+        addresses.sort()
+        return addresses[:count]
+
+    def sync(self):
+        self.map_shards(lambda shard, arg: self.shards[shard].sync(), dict.fromkeys(range(len(self.shards))))
+
+    def close(self):
+        for storage in self.shards:
+            storage.close()
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -1,9 +1,95 @@
+import contextlib
 import os
+import threading
+import time
 
+from blob.backends.allocator import Allocator
 from blob.backends.key_value import KVStorage
+from blob.backends.mapped import MappedKVStorage
+from blob.backends.pool import FilePool, PoolView
 from blob.exceptions import StorageBackendError
 
 
+def copy_into(block_data: bytes, buffer):
+    with memoryview(buffer) as view:
+        if len(block_data) > len(view):
+            raise StorageBackendError('buffer is smaller than block')
+        view[:len(block_data)] = block_data
+    return len(block_data)
+
+
+def group_reads(extents, max_gap: int):
+    # (offset, length, key) extents sorted by offset grouped into reads [start, end, extents],
+    # extents separated by at most max_gap unrequested bytes share one read
+    reads = []
+    for offset, length, key in extents:
+        if reads and offset - reads[-1][1] <= max_gap:
+            reads[-1][1] = max(reads[-1][1], offset + length)
+            reads[-1][2].append((offset, length, key))
+        else:
+            reads.append([offset, offset + length, [(offset, length, key)]])
+    return reads
+
+
+class BlobLock:
+    # lock of one blob file: reads hold it shared, since positioned reads and memory maps are safe to use
+    # from several threads, writes, atomic rewrites and removal hold it exclusively; exclusive holder may
+    # take it again in either mode, readers do not take it twice as waiting writers block new readers
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writers = 0  # writers waiting for lock
+        self.owner = None  # thread holding lock exclusively
+        self.depth = 0
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner == me:
+                self.depth += 1
+                return
+            self.writers += 1
+            while self.owner is not None or self.readers:
+                self.condition.wait()
+            self.writers -= 1
+            self.owner = me
+            self.depth = 1
+
+    def release(self):
+        with self.condition:
+            self.depth -= 1
+            if self.depth == 0:
+                self.owner = None
+                self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @contextlib.contextmanager
+    def shared(self):
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner == me:
+                self.depth += 1
+            else:
+                while self.owner is not None or self.writers:
+                    self.condition.wait()
+                self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                if self.owner == me:
+                    self.depth -= 1
+                else:
+                    self.readers -= 1
+                    if not self.readers:
+                        self.condition.notify_all()
+
+
 class Storage:
     def get_data(self, address: int):
         pass
@@ -17,9 +103,32 @@ class Storage:
     def get_free_address(self):
         pass
 
+    def get_free_addresses(self, count: int):
+        pass
+
+    def get_data_into(self, address: int, buffer):
+        # copies block into writable buffer, returns block length
+        return copy_into(self.get_data(address), buffer)
+
+    def get_data_batch(self, addresses):
+        return [self.get_data(address) for address in addresses]
+
+    def put_data_batch(self, items):
+        for address, block_data in items:
+            self.put_data(address, block_data)
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
 
 class FileStorage(Storage):
-    def __init__(self, block_size: int, blob_size: int, path: str, kv_storage: KVStorage.__class__):
+    max_read_gap = 4  # unrequested blocks read to serve two runs of requested blocks of blob by one read
+
+    def __init__(self, block_size: int, blob_size: int, path: str, kv_storage: KVStorage.__class__, atomic=False,
+                 pool_size=16, use_mmap=False, preallocate=False, metrics=None, pool: FilePool = None):
         if not os.path.exists(path):
             os.makedirs(path)
 
@@ -32,62 +141,202 @@ class FileStorage(Storage):
         self.block_size = block_size
         self.blob_size = blob_size
         self.path = os.path.abspath(path)
+        self.atomic = atomic  # rewrite blob file and replace it on each put instead of in-place update
+        self.preallocate = preallocate  # allocate disk space for whole blob file instead of sparse file
+        self.metrics = metrics  # blob.metrics.Metrics or None
+
+        self.blobs = kv_storage('blobs')
+        self.blocks_metadata = kv_storage('blocks_metadata')
+
+        # pool shared with other storages replaces own pool of pool_size files
+        self.pool = FilePool(pool_size, use_mmap, metrics) if pool is None else PoolView(pool, self.path)
+        self.allocator = Allocator(self.blocks_metadata)
+        if isinstance(self.blocks_metadata, MappedKVStorage):
+            # free addresses are searched in mapped index on demand, open does not read all of it
+            self.allocator.rebuild_lazy(self.blocks_metadata.get_top())
+        else:
+            self.allocator.rebuild(self.blocks_metadata.keys())
 
-        self.blobs = kv_storage()
-        self.blocks_metadata = kv_storage()
+        # lock guards metadata, blobs and allocator, blob locks guard blob files, see BlobLock,
+        # blob lock is always acquired before lock
+        self.lock = threading.RLock()
+        self.blob_locks = dict()
+        self.dirty_blobs = set()  # blobs written since last sync
+        self.live_blocks = None  # blob -> number of live blocks, counted from first get_live_blocks on
 
     def get_data(self, address: int):
         if address < 0:
             raise StorageBackendError('address should be greater or equal to 0')
 
-        if address not in self.blocks_metadata:
-            raise StorageBackendError('metadata for block not found')
-
         blob, block = self.get_physical_address(address)
-        with open(self.get_file_name(blob), 'rb') as file:
-            file.seek(block * self.block_size)
-            raw_data = file.read(self.block_size)
-            block_data = raw_data[self.block_size - self.blocks_metadata[address]:]
-            return block_data
+        with self.get_blob_lock(blob).shared():
+            with self.lock:
+                if address not in self.blocks_metadata:
+                    raise StorageBackendError('metadata for block not found')
+                data_len = self.blocks_metadata[address]
 
-    def put_data(self, address: int, block_data: bytes):
+            offset = block * self.block_size + self.block_size - data_len
+            if self.metrics is None:
+                return self.pool.read(blob, self.get_file_name(blob), offset, data_len)
+
+            start = time.perf_counter()
+            data = self.pool.read(blob, self.get_file_name(blob), offset, data_len)
+            self.metrics.observe('storage.read', time.perf_counter() - start)
+            self.metrics.count('storage.reads')
+            self.metrics.count('storage.bytes_read', data_len)
+            return data
+
+    def get_data_into(self, address: int, buffer):
+        # block is read from file straight into buffer
         if address < 0:
             raise StorageBackendError('address should be greater or equal to 0')
 
         blob, block = self.get_physical_address(address)
-        if blob not in self.blobs:
-            self.init_blob(blob)
-
-        data_len = len(block_data)
-
-        if data_len > self.block_size:
-            raise StorageBackendError('block_data is greater than allowed block_size')
-
-        if data_len > 0:
-            dst_file_name = self.get_file_name(blob)
-            src_file_name = dst_file_name + '_old'
-            os.replace(dst_file_name, src_file_name)
-            with open(src_file_name, 'rb') as src_file, open(dst_file_name, 'wb') as dst_file:
-                current_block = 0
-                while current_block < self.blob_size:
-                    old_data = src_file.read(self.block_size)
-                    if current_block == block:
-                        dst_file.write(block_data)
+        with self.get_blob_lock(blob).shared():
+            with self.lock:
+                if address not in self.blocks_metadata:
+                    raise StorageBackendError('metadata for block not found')
+                data_len = self.blocks_metadata[address]
+
+            offset = block * self.block_size + self.block_size - data_len
+            if self.metrics is not None:
+                start = time.perf_counter()
+            with memoryview(buffer) as view:
+                if data_len > len(view):
+                    raise StorageBackendError('buffer is smaller than block')
+                self.pool.readinto(blob, self.get_file_name(blob), offset, view[:data_len])
+            if self.metrics is not None:
+                self.metrics.observe('storage.read', time.perf_counter() - start)
+                self.metrics.count('storage.reads')
+                self.metrics.count('storage.bytes_read', data_len)
+            return data_len
+
+    def get_data_batch(self, addresses):
+        # one read per run of nearby requested blocks of blob file, see group_reads
+        addresses = list(addresses)
+        by_blob = dict()
+        for address in addresses:
+            if address < 0:
+                raise StorageBackendError('address should be greater or equal to 0')
+
+            blob, block = self.get_physical_address(address)
+            by_blob.setdefault(blob, dict())[block] = address
+
+        result = dict()
+        for blob, blocks in by_blob.items():
+            with self.get_blob_lock(blob).shared():
+                with self.lock:
+                    extents = []
+                    for block in sorted(blocks):
+                        address = blocks[block]
+                        if address not in self.blocks_metadata:
+                            raise StorageBackendError('metadata for block not found')
+                        data_len = self.blocks_metadata[address]
+                        extents.append((block * self.block_size + self.block_size - data_len, data_len, address))
+
+                if self.metrics is not None:
+                    start = time.perf_counter()
+                bytes_read = 0
+                for first, end, read_extents in group_reads(extents, self.max_read_gap * self.block_size):
+                    with self.pool.view(blob, self.get_file_name(blob), first, end - first) as raw_data:
+                        bytes_read += len(raw_data)
+                        for offset, length, address in read_extents:
+                            result[address] = bytes(raw_data[offset - first:offset - first + length])
+                if self.metrics is not None:
+                    self.metrics.observe('storage.read', time.perf_counter() - start)
+                    self.metrics.count('storage.reads', len(blocks))
+                    self.metrics.count('storage.bytes_read', bytes_read)
+        return [result[address] for address in addresses]
+
+    def put_data(self, address: int, block_data: bytes):
+        self.put_data_batch([(address, block_data)])
+
+    def put_data_batch(self, items):
+        by_blob = dict()
+        for address, block_data in items:
+            if address < 0:
+                raise StorageBackendError('address should be greater or equal to 0')
+
+            if len(block_data) > self.block_size:
+                raise StorageBackendError('block_data is greater than allowed block_size')
+
+            blob, block = self.get_physical_address(address)
+            by_blob.setdefault(blob, dict())[block] = (address, block_data)
+
+        for blob, blocks in by_blob.items():
+            with self.get_blob_lock(blob):
+                self.init_blob(blob)
+
+                blocks_data = dict((block, block_data) for block, (address, block_data) in blocks.items()
+                                   if len(block_data) > 0)
+                if blocks_data:
+                    if self.metrics is not None:
+                        start = time.perf_counter()
+                    if self.atomic:
+                        self.replace_blocks(blob, blocks_data)
                     else:
-                        dst_file.write(old_data)
-                    current_block += 1
-            os.remove(src_file_name)
+                        self.write_blocks(blob, blocks_data)
+                    if self.metrics is not None:
+                        self.metrics.observe('storage.rewrite' if self.atomic else 'storage.write',
+                                             time.perf_counter() - start)
+                        self.metrics.count('storage.writes', len(blocks_data))
+                        self.metrics.count('storage.bytes_written', sum(map(len, blocks_data.values())))
 
-        self.blocks_metadata[address] = data_len
+                with self.lock:
+                    for address, block_data in blocks.values():
+                        if self.live_blocks is not None and address not in self.blocks_metadata:
+                            self.live_blocks[blob] = self.live_blocks.get(blob, 0) + 1
+                        self.blocks_metadata[address] = len(block_data)
+                        self.allocator.use(address)
+                    if blocks_data and not self.atomic:
+                        self.dirty_blobs.add(blob)
 
     def del_data(self, address: int):
         if address < 0:
             raise StorageBackendError('address should be greater or equal to 0')
 
-        try:
-            del self.blocks_metadata[address]
-        except KeyError:
-            raise StorageBackendError('metadata for block not found')
+        with self.lock:
+            try:
+                del self.blocks_metadata[address]
+            except KeyError:
+                raise StorageBackendError('metadata for block not found')
+            self.allocator.release(address)
+            if self.live_blocks is not None:
+                self.live_blocks[address // self.blob_size] -= 1
+
+    def get_slot_data(self, block_data: bytes):
+        # data is stored aligned to the end of the slot, see get_data
+        return block_data.rjust(self.block_size, b'0')
+
+    def write_blocks(self, blob, blocks: dict):
+        # one write per run of adjacent blocks
+        file_name = self.get_file_name(blob)
+        run = []
+        for block in sorted(blocks):
+            if run and block != run[0] + len(run):
+                self.pool.write(blob, file_name, run[0] * self.block_size,
+                                b''.join(self.get_slot_data(blocks[i]) for i in run))
+                run = []
+            run.append(block)
+        self.pool.write(blob, file_name, run[0] * self.block_size,
+                        b''.join(self.get_slot_data(blocks[i]) for i in run))
+
+    def replace_blocks(self, blob, blocks: dict):
+        dst_file_name = self.get_file_name(blob)
+        tmp_file_name = dst_file_name + '_new'
+        with open(dst_file_name, 'rb') as src_file, open(tmp_file_name, 'wb') as tmp_file:
+            current_block = 0
+            while current_block < self.blob_size:
+                old_data = src_file.read(self.block_size)
+                if current_block in blocks:
+                    tmp_file.write(self.get_slot_data(blocks[current_block]))
+                else:
+                    tmp_file.write(old_data)
+                current_block += 1
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        self.pool.invalidate(blob)
+        os.replace(tmp_file_name, dst_file_name)
 
     def get_physical_address(self, address):
         if address < 0:
@@ -97,19 +346,92 @@ class FileStorage(Storage):
         return blob, block
 
     def init_blob(self, blob):
-        if blob not in self.blobs:
+        with self.get_blob_lock(blob):
+            with self.lock:
+                if blob in self.blobs:
+                    return
+
+            if self.metrics is not None:
+                start = time.perf_counter()
             file_name = self.get_file_name(blob)
+            self.pool.invalidate(blob)
+            blob_len = self.block_size * self.blob_size
             with open(file_name, 'wb') as file:
-                file.write(bytes('0', encoding='utf-8') * self.block_size * self.blob_size)
-            self.blobs[blob] = file_name
+                if not self.preallocate:
+                    file.truncate(blob_len)  # sparse file, unwritten slots take no disk space
+                elif hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(file.fileno(), 0, blob_len)
+                else:
+                    file.write(bytes(blob_len))
+
+            with self.lock:
+                self.blobs[blob] = file_name
+            if self.metrics is not None:
+                self.metrics.observe('storage.init_blob', time.perf_counter() - start)
+
+    def remove_blob(self, blob):
+        with self.get_blob_lock(blob):
+            with self.lock:
+                first = blob * self.blob_size
+                for address in range(first, first + self.blob_size):
+                    if address in self.blocks_metadata:
+                        raise StorageBackendError('blob still contains live blocks')
+
+                self.pool.invalidate(blob)
+                if blob in self.blobs:
+                    os.remove(self.get_file_name(blob))
+                    del self.blobs[blob]
+                if self.live_blocks is not None:
+                    self.live_blocks.pop(blob, None)
+
+    def get_live_blocks(self):
+        # blob -> number of live blocks of every blob file, metadata is scanned only on first call
+        with self.lock:
+            if self.live_blocks is None:
+                self.live_blocks = dict()
+                for address in self.blocks_metadata.keys():
+                    blob = address // self.blob_size
+                    self.live_blocks[blob] = self.live_blocks.get(blob, 0) + 1
+            return dict((blob, self.live_blocks.get(blob, 0)) for blob in self.blobs.keys())
+
+    def get_blob_lock(self, blob):
+        with self.lock:
+            try:
+                return self.blob_locks[blob]
+            except KeyError:
+                lock = self.blob_locks[blob] = BlobLock()
+                return lock
 
     def get_file_name(self, blob):
         file_name = 'blob_' + str(blob).rjust(5, '0')  # 5 as an example
         return os.path.join(self.path, file_name)
 
     def get_free_address(self):
-        address = 0
-        while True:
-            if address not in self.blocks_metadata:
-                return address
-            address += 1
+        with self.lock:
+            return self.allocator.get_free_address()
+
+    def get_free_addresses(self, count: int):
+        with self.lock:
+            return self.allocator.get_free_addresses(count)
+
+    def sync(self):
+        # makes written blocks and metadata durable
+        if self.metrics is not None:
+            start = time.perf_counter()
+        with self.lock:
+            dirty_blobs = self.dirty_blobs
+            self.dirty_blobs = set()
+        for blob in dirty_blobs:
+            with self.get_blob_lock(blob):
+                if blob in self.blobs:
+                    self.pool.sync(blob, self.get_file_name(blob))
+        with self.lock:
+            self.blobs.sync()
+            self.blocks_metadata.sync()
+        if self.metrics is not None:
+            self.metrics.observe('storage.sync', time.perf_counter() - start)
+
+    def close(self):
+        self.pool.close()
+        self.blobs.close()
+        self.blocks_metadata.close()
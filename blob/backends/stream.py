@@ -0,0 +1,139 @@
+import io
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from blob.backends.key_value import KVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.chunking import chunk_stream, get_chunk_sizes
+from blob.exceptions import StorageBackendError
+
+
+class StreamReader(io.RawIOBase):
+    # reads object chunks from proxy batch by batch
+    def __init__(self, proxy: DedupeProxy, addresses: list, batch: int):
+        self.proxy = proxy
+        self.addresses = addresses
+        self.batch = batch
+        self.next_chunk = 0
+        self.chunks = deque()
+        self.chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.chunk:
+            if not self.chunks:
+                addresses = self.addresses[self.next_chunk:self.next_chunk + self.batch]
+                if not addresses:
+                    return 0
+                self.chunks.extend(self.proxy.get_data_batch(addresses))
+                self.next_chunk += len(addresses)
+            self.chunk = memoryview(self.chunks.popleft())
+
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+
+class StreamStore:
+    # objects of any size split into content-defined chunks deduplicated by DedupeProxy,
+    # chunk i of version v of object key is stored at proxy address (key, v, i),
+    # manifests map key -> (version, chunk lengths), new version replaces old one once all its chunks are written
+    # and chunks of old version are deleted then, so streams still reading old version fail;
+    # chunking runs in caller thread while workers hash and write previous batches of chunks
+    def __init__(self, proxy: DedupeProxy, kv_storage: KVStorage.__class__, avg_size=8192, min_size: int = None,
+                 max_size: int = None, batch=64, max_pending_batches=4, max_workers=2):
+        self.proxy = proxy
+        self.min_size, self.avg_size, self.max_size = get_chunk_sizes(avg_size, min_size, max_size)
+        self.batch = batch  # chunks per put_data_batch call
+        self.max_pending_batches = max_pending_batches  # batches in flight before chunking waits
+        self.manifests = kv_storage('manifests')
+        self.executor = ThreadPoolExecutor(max_workers)
+
+        self.lock = threading.Lock()
+        self.writing = set()  # (key, version) of puts in progress
+
+    def put_stream(self, key, fileobj):
+        # returns size of stored object
+        with self.lock:
+            version = self.manifests[key][0] + 1 if key in self.manifests else 0
+            while (key, version) in self.writing:
+                version += 1
+            self.writing.add((key, version))
+
+        lengths = []
+        futures = deque()
+        try:
+            try:
+                items = []
+                for chunk in chunk_stream(fileobj, self.avg_size, self.min_size, self.max_size):
+                    items.append(((key, version, len(lengths)), chunk))
+                    lengths.append(len(chunk))
+                    if len(items) == self.batch:
+                        futures.append(self.executor.submit(self.proxy.put_data_batch, items))
+                        items = []
+                        while len(futures) > self.max_pending_batches:
+                            futures.popleft().result()
+                if items:
+                    futures.append(self.executor.submit(self.proxy.put_data_batch, items))
+                while futures:
+                    futures.popleft().result()
+            except BaseException:
+                for future in futures:
+                    future.exception()  # waiting for writes to finish before removing chunks
+                self.remove_chunks(key, version, len(lengths))
+                raise
+
+            with self.lock:
+                old = self.manifests[key] if key in self.manifests else None
+                self.manifests[key] = (version, lengths)
+            if old is not None:
+                self.remove_chunks(key, old[0], len(old[1]))
+            return sum(lengths)
+        finally:
+            with self.lock:
+                self.writing.discard((key, version))
+
+    def get_stream(self, key, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        # returns readable binary file object
+        with self.lock:
+            try:
+                version, lengths = self.manifests[key]
+            except KeyError:
+                raise StorageBackendError('no object found with such key')
+        addresses = [(key, version, i) for i in range(len(lengths))]
+        return io.BufferedReader(StreamReader(self.proxy, addresses, self.batch), buffer_size)
+
+    def get_size(self, key):
+        with self.lock:
+            try:
+                return sum(self.manifests[key][1])
+            except KeyError:
+                raise StorageBackendError('no object found with such key')
+
+    def del_stream(self, key):
+        with self.lock:
+            try:
+                version, lengths = self.manifests[key]
+            except KeyError:
+                raise StorageBackendError('no object found with such key')
+            del self.manifests[key]
+        self.remove_chunks(key, version, len(lengths))
+
+    def keys(self):
+        with self.lock:
+            return list(self.manifests.keys())
+
+    def remove_chunks(self, key, version, count: int):
+        for i in range(count):
+            try:
+                self.proxy.del_data((key, version, i))
+            except StorageBackendError:
+                pass  # chunk was never written
+
+    def close(self):
+        self.executor.shutdown()
+        self.manifests.close()
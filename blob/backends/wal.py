@@ -0,0 +1,325 @@
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import Storage, copy_into
+from blob.exceptions import StorageBackendError
+
+
+class WriteAheadLog:
+    # append-only file of records, commits arriving within commit_window share single fsync (group commit)
+    record_header = struct.Struct('<II')  # payload size, crc32 of payload
+
+    def __init__(self, file_name: str, commit_window=0.002, fsync=True):
+        self.file_name = file_name
+        self.commit_window = commit_window
+        self.fsync = fsync
+        self.file = open(file_name, 'ab')
+
+        self.lock = threading.Lock()
+        self.committed = threading.Condition(self.lock)
+        self.appended = 0  # number of records appended
+        self.durable = 0  # number of records flushed to disk
+        self.committing = False  # some thread is flushing the log for all waiting threads
+        self.syncs = 0
+
+    @classmethod
+    def read(cls, file_name: str):
+        # records of log file, torn record left by interrupted write is dropped
+        with open(file_name, 'rb') as file:
+            log = file.read()
+        records = []
+        offset = 0
+        header_size = cls.record_header.size
+        while offset + header_size <= len(log):
+            record_size, checksum = cls.record_header.unpack_from(log, offset)
+            payload = log[offset + header_size:offset + header_size + record_size]
+            if len(payload) < record_size or zlib.crc32(payload) != checksum:
+                break
+            records.append(pickle.loads(payload))
+            offset += header_size + record_size
+
+        if offset < len(log):
+            with open(file_name, 'r+b') as file:
+                file.truncate(offset)
+        return records
+
+    def append(self, record):
+        # returns position to be passed to commit
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if self.file.closed:
+                raise StorageBackendError('log is closed')
+            self.file.write(self.record_header.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.appended += 1
+            return self.appended
+
+    def commit(self, position: int):
+        # waits until record at position is on disk, first waiting thread flushes for everyone
+        with self.lock:
+            while self.durable < position:
+                if self.committing:
+                    self.committed.wait()
+                    continue
+
+                self.committing = True
+                try:
+                    self.lock.release()
+                    try:
+                        if self.commit_window > 0:
+                            time.sleep(self.commit_window)  # letting other writers join the commit
+                    finally:
+                        self.lock.acquire()
+                    self.flush()
+                finally:
+                    self.committing = False
+                    self.committed.notify_all()
+
+    def flush(self):
+        # called with lock held, fsync runs without it so writers keep appending
+        if self.file.closed:
+            return
+        target = self.appended
+        self.file.flush()
+        if self.fsync:
+            fileno = self.file.fileno()
+            self.lock.release()
+            try:
+                os.fsync(fileno)
+            finally:
+                self.lock.acquire()
+            self.syncs += 1
+        self.durable = max(self.durable, target)
+
+    def close(self):
+        with self.lock:
+            while self.committing:
+                self.committed.wait()
+            self.flush()
+            self.file.close()
+            self.committed.notify_all()
+
+
+class LoggedStorage(Storage):
+    # durable write-back front-end of DedupeProxy: puts and deletes are appended to write-ahead log and kept
+    # in memtable, deletes as tombstones with no hash and data; checkpointer thread applies memtable to proxy
+    # in batches, syncs it and drops logs covered by it, logs left by crash are replayed on open;
+    # block_size limits logged blocks, it is taken from storage of proxy when not given
+    def __init__(self, storage: DedupeProxy, path: str, commit_window=0.002, checkpoint_interval=1.0,
+                 max_pending=65536, fsync=True, block_size: int = None):
+        if max_pending <= 0 or not isinstance(max_pending, int):
+            raise StorageBackendError('incorrect max_pending')
+        if block_size is None:
+            block_size = getattr(storage.storage, 'block_size', None)
+        if block_size is None:
+            raise StorageBackendError('block_size is not known')
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.storage = storage
+        self.path = path
+        self.block_size = block_size
+        self.commit_window = commit_window
+        self.checkpoint_interval = checkpoint_interval
+        self.max_pending = max_pending  # blocks in memtable before writers have to wait for checkpoint
+        self.fsync = fsync
+
+        self.lock = threading.RLock()
+        self.checkpoint_lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.memtable = dict()  # address -> (lsn, block hash, block data) not applied to storage yet
+        self.lsn = 0
+        self.error = None  # exception raised by checkpointer
+        self.closed = False
+
+        self.generation = self.replay()
+        self.log = WriteAheadLog(self.get_file_name(self.generation), commit_window, fsync)
+        self.checkpointer = threading.Thread(target=self.run_checkpointer, daemon=True)
+        self.checkpointer.start()
+
+    def get_file_name(self, generation: int):
+        return os.path.join(self.path, 'wal_' + str(generation).rjust(5, '0') + '.log')
+
+    def get_generations(self):
+        return sorted(int(name[4:9]) for name in os.listdir(self.path) if re.fullmatch(r'wal_\d{5}\.log', name))
+
+    def replay(self):
+        # applies logs left by previous run, returns generation of new log
+        generations = self.get_generations()
+        blocks = dict()  # address -> (block hash, block data), later records win
+        for generation in generations:
+            for record in WriteAheadLog.read(self.get_file_name(generation)):
+                for address, block_hash, block_data in record:
+                    blocks[address] = block_hash, block_data
+
+        if blocks:
+            self.apply(list(blocks.items()))
+            self.storage.sync()
+        for generation in generations:
+            os.remove(self.get_file_name(generation))
+        return generations[-1] + 1 if generations else 0
+
+    def apply(self, entries: list):
+        # applies (address, (block hash, block data)) entries to proxy, tombstones of addresses
+        # proxy does not know are skipped, so replaying them again is harmless
+        puts = [(address, block_hash, block_data) for address, (block_hash, block_data) in entries
+                if block_hash is not None]
+        if puts:
+            self.storage.put_data_batch([(address, block_data) for address, block_hash, block_data in puts],
+                                        [block_hash for address, block_hash, block_data in puts])
+        with self.storage.lock:
+            for address, (block_hash, block_data) in entries:
+                if block_hash is None and address in self.storage.by_address:
+                    self.storage.del_data(address)
+
+    def get_memtable_data(self, address):
+        # block data of address in memtable, None if it is not there, deleted block raises
+        entry = self.memtable.get(address)
+        if entry is None:
+            return None
+        if entry[1] is None:
+            raise StorageBackendError('no block found with such address')
+        return entry[2]
+
+    def get_data(self, address: int):
+        with self.lock:
+            block_data = self.get_memtable_data(address)
+        if block_data is not None:
+            return block_data
+        # blocks leave memtable only after they are written to storage
+        return self.storage.get_data(address)
+
+    def get_data_into(self, address: int, buffer):
+        with self.lock:
+            block_data = self.get_memtable_data(address)
+        if block_data is not None:
+            return copy_into(block_data, buffer)
+        return self.storage.get_data_into(address, buffer)
+
+    def get_data_batch(self, addresses):
+        addresses = list(addresses)
+        data = dict()
+        with self.lock:
+            for address in addresses:
+                block_data = self.get_memtable_data(address)
+                if block_data is not None:
+                    data[address] = block_data
+        missing = [address for address in dict.fromkeys(addresses) if address not in data]
+        if missing:
+            data.update(zip(missing, self.storage.get_data_batch(missing)))
+        return [data[address] for address in addresses]
+
+    def put_data(self, address: int, block_data: bytes):
+        self.put_data_batch([(address, block_data)])
+
+    def put_data_batch(self, items):
+        items = list(items)
+        for address, block_data in items:
+            if address < 0:
+                raise StorageBackendError('address should be greater or equal to 0')
+            if len(block_data) > self.block_size:
+                raise StorageBackendError('block_data is greater than allowed block_size')
+        hashes = self.storage.get_hashes([block_data for address, block_data in items])
+        self.append([(address, block_hash, block_data) for (address, block_data), block_hash in zip(items, hashes)])
+
+    def del_data(self, address: int):
+        with self.lock:
+            if address in self.memtable:
+                self.get_memtable_data(address)  # raises if already deleted
+            else:
+                with self.storage.lock:
+                    if address not in self.storage.by_address:
+                        raise StorageBackendError('no block found with such address')
+        self.append([(address, None, None)])
+
+    def append(self, record: list):
+        # logs record of (address, block hash, block data) entries and adds them to memtable,
+        # returns once record is durable
+        if not record:
+            return
+
+        with self.lock:
+            while not self.closed and self.error is None and len(self.memtable) >= self.max_pending:
+                self.changed.notify_all()
+                self.changed.wait()
+            if self.error is not None:
+                raise StorageBackendError('checkpoint failed') from self.error
+            if self.closed:
+                raise StorageBackendError('storage is closed')
+
+            log = self.log
+            position = log.append(record)
+            for address, block_hash, block_data in record:
+                self.lsn += 1
+                self.memtable[address] = self.lsn, block_hash, block_data
+            if len(self.memtable) >= self.max_pending:
+                self.changed.notify_all()
+
+        log.commit(position)
+
+    def checkpoint(self):
+        # applies memtable to storage, logs older than current one are not needed after that
+        with self.checkpoint_lock:
+            with self.lock:
+                if not self.memtable:
+                    return
+                old_log = self.log
+                self.generation += 1
+                self.log = WriteAheadLog(self.get_file_name(self.generation), self.commit_window, self.fsync)
+                entries = list(self.memtable.items())
+
+            old_log.close()  # waiting writers are committed by close
+            self.apply([(address, (block_hash, block_data)) for address, (lsn, block_hash, block_data) in entries])
+            self.storage.sync()
+            for generation in self.get_generations():
+                if generation < self.generation:
+                    os.remove(self.get_file_name(generation))
+
+            with self.lock:
+                for address, (lsn, block_hash, block_data) in entries:
+                    if self.memtable.get(address, (None,))[0] == lsn:
+                        del self.memtable[address]
+                self.changed.notify_all()
+
+    def run_checkpointer(self):
+        while True:
+            with self.lock:
+                if not self.closed and len(self.memtable) < self.max_pending:
+                    self.changed.wait(self.checkpoint_interval)
+                if self.closed:
+                    return
+            try:
+                self.checkpoint()
+            except Exception as e:
+                with self.lock:
+                    self.error = e
+                    self.changed.notify_all()
+                return
+
+    def get_free_address(self):
+        return self.storage.get_free_address()
+
+    def get_free_addresses(self, count: int):
+        return self.storage.get_free_addresses(count)
+
+    def sync(self):
+        self.checkpoint()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.changed.notify_all()
+        self.checkpointer.join()
+        if self.error is None:
+            self.checkpoint()
+        self.log.close()
+        if self.error is None:
+            os.remove(self.log.file_name)  # nothing left to replay
+        self.storage.close()
@@ -0,0 +1,131 @@
+import hashlib
+
+from blob.exceptions import BlobError
+
+# gear table of content-defined chunker, derived from fixed seed so boundaries are the same in every run,
+# 32 bit hash stays cheap in Python and depends on last 32 bytes
+gear = [int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=4).digest(), 'little') for i in range(256)]
+
+hash_mask = 2 ** 32 - 1
+
+# plane i maps byte to byte i of its gear value, see scan_boundary
+gear_planes = [bytes((value >> (8 * i)) & 255 for value in gear) for i in range(4)]
+lane_mask = 2 ** 64 - 1
+lane_shifts = (65, 130, 260, 520, 1040)  # sum of 2 ** (65 * k) for k < 32 is product of (1 + 2 ** shift)
+min_scan_avg_size = 512  # smaller chunks are cut by rolling hash byte by byte
+
+
+def get_chunk_sizes(avg_size: int, min_size: int = None, max_size: int = None):
+    # returns (min_size, avg_size, max_size), avg_size should be power of 2
+    if avg_size < 64 or avg_size > 2 ** 28 or avg_size & (avg_size - 1):
+        raise BlobError('avg_size should be power of 2 between 64 and 2 ** 28')
+    min_size = avg_size // 4 if min_size is None else min_size
+    max_size = avg_size * 4 if max_size is None else max_size
+    if not 0 < min_size <= avg_size <= max_size:
+        raise BlobError('chunk sizes should satisfy 0 < min_size <= avg_size <= max_size')
+    return min_size, avg_size, max_size
+
+
+def get_masks(avg_size: int):
+    # boundary is harder to hit before avg_size and easier after it (normalized chunking),
+    # masks select high bits that depend on most of the last 32 bytes
+    bits = avg_size.bit_length() - 1
+    mask_s = (2 ** (bits + 2) - 1) << (32 - bits - 2)
+    mask_l = (2 ** (bits - 2) - 1) << (32 - bits + 2)
+    return mask_s, mask_l
+
+
+def roll_boundary(data: bytes, position: int, normal: int, end: int, mask_s: int, mask_l: int):
+    # first position in (position, end] after which gear hash rolled from position has no bit of mask_s set
+    # up to normal and of mask_l after it, None if there is none
+    table = gear
+    h = 0
+    for byte in data[position:normal]:
+        h = ((h << 1) + table[byte]) & hash_mask
+        position += 1
+        if not h & mask_s:
+            return position
+    for byte in data[position:end]:
+        h = ((h << 1) + table[byte]) & hash_mask
+        position += 1
+        if not h & mask_l:
+            return position
+    return None
+
+
+def scan_boundary(data: bytes, position: int, end: int, mask: int, scan_size: int):
+    # first position p in (position, end] where gear hash of data[p - 32:p] has no bit of mask set, None if none,
+    # position should be at least 31; hashes of scan_size positions are computed at once by int arithmetic:
+    # gear values of bytes are put into 64-bit lanes of one int, multiplying it by sum of 2 ** (65 * k)
+    # for k < 32 adds gear value of k-th previous byte shifted by k to every lane, which is gear hash
+    # of last 32 bytes before it is cut to 32 bits, lanes do not overflow as it is below 2 ** 64
+    while position < end:
+        stop = min(end, position + scan_size)
+        piece = data[position - 31:stop]
+        lanes = bytearray(8 * len(piece))
+        for i, plane in enumerate(gear_planes):
+            lanes[i::8] = piece.translate(plane)
+        hashes = int.from_bytes(lanes, 'little')
+        for shift in lane_shifts:
+            hashes += hashes << shift
+
+        # setting bits outside of mask leaves lanes of matching hashes equal to unmasked pattern
+        unmasked = (lane_mask ^ mask).to_bytes(8, 'little')
+        hashes |= int.from_bytes(unmasked * len(piece), 'little')
+        lanes = hashes.to_bytes(8 * len(piece) + 256, 'little')
+        index = lanes.find(unmasked, 8 * 31, 8 * len(piece))
+        while index > 0 and index % 8:
+            index = lanes.find(unmasked, index + 1, 8 * len(piece))
+        if index >= 0:
+            return position - 31 + index // 8 + 1
+        position = stop
+    return None
+
+
+def find_boundary(data: bytes, start: int, end: int, min_size: int, avg_size: int, max_size: int,
+                  mask_s: int, mask_l: int):
+    # end of chunk starting at start, gear hash is rolled from min_size on; once hash depends on 32 bytes
+    # chunks of at least min_scan_avg_size are cut at the same positions by scan_boundary, which is about
+    # twice as fast as rolling hash in Python byte by byte
+    if end - start <= min_size:
+        return end
+    end = min(end, start + max_size)
+    normal = min(end, start + avg_size)
+    position = start + min_size
+    if avg_size < min_scan_avg_size:
+        boundary = roll_boundary(data, position, normal, end, mask_s, mask_l)
+        return end if boundary is None else boundary
+
+    window = min(end, position + 31)
+    scan_size = max(256, min(1024, avg_size // 4))  # boundary after normal is expected within avg_size // 4
+    boundary = roll_boundary(data, position, min(normal, window), window, mask_s, mask_l)
+    if boundary is None and window < normal:
+        boundary = scan_boundary(data, window, normal, mask_s, scan_size)
+    if boundary is None:
+        boundary = scan_boundary(data, max(window, normal), end, mask_l, scan_size)
+    return end if boundary is None else boundary
+
+
+def chunk_stream(fileobj, avg_size=8192, min_size: int = None, max_size: int = None, read_size=2 ** 20):
+    # yields content-defined chunks of data read from fileobj, memory is bounded by read_size + max_size;
+    # chunking is pure Python and bounds throughput of streams at about 10-15 MB/s for avg_size of 4096
+    # and more and about 5 MB/s for smaller ones, well below disk speed
+    min_size, avg_size, max_size = get_chunk_sizes(avg_size, min_size, max_size)
+    mask_s, mask_l = get_masks(avg_size)
+    buffer = b''
+    offset = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - offset < max_size:
+            data = fileobj.read(max(read_size, max_size))
+            if data:
+                buffer = buffer[offset:] + data
+                offset = 0
+                continue
+            eof = True
+
+        if offset >= len(buffer):
+            return
+        end = find_boundary(buffer, offset, len(buffer), min_size, avg_size, max_size, mask_s, mask_l)
+        yield buffer[offset:end]
+        offset = end
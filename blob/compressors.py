@@ -0,0 +1,32 @@
+import bz2
+import functools
+import lzma
+import zlib
+
+from blob.exceptions import CompressorError
+
+
+# name -> (compress, decompress, name of level parameter of compress)
+compressors = {
+    'zlib': (zlib.compress, zlib.decompress, 'level'),
+    'lzma': (lzma.compress, lzma.decompress, 'preset'),
+    'bz2': (bz2.compress, bz2.decompress, 'compresslevel'),
+}
+
+
+def register_compressor(name: str, compress, decompress, level_parameter: str = None):
+    compressors[name] = (compress, decompress, level_parameter)
+
+
+def get_compressor(name: str, level: int = None):
+    # returns (compress, decompress) pair
+    try:
+        compress, decompress, level_parameter = compressors[name]
+    except KeyError:
+        raise CompressorError('unknown compressor')
+
+    if level is not None:
+        if level_parameter is None:
+            raise CompressorError('compressor does not support level')
+        compress = functools.partial(compress, **{level_parameter: level})
+    return compress, decompress
@@ -8,3 +8,11 @@ class BackendError(BlobError):
 
 class StorageBackendError(BackendError):
     pass
+
+
+class HasherError(BlobError):
+    pass
+
+
+class CompressorError(BlobError):
+    pass
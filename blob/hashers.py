@@ -1,5 +1,70 @@
+import functools
 import hashlib
+import zlib
+
+from blob.exceptions import HasherError
 
 
 def sha256(data: bytes):
     return hashlib.sha256(data).hexdigest()
+
+
+def blake2b(data: bytes, digest_size=64):
+    return hashlib.blake2b(data, digest_size=digest_size).digest()
+
+
+def blake2s(data: bytes, digest_size=32):
+    return hashlib.blake2s(data, digest_size=digest_size).digest()
+
+
+def crc32(data: bytes):
+    # short fast digest, only usable as prefilter with read-back comparison
+    return zlib.crc32(data).to_bytes(4, 'little')
+
+
+hashers = {
+    'sha256': sha256,
+    'blake2b': blake2b,
+    'blake2s': blake2s,
+    'crc32': crc32,
+}
+
+# hashers strong enough to trust without comparing block contents
+strong_hashers = {sha256, blake2b, blake2s}
+
+# hashers accepting digest_size to truncate digest
+sized_hashers = {blake2b, blake2s}
+
+# shortest digest in bytes of strong hasher which is still trusted
+min_strong_digest_size = 16
+
+
+def register_hasher(name: str, hasher, strong=False, sized=False):
+    hashers[name] = hasher
+    if strong:
+        strong_hashers.add(hasher)
+    if sized:
+        sized_hashers.add(hasher)
+
+
+def get_hasher(name: str, digest_size: int = None):
+    try:
+        hasher = hashers[name]
+    except KeyError:
+        raise HasherError('unknown hasher')
+
+    if digest_size is not None:
+        if hasher not in sized_hashers:
+            raise HasherError('hasher does not support digest_size')
+        hasher = functools.partial(hasher, digest_size=digest_size)
+    return hasher
+
+
+def is_strong(hasher):
+    # strong hasher truncated below min_strong_digest_size is not
+    if isinstance(hasher, functools.partial):
+        digest_size = hasher.keywords.get('digest_size')
+        if digest_size is not None and digest_size < min_strong_digest_size:
+            return False
+        hasher = hasher.func
+    return hasher in strong_hashers
@@ -0,0 +1,87 @@
+import threading
+
+
+class Histogram:
+    # latencies in power of two buckets of microseconds: bucket i counts values in [2 ** (i - 1), 2 ** i) us
+    num_of_buckets = 40
+
+    def __init__(self):
+        self.buckets = [0] * self.num_of_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        bucket = min(int(seconds * 10 ** 6).bit_length(), self.num_of_buckets - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def get_percentile(self, q: float):
+        # upper bound of bucket containing q-th value, in seconds
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(2 ** bucket / 10 ** 6, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            'p50': self.get_percentile(0.5),
+            'p99': self.get_percentile(0.99),
+            'buckets': list(self.buckets),
+        }
+
+
+class Metrics:
+    # counters and per-phase latency histograms shared by components of one storage stack,
+    # sinks are callables receiving (kind, name, value) for every event, kind is 'count' or 'observe';
+    # components keep metrics None by default and skip all timing then
+    def __init__(self, sinks=()):
+        self.lock = threading.Lock()
+        self.counters = dict()
+        self.histograms = dict()
+        self.sinks = list(sinks)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def count(self, name: str, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for sink in self.sinks:
+            sink('count', name, value)
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            try:
+                histogram = self.histograms[name]
+            except KeyError:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+        for sink in self.sinks:
+            sink('observe', name, seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict((name, histogram.snapshot()) for name, histogram in self.histograms.items()),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
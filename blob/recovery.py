@@ -0,0 +1,145 @@
+import argparse
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from blob.backends.key_value import LogKVStorage
+from blob.backends.mapped import MappedKVStorage, write_index
+from blob.backends.storage import FileStorage
+from blob.exceptions import StorageBackendError
+from blob.hashers import get_hasher
+
+# maps of DedupeProxy derived from by_address and block contents
+derived_maps = ['by_hash', 'by_storage_address', 'links']
+
+
+def hash_slots(file_name: str, block_size: int, slots: list, hasher):
+    # (storage address, hash) of blocks of one blob file, slots are (storage address, block, length)
+    result = []
+    with open(file_name, 'rb') as file:
+        for storage_address, block, length in slots:
+            # data is aligned to the end of the slot, see FileStorage.get_data
+            data = os.pread(file.fileno(), length, block * block_size + block_size - length)
+            result.append((storage_address, hasher(data)))
+    return result
+
+
+def check_index(path: str, block_size: int, blob_size: int):
+    # returns list of inconsistencies between maps of mapped volume, empty when index is usable
+    kv_storage = MappedKVStorage.factory(path)
+    storage = FileStorage(block_size, blob_size, path, kv_storage)
+    maps = dict()
+    try:
+        for name in ['by_address'] + derived_maps:
+            maps[name] = kv_storage(name)
+        problems = []
+        counts = Counter(maps['by_address'][address] for address in maps['by_address'].keys())
+        stored = set(storage.blocks_metadata.keys())
+        for name in ('by_storage_address', 'links'):
+            if set(maps[name].keys()) != stored:
+                problems.append('{} does not match blocks_metadata'.format(name))
+        if set(counts) - stored:
+            problems.append('by_address points to missing blocks')
+        for storage_address in maps['links'].keys():
+            if maps['links'][storage_address] != counts[storage_address]:
+                problems.append('links do not match by_address')
+                break
+        for storage_address in maps['by_storage_address'].keys():
+            block_hash = maps['by_storage_address'][storage_address]
+            if block_hash not in maps['by_hash'] or storage_address not in maps['by_hash'][block_hash]:
+                problems.append('by_hash does not match by_storage_address')
+                break
+        return problems
+    finally:
+        for kv in maps.values():
+            kv.close()
+        storage.close()
+
+
+def rebuild_index(path: str, block_size: int, blob_size: int, hasher='sha256', digest_size: int = None,
+                  workers: int = None):
+    # rebuilds derived maps of closed mapped volume by rehashing blocks of blob files in parallel,
+    # by_address and blocks_metadata are trusted: addresses pointing to missing blocks are dropped
+    # and blocks no address points to are freed; returns counts of blocks, dangling addresses and orphans
+    kv_storage = MappedKVStorage.factory(path)
+    hasher = get_hasher(hasher, digest_size)
+    storage = FileStorage(block_size, blob_size, path, kv_storage)
+    by_address = kv_storage('by_address')
+    try:
+        counts = Counter()
+        dangling = 0
+        for address in list(by_address.keys()):
+            storage_address = by_address[address]
+            if storage_address in storage.blocks_metadata:
+                counts[storage_address] += 1
+            else:
+                del by_address[address]
+                dangling += 1
+
+        by_blob = dict()
+        orphans = 0
+        for storage_address in list(storage.blocks_metadata.keys()):
+            if storage_address not in counts:
+                storage.del_data(storage_address)
+                orphans += 1
+                continue
+            length = storage.blocks_metadata[storage_address]
+            if type(length) is not int:
+                raise StorageBackendError('only FileStorage volumes can be rebuilt')
+            blob, block = storage.get_physical_address(storage_address)
+            by_blob.setdefault(blob, []).append((storage_address, block, length))
+
+        by_hash = dict()
+        by_storage_address = dict()
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(hash_slots, storage.get_file_name(blob), block_size, slots, hasher)
+                       for blob, slots in sorted(by_blob.items())]
+            for future in futures:
+                for storage_address, block_hash in future.result():
+                    by_storage_address[storage_address] = block_hash
+                    by_hash.setdefault(block_hash, []).append(storage_address)
+    finally:
+        by_address.close()
+        storage.close()
+
+    for name, items in (('by_hash', by_hash.items()), ('by_storage_address', by_storage_address.items()),
+                        ('links', counts.items())):
+        # stale logs are removed first, crash before new checkpoint is written leaves index stale, not wrong
+        for suffix in ('.log', LogKVStorage.checkpoint_suffix):
+            if os.path.exists(os.path.join(path, name + suffix)):
+                os.remove(os.path.join(path, name + suffix))
+        write_index(os.path.join(path, name + MappedKVStorage.checkpoint_suffix), items)
+    return {'blocks': len(by_storage_address), 'dangling': dangling, 'orphans': orphans}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and rebuild hash index of closed mapped volume')
+    parser.add_argument('path')
+    parser.add_argument('--block-size', type=int, required=True)
+    parser.add_argument('--blob-size', type=int, required=True)
+    parser.add_argument('--hasher', default='sha256')
+    parser.add_argument('--digest-size', type=int)
+    parser.add_argument('--workers', type=int, help='processes hashing blob files, number of CPUs by default')
+    parser.add_argument('--check', action='store_true', help='only report inconsistencies')
+    parser.add_argument('--force', action='store_true', help='rebuild even if index is consistent')
+    args = parser.parse_args()
+
+    try:
+        problems = check_index(args.path, args.block_size, args.blob_size)
+    except StorageBackendError as error:
+        problems = [str(error)]
+    for problem in problems:
+        print(problem)
+    if args.check or not (problems or args.force):
+        print('index is consistent' if not problems else 'index is stale')
+        return 1 if problems else 0
+
+    result = rebuild_index(args.path, args.block_size, args.blob_size, args.hasher, args.digest_size, args.workers)
+    print('rebuilt index of {blocks} blocks, dropped {dangling} dangling addresses, '
+          'freed {orphans} orphan blocks'.format(**result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
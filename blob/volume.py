@@ -0,0 +1,170 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from blob.backends.cache import BlockCache, CachedStorage
+from blob.backends.compact import CompactKVStorage
+from blob.backends.key_value import DictKVStorage, LogKVStorage
+from blob.backends.mapped import MappedKVStorage
+from blob.backends.packed import PackedStorage
+from blob.backends.pool import FilePool
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.backends.stream import StreamStore
+from blob.backends.wal import LoggedStorage
+from blob.exceptions import BlobError, StorageBackendError
+from blob.hashers import get_hasher
+from blob.metrics import Metrics
+
+shared_resources = None
+shared_resources_lock = threading.Lock()
+
+
+class Resources:
+    # process-wide resources shared by volumes: pool of open blob files, budget of block cache,
+    # threads hashing write batches and threads prefetching blocks of volumes with read-ahead;
+    # cache_size 0 disables cache, hash_workers 0 hashes in caller
+    def __init__(self, pool_size=64, cache_size=0, hash_workers=0, use_mmap=False, read_ahead_workers=2):
+        if not isinstance(hash_workers, int) or hash_workers < 0:
+            raise BlobError('incorrect hash_workers')
+
+        self.pool = FilePool(pool_size, use_mmap)
+        self.cache = BlockCache(cache_size) if cache_size > 0 else None
+        self.hash_workers = hash_workers
+        self.hash_executor = ThreadPoolExecutor(hash_workers) if hash_workers > 0 else None
+        self.read_ahead_executor = ThreadPoolExecutor(read_ahead_workers)  # threads start on first prefetch
+
+    def close(self):
+        if self.hash_executor is not None:
+            self.hash_executor.shutdown()
+        self.read_ahead_executor.shutdown()
+        if self.cache is not None:
+            self.cache.clear()
+        self.pool.close()
+
+
+def get_resources():
+    # resources shared by volumes opened without own ones, created on first use
+    global shared_resources
+    with shared_resources_lock:
+        if shared_resources is None:
+            shared_resources = Resources()
+        return shared_resources
+
+
+class Volume:
+    # independent handle of one volume, errors are raised instead of returned as codes;
+    # own_resources closes resources with volume, read_ahead is largest prefetch of sequential reads in blocks
+    def __init__(self, path: str, block_size: int, blob_size: int, persistent=False, hasher='sha256', verify=True,
+                 wal=False, compressor=None, compact=False, mapped=False, metrics_sink: Metrics = None,
+                 resources: Resources = None, own_resources=False, read_ahead=0):
+        if persistent and compact:
+            raise StorageBackendError('compact maps are not persistent')
+        if wal and not persistent:
+            raise StorageBackendError('write-ahead log needs persistent maps')
+
+        self.path = path
+        self.resources = resources if resources is not None else get_resources()
+        self.own_resources = own_resources
+        self.metrics = metrics_sink
+        self.streams = None
+
+        if compact:
+            kv_storage = CompactKVStorage()
+        elif persistent:
+            kv_storage = MappedKVStorage.factory(path) if mapped else LogKVStorage.factory(path)
+        else:
+            kv_storage = DictKVStorage
+        pool = self.resources.pool
+        if compressor is not None:
+            backend = PackedStorage(block_size, blob_size, path, kv_storage, compressor, metrics=metrics_sink,
+                                    pool=pool)
+        else:
+            backend = FileStorage(block_size, blob_size, path, kv_storage, metrics=metrics_sink, pool=pool)
+        if self.resources.cache is not None:
+            backend = CachedStorage(backend, cache=self.resources.cache)
+        self.proxy = DedupeProxy(backend, kv_storage, get_hasher(hasher), verify, metrics=metrics_sink,
+                                 hash_workers=self.resources.hash_workers,
+                                 hash_executor=self.resources.hash_executor, read_ahead=read_ahead,
+                                 read_ahead_executor=self.resources.read_ahead_executor)
+        self.storage = self.proxy
+        if block_size >= 64:
+            # largest chunks fill whole blocks, stream chunks bypass write-ahead log
+            avg_size = 2 ** min(13, (block_size // 4).bit_length() - 1) if block_size >= 256 else 64
+            self.streams = StreamStore(self.proxy, kv_storage, avg_size, max_size=min(block_size, avg_size * 4))
+        if wal:
+            self.storage = LoggedStorage(self.storage, path, block_size=block_size)
+
+    def get_block(self, block_id: int):
+        return self.storage.get_data(block_id)
+
+    def get_block_into(self, block_id: int, buffer):
+        # reads block straight into preallocated writable buffer, returns number of bytes read
+        return self.storage.get_data_into(block_id, buffer)
+
+    def get_blocks(self, block_ids: list):
+        return self.storage.get_data_batch(block_ids)
+
+    def put_block(self, block_id: int, block_data: bytes):
+        self.storage.put_data(block_id, block_data)
+
+    def put_blocks(self, blocks: list):
+        # blocks is a list of (block_id, block_data) pairs
+        self.storage.put_data_batch(blocks)
+
+    def get_streams(self):
+        if self.streams is None:
+            raise BlobError('streams need block_size of at least 64')
+        return self.streams
+
+    def put_stream(self, key, fileobj):
+        # stores object read from binary file object, see StreamStore
+        self.get_streams().put_stream(key, fileobj)
+
+    def get_stream(self, key):
+        # readable binary file object of stored object
+        return self.get_streams().get_stream(key)
+
+    def del_stream(self, key):
+        self.get_streams().del_stream(key)
+
+    def get_metrics(self):
+        # counters and latency histograms, see Metrics.snapshot
+        if self.metrics is None:
+            raise BlobError('metrics are not enabled')
+        return self.metrics.snapshot()
+
+    def get_read_ahead_stats(self):
+        # hits, misses, hit_rate, prefetched and wasted blocks of read-ahead, see ReadAhead.get_stats
+        if self.proxy.read_ahead is None:
+            raise BlobError('read-ahead is not enabled')
+        return self.proxy.read_ahead.get_stats()
+
+    def close(self):
+        if self.storage is None:
+            return
+        if self.streams is not None:
+            self.streams.close()
+        self.storage.close()
+        self.storage = None
+        self.streams = None
+        if self.own_resources:
+            self.resources.close()
+
+    def delete(self):
+        # closes volume and removes its files
+        self.close()
+        for file_name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, file_name))
+        os.rmdir(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_volume(path: str, block_size: int, blob_size: int, **options):
+    # options of Volume, volumes opened without resources share process-wide ones
+    return Volume(path, block_size, blob_size, **options)
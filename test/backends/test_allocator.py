@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+from blob.backends.allocator import Allocator
+from test.rand import rand_range, rand_weithed_bool
+
+
+def lowest_free(used):
+    address = 0
+    while address in used:
+        address += 1
+    return address
+
+
+class TestAllocator(TestCase):
+    def setUp(self):
+        self.used = dict()
+        self.allocator = Allocator(self.used)
+
+    def test_sequential(self):
+        for i in range(100):
+            address = self.allocator.get_free_address()
+            self.assertEqual(address, i)
+            self.used[address] = 1
+            self.allocator.use(address)
+
+    def test_release(self):
+        for address in range(10):
+            self.used[address] = 1
+            self.allocator.use(address)
+
+        for address in (7, 3, 5):
+            del self.used[address]
+            self.allocator.release(address)
+
+        for expected in (3, 5, 7, 10):
+            with self.subTest('lowest free address: expected={}'.format(expected)):
+                address = self.allocator.get_free_address()
+                self.assertEqual(address, expected)
+                self.used[address] = 1
+                self.allocator.use(address)
+
+    def test_random(self):
+        num_of_tests = 2000
+        for i in range(num_of_tests):
+            if rand_weithed_bool(0.3):
+                address = self.allocator.get_free_address()
+            else:
+                address = rand_range(200)
+
+            if address in self.used and rand_weithed_bool(0.5):
+                del self.used[address]
+                self.allocator.release(address)
+            else:
+                self.used[address] = 1
+                self.allocator.use(address)
+
+            with self.subTest('random test: step={}'.format(i)):
+                self.assertEqual(self.allocator.get_free_address(), lowest_free(self.used))
+
+    def test_rebuild(self):
+        for address in (0, 1, 2, 5, 6, 9, 20):
+            self.used[address] = 1
+        self.allocator.rebuild(self.used.keys())
+
+        for expected in (3, 4, 7, 8, 10, 11):
+            with self.subTest('lowest free address after rebuild: expected={}'.format(expected)):
+                address = self.allocator.get_free_address()
+                self.assertEqual(address, expected)
+                self.used[address] = 1
+                self.allocator.use(address)
+
+    def test_get_free_addresses(self):
+        for address in (0, 1, 3, 4, 6):
+            self.used[address] = 1
+            self.allocator.use(address)
+        del self.used[1]
+        self.allocator.release(1)
+
+        with self.subTest('lowest free addresses'):
+            self.assertEqual(self.allocator.get_free_addresses(5), [1, 2, 5, 7, 8])
+
+        with self.subTest('addresses are not reserved'):
+            self.assertEqual(self.allocator.get_free_address(), 1)
+            self.assertEqual(self.allocator.get_free_addresses(2), [1, 2])
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+from blob.backends.bloom import BloomFilter
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.exceptions import BackendError
+from blob.hashers import sha256
+from test.backends.test_proxy import StubStorage
+from test.rand import rand_bytes, rand_range
+
+
+class TestBloomFilter(TestCase):
+    def setUp(self):
+        self.expected_items = 1000
+        self.bloom_filter = BloomFilter(self.expected_items, 0.01)
+
+    def test_contains(self):
+        keys = [sha256(bytes([i % 256, i // 256])) for i in range(self.expected_items)]
+        for key in keys:
+            self.bloom_filter.add(key)
+
+        with self.subTest('no false negatives'):
+            self.assertTrue(all(key in self.bloom_filter for key in keys))
+
+        with self.subTest('false positive rate close to requested'):
+            others = [sha256(bytes([i % 256, i // 256, 0])) for i in range(10000)]
+            false_positives = sum(key in self.bloom_filter for key in others)
+            self.assertLess(false_positives / len(others), 0.03)
+            self.assertAlmostEqual(self.bloom_filter.get_false_positive_rate(), 0.01, delta=0.005)
+
+    def test_remove(self):
+        key = sha256(rand_bytes(8))
+        self.bloom_filter.add(key)
+        self.bloom_filter.add(b'raw digest')
+        self.bloom_filter.remove(key)
+        self.assertNotIn(key, self.bloom_filter)
+        self.assertIn(b'raw digest', self.bloom_filter)
+        self.assertEqual(self.bloom_filter.count, 1)
+
+    def test_rebuild(self):
+        self.bloom_filter.add('stale')
+        self.bloom_filter.rebuild(['a', 'b'])
+        self.assertNotIn('stale', self.bloom_filter)
+        self.assertIn('a', self.bloom_filter)
+        self.assertEqual(self.bloom_filter.count, 2)
+
+    def test_incorrect_parameters(self):
+        with self.assertRaises(BackendError):
+            BloomFilter(0)
+        with self.assertRaises(BackendError):
+            BloomFilter(10, 1.5)
+
+
+class TestDedupeProxyBloomFilter(TestCase):
+    def setUp(self):
+        self.stub = StubStorage()
+        self.storage = DedupeProxy(self.stub, DictKVStorage, expected_blocks=100)
+
+    def test_dedupe(self):
+        blocks = [rand_bytes(8, unique=True) for i in range(10)]
+        data = dict()
+        for i in range(500):
+            address = rand_range(50)
+            data[address] = blocks[rand_range(len(blocks))]
+            self.storage.put_data(address, data[address])
+
+        with self.subTest('data is deduplicated'):
+            self.assertEqual(len(self.stub.data), len(set(data.values())))
+            for address, block in data.items():
+                self.assertEqual(self.storage.get_data(address), block)
+
+        with self.subTest('filter follows hash index'):
+            self.assertEqual(self.storage.bloom_filter.count, len(self.storage.by_hash.keys()))
+
+    def test_definite_miss(self):
+        self.storage.by_hash[sha256(b'unknown')] = [0]  # not known to filter
+        self.assertIsNone(self.storage.check_duplicate(b'unknown', sha256(b'unknown')))
+
+        self.storage.rebuild_bloom_filter()
+        with self.assertRaises(KeyError):
+            self.storage.check_duplicate(b'unknown', sha256(b'unknown'))  # lookup reaches storage
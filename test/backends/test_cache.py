@@ -0,0 +1,100 @@
+from unittest import TestCase
+
+from blob.backends.cache import CachedStorage
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from test.backends.test_proxy import StubStorage
+from test.rand import rand_bytes, rand_range
+
+
+class CountingStorage(StubStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get_data(self, address):
+        self.reads += 1
+        return super().get_data(address)
+
+
+class TestCachedStorage(TestCase):
+    def setUp(self):
+        self.stub = CountingStorage()
+        self.storage = CachedStorage(self.stub, 32)
+
+    def test_get_data(self):
+        test_data = rand_bytes(8)
+        self.storage.put_data(0, test_data)
+        for i in range(5):
+            self.assertEqual(self.storage.get_data(0), test_data)
+
+        with self.subTest('storage read once'):
+            self.assertEqual(self.stub.reads, 1)
+            self.assertEqual((self.storage.hits, self.storage.misses), (4, 1))
+
+    def test_invalidation(self):
+        self.storage.put_data(0, rand_bytes(8))
+        self.storage.get_data(0)
+
+        with self.subTest('put invalidates cached block'):
+            test_data = rand_bytes(8)
+            self.storage.put_data(0, test_data)
+            self.assertEqual(self.storage.get_data(0), test_data)
+
+        with self.subTest('del invalidates cached block'):
+            self.storage.del_data(0)
+            self.assertNotIn(0, self.storage.blocks)
+            self.assertEqual(self.storage.size, 0)
+
+        with self.subTest('inserted block is not replaced by read in progress'):
+            stale_data, test_data = rand_bytes(8), rand_bytes(8)
+            self.storage.put_data(1, stale_data)
+            get_data = self.stub.get_data
+
+            def get_data_inserting(address):
+                self.storage.insert(address, test_data)
+                return get_data(address)
+
+            self.stub.get_data = get_data_inserting
+            self.assertEqual(self.storage.get_data(1), stale_data)
+            self.stub.get_data = get_data
+            self.assertEqual(self.storage.get_data(1), test_data)
+            self.storage.invalidate(1)
+            self.assertNotIn(1, self.storage.blocks)
+            self.assertEqual(self.storage.size, 0)
+
+    def test_budget(self):
+        for address in range(10):
+            self.storage.put_data(address, rand_bytes(8))
+            self.storage.get_data(address)
+
+        with self.subTest('cache size is within budget'):
+            self.assertEqual(self.storage.size, 32)
+            self.assertEqual(list(self.storage.blocks), [6, 7, 8, 9])
+            self.assertEqual(self.storage.evictions, 6)
+
+        with self.subTest('least recently used block is evicted'):
+            self.storage.get_data(6)
+            self.storage.get_data(0)
+            self.assertEqual(list(self.storage.blocks), [8, 9, 6, 0])
+
+    def test_get_data_batch(self):
+        data = dict((address, rand_bytes(8)) for address in range(6))
+        self.storage.put_data_batch(data.items())
+        self.storage.get_data(0)
+        addresses = [0, 1, 1, 2]
+        self.assertEqual(self.storage.get_data_batch(addresses), [data[a] for a in addresses])
+        self.assertEqual((self.storage.hits, self.storage.misses), (1, 3))
+
+    def test_dedupe_proxy(self):
+        proxy = DedupeProxy(self.storage, DictKVStorage)
+        test_data = rand_bytes(8)
+        for address in range(10):
+            proxy.put_data(address, test_data)
+
+        for i in range(20):
+            self.assertEqual(proxy.get_data(rand_range(10)), test_data)
+
+        with self.subTest('one cached copy serves every deduplicated address'):
+            self.assertEqual(len(self.storage.blocks), 1)
+            self.assertEqual(self.stub.reads, 1)
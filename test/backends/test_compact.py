@@ -0,0 +1,139 @@
+from unittest import TestCase
+
+from blob.backends.compact import ArrayKVStorage, DigestArrayKVStorage, HashIndexKVStorage, CompactKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.hashers import get_hasher
+from test.backends.test_proxy import StubStorage
+from test.rand import rand_bytes, rand_range
+
+
+class TestArrayKVStorage(TestCase):
+    def setUp(self):
+        self.storage = ArrayKVStorage()
+
+    def test_matches_dict(self):
+        data = dict()
+        values = [0, 1, 255, 300, 2 ** 20, 2 ** 40, -1, 'value', (1, 2, 3, None)]
+        keys = list(range(100)) + [5000, -3, 'key', (1, 2)]
+        for i in range(3000):
+            key = keys[rand_range(len(keys))]
+            if key in data and rand_range(3) == 0:
+                del data[key]
+                del self.storage[key]
+            else:
+                data[key] = values[rand_range(len(values))]
+                self.storage[key] = data[key]
+
+        with self.subTest('same items'):
+            self.assertEqual(dict((key, self.storage[key]) for key in self.storage.keys()), data)
+            self.assertEqual(len(self.storage.keys()), len(data))
+            for key in keys:
+                self.assertEqual(key in self.storage, key in data)
+
+        with self.subTest('missing key'):
+            missing = [key for key in keys if key not in data] + [100000]
+            with self.assertRaises(KeyError):
+                self.storage[missing[0]]
+
+    def test_widening(self):
+        self.storage[0] = 1
+        self.storage[1] = 2 ** 16
+        with self.subTest('item type grows with value'):
+            self.assertEqual(self.storage.data.typecode, 'I')
+            self.assertEqual([self.storage[0], self.storage[1]], [1, 2 ** 16])
+            self.assertEqual(len(self.storage.overflow), 0)
+
+        with self.subTest('missing keys stay missing'):
+            self.storage[3] = 5
+            self.storage[1] = 2 ** 33
+            self.assertNotIn(2, self.storage)
+            self.assertEqual(list(self.storage.keys()), [0, 1, 3])
+
+
+class TestHashIndexKVStorage(TestCase):
+    def setUp(self):
+        self.digests = DigestArrayKVStorage()
+        self.storage = HashIndexKVStorage(self.digests)
+
+    def test_matches_dict(self):
+        hashes = [rand_bytes(16, unique=True) for i in range(500)]
+        data = dict()
+        free = list(range(2000))
+        for i in range(5000):
+            block_hash = hashes[rand_range(len(hashes))]
+            if block_hash in data and rand_range(2):
+                free.extend(data.pop(block_hash))
+                del self.storage[block_hash]
+            else:
+                if block_hash in data:
+                    free.extend(data[block_hash])
+                count = 1 if rand_range(10) else 2
+                data[block_hash] = [free.pop(rand_range(len(free))) for j in range(count)]
+                self.storage[block_hash] = data[block_hash]
+
+            if i % 500 == 0:
+                with self.subTest('same items: step={}'.format(i)):
+                    for block_hash in hashes:
+                        self.assertEqual(block_hash in self.storage, block_hash in data)
+                        if block_hash in data:
+                            self.assertEqual(self.storage[block_hash], data[block_hash])
+
+        with self.subTest('keys'):
+            self.assertEqual(set(self.storage.keys()), set(data))
+            self.assertEqual(len(self.storage.keys()), len(data))
+
+        with self.subTest('table is not full'):
+            self.assertLessEqual(self.storage.count * 4, len(self.storage.table) * 3)
+
+    def test_other_keys(self):
+        self.storage[b'0' * 16] = [1]
+        self.storage['hex digest'] = [2]
+        self.storage[b'short'] = [3]
+        with self.subTest('non-conforming keys kept aside'):
+            self.assertEqual(self.storage['hex digest'], [2])
+            self.assertEqual(self.storage[b'short'], [3])
+            self.assertEqual(len(self.storage.overflow), 2)
+        with self.subTest('missing key'):
+            with self.assertRaises(KeyError):
+                self.storage[b'1' * 16]
+
+
+class TestCompactProxy(TestCase):
+    def test_dedupe(self):
+        for hasher, digest_size, verify in [('blake2b', 16, False), ('crc32', None, True), ('sha256', None, True)]:
+            stub = StubStorage()
+            proxy = DedupeProxy(stub, CompactKVStorage(), get_hasher(hasher, digest_size), verify)
+            blocks = [rand_bytes(8, unique=True) for i in range(50)]
+            data = dict()
+            for i in range(2000):
+                address = rand_range(500)
+                if address in data and rand_range(4) == 0:
+                    del data[address]
+                    proxy.del_data(address)
+                else:
+                    data[address] = blocks[rand_range(len(blocks))]
+                    proxy.put_data(address, data[address])
+
+            with self.subTest('same data: hasher={}'.format(hasher)):
+                for address in range(500):
+                    if address in data:
+                        self.assertEqual(proxy.get_data(address), data[address])
+                    else:
+                        self.assertNotIn(address, proxy.by_address)
+
+            with self.subTest('deduplicated: hasher={}'.format(hasher)):
+                self.assertEqual(sorted(stub.data.values()), sorted(set(data.values())))
+                for storage_address in proxy.by_storage_address.keys():
+                    self.assertEqual(proxy.by_hash[proxy.by_storage_address[storage_address]], [storage_address])
+
+    def test_crc32_collision(self):
+        first, second = b'\x9e\x07\xf6\x9fa\x01C,', b'!\x9d:\x06)\xd1Jw'  # same crc32
+        stub = StubStorage()
+        proxy = DedupeProxy(stub, CompactKVStorage(), get_hasher('crc32'))
+        self.assertEqual(proxy.hasher(first), proxy.hasher(second))
+        proxy.put_data_batch([(0, first), (1, second)])
+        self.assertEqual(proxy.get_data_batch([0, 1]), [first, second])
+        self.assertEqual(len(proxy.by_hash[proxy.hasher(first)]), 2)
+        proxy.del_data(0)
+        self.assertEqual(proxy.by_hash[proxy.hasher(first)], [proxy.by_address[1]])
+        self.assertEqual(proxy.get_data(1), second)
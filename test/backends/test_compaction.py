@@ -0,0 +1,103 @@
+from unittest import TestCase
+import os
+
+from blob.backends.cache import CachedStorage
+from blob.backends.compaction import Compactor
+from blob.backends.key_value import DictKVStorage
+from blob.backends.packed import PackedStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.exceptions import BackendError
+from test.rand import rand_bytes, rand_range
+
+
+class TestCompactor(TestCase):
+    def setUp(self):
+        self.block_size = 16
+        self.blob_size = 8
+        self.path = './blob_test_storage'
+        self.storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage)
+        self.proxy = DedupeProxy(self.storage, DictKVStorage)
+
+        # 4 blobs, then making most of blocks duplicates of few of them
+        self.data = dict()
+        for address in range(self.blob_size * 4):
+            self.data[address] = rand_bytes(self.block_size, unique=True)
+            self.proxy.put_data(address, self.data[address])
+        for address in range(self.blob_size * 4):
+            if address % 4:
+                self.data[address] = self.data[address - address % 4]
+                self.proxy.put_data(address, self.data[address])
+
+    def tearDown(self):
+        self.proxy.close()
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def check_data(self):
+        for address, block in self.data.items():
+            self.assertEqual(self.proxy.get_data(address), block)
+
+    def check_live_blocks(self):
+        live_blocks = dict((blob, 0) for blob in self.storage.blobs.keys())
+        for address in self.storage.blocks_metadata.keys():
+            live_blocks[address // self.blob_size] += 1
+        self.assertEqual(self.storage.get_live_blocks(), live_blocks)
+
+    def test_run(self):
+        compactor = Compactor(self.proxy, batch_size=5)
+        self.check_live_blocks()
+        moved = compactor.run()
+
+        with self.subTest('data is intact'):
+            self.check_data()
+
+        with self.subTest('blob files removed'):
+            self.assertGreater(moved, 0)
+            self.assertEqual(len(os.listdir(self.path)), 1)
+            self.assertEqual(list(self.storage.blobs.keys()), [0])
+
+        with self.subTest('indexes are consistent'):
+            for storage_address in self.proxy.links.keys():
+                self.assertEqual(self.proxy.links[storage_address],
+                                 self.proxy.by_address.count_links(storage_address))
+                self.assertIn(storage_address, self.storage.blocks_metadata)
+            self.assertEqual(set(self.proxy.by_storage_address.keys()), set(self.storage.blocks_metadata.keys()))
+            self.check_live_blocks()
+
+    def test_step(self):
+        compactor = Compactor(self.proxy)
+        queued = compactor.plan()
+        with self.subTest('step is limited'):
+            self.assertEqual(compactor.step(2), 2)
+            self.check_data()
+
+        with self.subTest('foreground writes between steps'):
+            for i in range(20):
+                address = rand_range(self.blob_size * 4)
+                self.data[address] = self.data[rand_range(self.blob_size * 4)]
+                self.proxy.put_data(address, self.data[address])
+            while compactor.queue:
+                compactor.step(2)
+            self.check_data()
+            self.assertLessEqual(compactor.moved + compactor.skipped, queued)
+
+    def test_rate(self):
+        compactor = Compactor(self.proxy, rate=10 ** 6)
+        compactor.run(max_blocks=1)
+        self.check_data()
+
+    def test_storage(self):
+        with self.subTest('file storage below cache'):
+            proxy = DedupeProxy(CachedStorage(self.storage, 1024), DictKVStorage)
+            self.assertIs(Compactor(proxy).storage, self.storage)
+
+        with self.subTest('storage which is not slot-addressed'):
+            packed = PackedStorage(self.block_size, self.blob_size, self.path + '/packed', DictKVStorage)
+            try:
+                with self.assertRaises(BackendError):
+                    Compactor(DedupeProxy(packed, DictKVStorage))
+            finally:
+                packed.close()
+                os.rmdir(self.path + '/packed')
@@ -0,0 +1,201 @@
+from unittest import TestCase
+import os
+import sys
+import threading
+
+from blob.backends.cache import CachedStorage
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from test.rand import rand_bytes, rand_range
+
+
+class TestConcurrency(TestCase):
+    def setUp(self):
+        self.block_size = 64
+        self.blob_size = 8
+        self.path = './blob_test_storage'
+        self.num_of_threads = 8
+        self.num_of_tests = 300
+        self.blocks = [rand_bytes(self.block_size, unique=True) for i in range(16)]
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # more thread switches
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def stress(self, proxy):
+        errors = []
+        data = dict()
+
+        def worker(number):
+            try:
+                # every thread owns its range of addresses, blocks are shared between threads
+                addresses = range(number * 20, number * 20 + 20)
+                for i in range(self.num_of_tests):
+                    address = addresses[rand_range(len(addresses))]
+                    if rand_range(4):
+                        block = self.blocks[rand_range(len(self.blocks))]
+                        if rand_range(2):
+                            proxy.put_data(address, block)
+                        else:
+                            proxy.put_data_batch([(address, block), (address + 1 - 2 * (address % 2), block)])
+                            data[address + 1 - 2 * (address % 2)] = block
+                        data[address] = block
+                    elif address in data:
+                        got_data = proxy.get_data(address)
+                        if got_data != data[address]:
+                            errors.append((address, got_data, data[address]))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(self.num_of_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return data, errors
+
+    def check(self, proxy, storage, data, errors):
+        with self.subTest('no errors in threads'):
+            self.assertEqual(errors, [])
+
+        with self.subTest('data is consistent'):
+            for address, block in data.items():
+                self.assertEqual(proxy.get_data(address), block)
+
+        with self.subTest('data is deduplicated'):
+            self.assertEqual(len(storage.blocks_metadata.keys()), len(set(data.values())))
+
+        with self.subTest('indexes are consistent'):
+            self.assertEqual(proxy.in_flight, dict())
+            self.assertEqual(proxy.pins, dict())
+            self.assertEqual(proxy.deferred, set())
+            for storage_address in proxy.links.keys():
+                self.assertEqual(proxy.links[storage_address], proxy.by_address.count_links(storage_address))
+            self.assertEqual(set(proxy.by_storage_address.keys()), set(storage.blocks_metadata.keys()))
+
+    def test_file_storage(self):
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, pool_size=2)
+        proxy = DedupeProxy(storage, DictKVStorage)
+        data, errors = self.stress(proxy)
+        self.check(proxy, storage, data, errors)
+        proxy.close()
+
+    def test_cached_storage(self):
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, use_mmap=True)
+        proxy = DedupeProxy(CachedStorage(storage, self.block_size * 4), DictKVStorage)
+        data, errors = self.stress(proxy)
+        self.check(proxy, storage, data, errors)
+        proxy.close()
+
+    def test_parallel_blobs(self):
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, pool_size=2)
+        errors = []
+
+        def worker(blob):
+            try:
+                for i in range(self.num_of_tests):
+                    address = blob * self.blob_size + rand_range(self.blob_size)
+                    block = self.blocks[rand_range(len(self.blocks))]
+                    storage.put_data(address, block)
+                    if storage.get_data(address) != block:
+                        errors.append(address)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(blob,)) for blob in range(self.num_of_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        storage.close()
+
+    def test_atomic_one_blob(self):
+        # rewrites of one blob by replacing its file lose concurrent writes unless blob lock serializes them
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, atomic=True)
+        errors = []
+        data = dict()
+
+        def worker(block):
+            try:
+                for i in range(30):
+                    block_data = self.blocks[rand_range(len(self.blocks))]
+                    storage.put_data(block, block_data)
+                    data[block] = block_data
+                    if storage.get_data(block) != block_data:
+                        errors.append(block)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(block,)) for block in range(self.blob_size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(dict((block, storage.get_data(block)) for block in data), data)
+        storage.close()
+
+    def test_parallel_reads_one_blob(self):
+        # reads of one blob share its lock, both readers have to be inside read at once to pass barrier
+        for use_mmap in (False, True):
+            storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, use_mmap=use_mmap)
+            storage.put_data_batch([(0, self.blocks[0]), (1, self.blocks[1])])
+            barrier = threading.Barrier(2, timeout=5)
+            read = storage.pool.read
+            errors = []
+
+            def barrier_read(*args):
+                barrier.wait()
+                return read(*args)
+
+            def reader(address):
+                try:
+                    if storage.get_data(address) != self.blocks[address]:
+                        errors.append(address)
+                except Exception as e:
+                    errors.append(e)
+
+            storage.pool.read = barrier_read
+            threads = [threading.Thread(target=reader, args=(address,)) for address in (0, 1)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with self.subTest('readers of one blob run in parallel: use_mmap={}'.format(use_mmap)):
+                self.assertEqual(errors, [])
+            storage.close()
+
+    def test_read_back_outside_lock(self):
+        # verifying duplicate reads stored block back, other reads and writes do not wait for it
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage)
+        proxy = DedupeProxy(storage, DictKVStorage)
+        proxy.put_data_batch([(0, self.blocks[0]), (1, self.blocks[1])])
+        reading = threading.Event()
+        release = threading.Event()
+        get_data_batch = storage.get_data_batch
+
+        def slow_get_data_batch(addresses):
+            reading.set()
+            release.wait(5)
+            return get_data_batch(addresses)
+
+        storage.get_data_batch = slow_get_data_batch
+        writer = threading.Thread(target=proxy.put_data, args=(2, self.blocks[0]))
+        writer.start()
+        try:
+            self.assertTrue(reading.wait(5))
+            self.assertEqual(proxy.get_data(1), self.blocks[1])
+            proxy.put_data(3, self.blocks[3])
+            self.assertTrue(writer.is_alive())
+        finally:
+            release.set()
+            writer.join()
+        self.assertEqual(proxy.by_address[2], proxy.by_address[0])
+        self.assertEqual(proxy.pins, dict())
+        proxy.close()
@@ -0,0 +1,113 @@
+from unittest import TestCase
+import os
+
+from blob.backends.key_value import LogKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from test.rand import rand_bytes, rand_range
+
+
+class TestLogKVStorage(TestCase):
+    def setUp(self):
+        self.path = './blob_test_storage'
+        self.kv_storage = LogKVStorage.factory(self.path, checkpoint_interval=100)
+        self.storage = self.kv_storage('test')
+
+    def tearDown(self):
+        self.storage.close()
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def reopen(self):
+        self.storage.close()
+        self.storage = self.kv_storage('test')
+
+    def test_persistence(self):
+        data = dict()
+        for i in range(1000):
+            key = rand_range(200)
+            if key in data and rand_range(2):
+                del data[key]
+                del self.storage[key]
+            else:
+                data[key] = [rand_range(100)]
+                self.storage[key] = data[key]
+
+        with self.subTest('same data after reopen'):
+            self.reopen()
+            self.assertEqual(self.storage.data, data)
+
+        with self.subTest('same data after replaying log without checkpoint'):
+            self.storage['extra'] = 'value'
+            data['extra'] = 'value'
+            self.storage.log.close()  # emulating crash
+            self.storage = self.kv_storage('test')
+            self.assertEqual(self.storage.data, data)
+
+    def test_checkpoint(self):
+        for i in range(250):
+            self.storage[i % 10] = i
+
+        with self.subTest('log is compacted into checkpoint'):
+            self.assertLess(self.storage.log_records, 100)
+            self.assertTrue(os.path.exists(self.storage.checkpoint_file_name))
+
+    def test_torn_record(self):
+        self.storage['a'] = 1
+        self.storage['b'] = 2
+        self.storage.log.close()  # emulating crash
+        size = os.path.getsize(self.storage.log_file_name)
+        with open(self.storage.log_file_name, 'r+b') as file:
+            file.truncate(size - 1)
+
+        self.storage = self.kv_storage('test')
+        with self.subTest('torn record is dropped'):
+            self.assertEqual(self.storage.data, {'a': 1})
+
+        with self.subTest('log is writable after recovery'):
+            self.storage['c'] = 3
+            self.reopen()
+            self.assertEqual(self.storage.data, {'a': 1, 'c': 3})
+
+    def test_count_links(self):
+        self.storage[1] = 5
+        self.storage[2] = 5
+        self.storage[3] = 6
+        self.assertEqual(self.storage.count_links(5), 2)
+
+
+class TestPersistentVolume(TestCase):
+    def setUp(self):
+        self.block_size = 16
+        self.blob_size = 8
+        self.path = './blob_test_storage'
+        self.kv_storage = LogKVStorage.factory(self.path)
+
+    def tearDown(self):
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def open_volume(self):
+        storage = FileStorage(self.block_size, self.blob_size, self.path, self.kv_storage)
+        return DedupeProxy(storage, self.kv_storage)
+
+    def test_reopen(self):
+        blocks = [rand_bytes(self.block_size, unique=True) for i in range(10)]
+        data = dict()
+        volume = self.open_volume()
+        for i in range(200):
+            address = rand_range(50)
+            data[address] = blocks[rand_range(len(blocks))]
+            volume.put_data(address, data[address])
+        volume.close()
+
+        volume = self.open_volume()
+        for address, block in data.items():
+            with self.subTest('read after reopen: address={}'.format(address)):
+                self.assertEqual(volume.get_data(address), block)
+
+        with self.subTest('allocator restored from metadata'):
+            self.assertNotIn(volume.storage.get_free_address(), volume.storage.blocks_metadata)
+        volume.close()
@@ -0,0 +1,159 @@
+from unittest import TestCase
+import os
+import pickle
+
+from blob.backends.key_value import LogKVStorage
+from blob.backends.mapped import MappedKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.exceptions import StorageBackendError
+from test.rand import rand_bytes, rand_range
+
+
+class TestMappedKVStorage(TestCase):
+    def setUp(self):
+        self.path = './blob_test_storage'
+        self.kv_storage = MappedKVStorage.factory(self.path, checkpoint_interval=100)
+        self.storage = self.kv_storage('test')
+
+    def tearDown(self):
+        self.storage.close()
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def reopen(self):
+        self.storage.close()
+        self.storage = self.kv_storage('test')
+
+    def check(self, data):
+        self.assertEqual(dict(self.storage.items()), data)
+        self.assertEqual(len(self.storage.keys()), len(data))
+        for key in data:
+            self.assertIn(key, self.storage)
+            self.assertEqual(self.storage[key], data[key])
+
+    def test_persistence(self):
+        hashes = [rand_bytes(16) for i in range(50)]
+        for make_key, make_value in [(lambda: rand_range(300), lambda: rand_range(10 ** 12)),
+                                     (lambda: hashes[rand_range(50)], lambda: [rand_range(100)] * rand_range(1, 3)),
+                                     (lambda: rand_range(300), lambda: rand_bytes(16).hex()),
+                                     (lambda: (rand_range(5), 'key'), lambda: (1, None))]:
+            data = dict()
+            for i in range(1000):
+                key = make_key()
+                if key in data and rand_range(3) == 0:
+                    del data[key]
+                    del self.storage[key]
+                else:
+                    data[key] = make_value()
+                    self.storage[key] = data[key]
+
+                if i % 250 == 0:
+                    with self.subTest('same data: key={}, value={}'.format(key, data.get(key))):
+                        self.check(data)
+
+            with self.subTest('same data after reopen: key={}'.format(key)):
+                self.reopen()
+                self.check(data)
+
+            with self.subTest('same data after replaying log without checkpoint: key={}'.format(key)):
+                for key in list(data)[:10]:
+                    del data[key]
+                    del self.storage[key]
+                self.storage.log.close()  # emulating crash
+                self.storage.close_index()
+                self.storage = self.kv_storage('test')
+                self.check(data)
+
+            for key in data:
+                del self.storage[key]
+            self.reopen()
+
+    def test_mixed_keys(self):
+        data = {1: 2, 3: 4, 'key': 5, 6: 'value', -7: 8}
+        for key, value in data.items():
+            self.storage[key] = value
+        self.storage.checkpoint()
+        with self.subTest('items not matching schema kept aside'):
+            self.assertEqual(self.storage.schema[:3], ('int', 8, 'int'))
+            self.assertEqual(self.storage.extra, {'key': 5, 6: 'value'})
+            self.check(data)
+        with self.subTest('missing key'):
+            with self.assertRaises(KeyError):
+                self.storage[2]
+            self.assertNotIn(2, self.storage)
+
+    def test_next_missing(self):
+        keys = set(range(100)) - {10, 11, 50}
+        for key in keys:
+            self.storage[key] = 1
+        self.storage.checkpoint()
+        del self.storage[70]
+        self.storage[10] = 1
+        keys = keys - {70} | {10}
+        self.storage[200] = 1
+        keys.add(200)
+        for start in range(0, 210, 7):
+            with self.subTest('lowest missing key: start={}'.format(start)):
+                expected = next((key for key in range(start, 300) if key not in keys), 300)
+                self.assertEqual(self.storage.next_missing(start, 300), expected)
+        self.assertEqual(self.storage.get_top(), 201)
+
+    def test_convert_log_checkpoint(self):
+        self.storage.close()
+        old = LogKVStorage(self.path, 'test')
+        for i in range(10):
+            old[i] = i
+        old.close()
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'test.idx')))
+
+        self.storage = self.kv_storage('test')
+        self.check(dict((i, i) for i in range(10)))
+        self.reopen()
+        self.assertFalse(os.path.exists(old.checkpoint_file_name))
+        self.check(dict((i, i) for i in range(10)))
+
+    def test_unknown_format(self):
+        self.storage.close()
+        with open(self.storage.checkpoint_file_name, 'wb') as file:
+            file.write(pickle.dumps(dict()).ljust(64, b'\0'))
+        with self.assertRaises(StorageBackendError):
+            self.storage = self.kv_storage('test')
+        os.remove(self.storage.checkpoint_file_name)
+        self.storage = self.kv_storage('test')
+
+
+class TestMappedVolume(TestCase):
+    def test_reopen(self):
+        path = './blob_test_storage'
+        kv_storage = MappedKVStorage.factory(path)
+        blocks = [rand_bytes(16, unique=True) for i in range(10)]
+        data = dict()
+        try:
+            proxy = DedupeProxy(FileStorage(16, 4, path, kv_storage), kv_storage)
+            for i in range(3):
+                for j in range(100):
+                    address = rand_range(100)
+                    if address in data and rand_range(4) == 0:
+                        del data[address]
+                        proxy.del_data(address)
+                    else:
+                        data[address] = blocks[rand_range(len(blocks))]
+                        proxy.put_data(address, data[address])
+                proxy.close()
+
+                with self.subTest('same data after reopen: round={}'.format(i)):
+                    proxy = DedupeProxy(FileStorage(16, 4, path, kv_storage), kv_storage)
+                    self.assertEqual(dict((address, proxy.get_data(address)) for address in data), data)
+                    self.assertEqual(len(proxy.storage.blocks_metadata.keys()), len(set(data.values())))
+
+                with self.subTest('free addresses after reopen: round={}'.format(i)):
+                    used = set(proxy.storage.blocks_metadata.keys())
+                    expected = [address for address in range(200) if address not in used][:5]
+                    self.assertEqual(proxy.storage.get_free_addresses(5), expected)
+            proxy.close()
+        finally:
+            for file_name in os.listdir(path):
+                os.remove(os.path.join(path, file_name))
+            os.rmdir(path)
@@ -0,0 +1,126 @@
+from unittest import TestCase
+import os
+
+from blob.backends.key_value import DictKVStorage, LogKVStorage
+from blob.backends.packed import PackedStorage
+from blob.backends.proxy import DedupeProxy
+from blob.compressors import get_compressor
+from blob.exceptions import StorageBackendError
+from blob.metrics import Metrics
+from test.rand import rand_bytes, rand_range
+
+
+class TestPackedStorage(TestCase):
+    def setUp(self):
+        self.block_size = 256
+        self.blob_size = 4
+        self.path = './blob_test_storage'
+        self.storage = PackedStorage(self.block_size, self.blob_size, self.path, DictKVStorage)
+
+    def tearDown(self):
+        self.storage.close()
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def test_put_get(self):
+        data = dict()
+        for compressor in ('zlib', 'lzma', 'bz2', None):
+            # blocks written by other compressors stay readable
+            self.storage.compressor = compressor
+            self.storage.compress = get_compressor(compressor)[0] if compressor is not None else None
+            for i in range(50):
+                address = rand_range(50)
+                if rand_range(2):
+                    data[address] = bytes(rand_range(self.block_size + 1))  # compressible
+                else:
+                    data[address] = rand_bytes(rand_range(self.block_size + 1))
+                self.storage.put_data(address, data[address])
+
+        with self.subTest('blocks are read back'):
+            for address, block_data in data.items():
+                self.assertEqual(self.storage.get_data(address), block_data)
+
+        with self.subTest('batch read'):
+            self.assertEqual(self.storage.get_data_batch(list(data)), list(data.values()))
+
+        with self.subTest('read into buffer'):
+            buffer = bytearray(self.block_size)
+            for address, block_data in data.items():
+                self.assertEqual(self.storage.get_data_into(address, buffer), len(block_data))
+                self.assertEqual(buffer[:len(block_data)], block_data)
+
+    def test_get_data_batch_sparse(self):
+        path = os.path.join(self.path, 'sparse')
+        metrics = Metrics()
+        storage = PackedStorage(self.block_size, 64, path, DictKVStorage, compressor=None, metrics=metrics)
+        try:
+            data = [rand_bytes(self.block_size) for address in range(64)]
+            storage.put_data_batch(enumerate(data))
+            for addresses, blocks_read in [([0, 63], 2), ([0, 3], 4), ([10, 0, 20, 7], 6)]:
+                with self.subTest('only nearby blocks read: addresses={}'.format(addresses)):
+                    metrics.reset()
+                    self.assertEqual(storage.get_data_batch(addresses), [data[address] for address in addresses])
+                    self.assertEqual(metrics.snapshot()['counters']['storage.bytes_read'],
+                                     blocks_read * self.block_size)
+        finally:
+            storage.close()
+            for file_name in os.listdir(path):
+                os.remove(os.path.join(path, file_name))
+            os.rmdir(path)
+
+    def test_layout(self):
+        self.storage.put_data_batch([(0, bytes(self.block_size)), (1, rand_bytes(self.block_size))])
+        blob, offset, length, compressor_name = self.storage.blocks_metadata[0]
+        with self.subTest('compressible block stored compressed'):
+            self.assertEqual(compressor_name, 'zlib')
+            self.assertLess(length, self.block_size)
+
+        with self.subTest('incompressible block stored raw next to it'):
+            self.assertEqual(self.storage.blocks_metadata[1], (blob, offset + length, self.block_size, None))
+
+        with self.subTest('ratio and cpu cost reported'):
+            self.assertGreater(self.storage.get_compression_ratio(), 1)
+            self.assertGreaterEqual(self.storage.get_cpu_per_mb(), 0)
+
+        with self.subTest('empty block takes no space'):
+            self.storage.put_data(2, b'')
+            self.assertEqual(self.storage.get_data(2), b'')
+
+    def test_reclaim(self):
+        for address in range(self.blob_size * 3):
+            self.storage.put_data(address, rand_bytes(self.block_size))
+        files = set(os.listdir(self.path))
+
+        with self.subTest('blob removed when all its blocks are dead'):
+            for address in range(self.blob_size):
+                self.storage.del_data(address)
+            self.assertNotIn(0, self.storage.blobs)
+            self.assertFalse(os.path.exists(self.storage.get_file_name(0)))
+
+        with self.subTest('repack moves live blocks out of sparse blobs'):
+            for address in range(self.blob_size, self.blob_size * 2 - 1):
+                self.storage.put_data(address, rand_bytes(self.block_size))  # leaves blob 1 with one block
+            expected = self.storage.get_data(self.blob_size * 2 - 1)
+            self.assertGreater(self.storage.repack(), 0)
+            self.assertNotIn(1, self.storage.blobs)
+            self.assertEqual(self.storage.get_data(self.blob_size * 2 - 1), expected)
+            self.assertLessEqual(len(os.listdir(self.path)), len(files))
+
+        with self.subTest('missing block'):
+            with self.assertRaises(StorageBackendError):
+                self.storage.get_data(0)
+
+    def test_persistence(self):
+        self.storage.close()
+        kv_storage = LogKVStorage.factory(self.path)
+        proxy = DedupeProxy(PackedStorage(self.block_size, self.blob_size, self.path, kv_storage), kv_storage)
+        data = dict((address, rand_bytes(16) * rand_range(1, 16)) for address in range(30))
+        proxy.put_data_batch(data.items())
+        proxy.close()
+
+        proxy = DedupeProxy(PackedStorage(self.block_size, self.blob_size, self.path, kv_storage), kv_storage)
+        self.storage = proxy
+        with self.subTest('same data after reopen'):
+            for address, block_data in data.items():
+                self.assertEqual(proxy.get_data(address), block_data)
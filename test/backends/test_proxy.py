@@ -1,10 +1,11 @@
 from unittest import TestCase
 
+from blob.backends.allocator import Allocator
 from blob.backends.storage import Storage
 from blob.backends.proxy import DedupeProxy
 from blob.backends.key_value import DictKVStorage
-from blob.exceptions import StorageBackendError
-from blob.hashers import sha256
+from blob.exceptions import StorageBackendError, HasherError
+from blob.hashers import sha256, get_hasher
 
 from test.rand import *
 
@@ -13,6 +14,7 @@ class StubStorage(Storage):
     def __init__(self):
         self.data = dict()
         self.last = None
+        self.allocator = Allocator(self.data)
 
     def get_data(self, address):
         return self.data[address]
@@ -20,16 +22,17 @@ class StubStorage(Storage):
     def put_data(self, address, block_data):
         self.data[address] = block_data
         self.last = block_data
+        self.allocator.use(address)
 
     def del_data(self, address):
         del self.data[address]
+        self.allocator.release(address)
 
     def get_free_address(self):
-        address = 0
-        while True:
-            if address not in self.data:
-                return address
-            address += 1
+        return self.allocator.get_free_address()
+
+    def get_free_addresses(self, count):
+        return self.allocator.get_free_addresses(count)
 
 
 class TestDedupeProxy(TestCase):
@@ -223,3 +226,117 @@ class TestDedupeProxy(TestCase):
             got_length = len(self.stub.data.values())
             self.assertTrue(got_data == expected_data and
                             got_length == expected_length)
+
+    def test_indexes(self):
+        num_of_tests = 1000
+        blocks = [rand_bytes(8, unique=True) for i in range(20)]
+        for i in range(num_of_tests):
+            self.storage.put_data(rand_range(100), blocks[rand_range(len(blocks))])
+
+        with self.subTest('link counters match address map'):
+            for storage_address in self.storage.links.keys():
+                self.assertEqual(self.storage.links[storage_address],
+                                 self.storage.by_address.count_links(storage_address))
+
+        with self.subTest('reverse hash map matches hash map'):
+            self.assertEqual(set(self.storage.by_storage_address.keys()), set(self.stub.data.keys()))
+            for storage_address in self.storage.by_storage_address.keys():
+                block_hash = self.storage.by_storage_address[storage_address]
+                self.assertIn(storage_address, self.storage.by_hash[block_hash])
+                self.assertEqual(block_hash, sha256(self.stub.data[storage_address]))
+
+    def test_put_get_data_batch(self):
+        blocks = [rand_bytes(8, unique=True) for i in range(5)]
+        data = dict()
+        for i in range(50):
+            batch = [(rand_range(40), blocks[rand_range(len(blocks))]) for j in range(10)]
+            with self.subTest('random batch test: batch={}'.format(batch)):
+                self.storage.put_data_batch(batch)
+                data.update(batch)
+                addresses = list(data)
+                self.assertEqual(self.storage.get_data_batch(addresses), [data[a] for a in addresses])
+
+        with self.subTest('check deduplication'):
+            self.assertEqual(set(self.stub.data.values()), set(data.values()))
+            self.assertEqual(len(self.stub.data), len(set(data.values())))
+
+    def test_get_data_into(self):
+        test_data = rand_bytes(8)
+        self.storage.put_data_batch([(0, test_data), (1, test_data)])
+        buffer = bytearray(16)
+        for address in (0, 1):
+            with self.subTest('read into buffer: address={}'.format(address)):
+                self.assertEqual(self.storage.get_data_into(address, buffer), 8)
+                self.assertEqual(buffer[:8], test_data)
+
+        with self.subTest('no block found'):
+            with self.assertRaises(StorageBackendError):
+                self.storage.get_data_into(2, buffer)
+
+    def test_del_data(self):
+        test_data = rand_bytes(8)
+        self.storage.put_data_batch([(0, test_data), (1, test_data)])
+        with self.subTest('shared block kept'):
+            self.storage.del_data(0)
+            self.assertEqual(list(self.stub.data.values()), [test_data])
+            self.assertNotIn(0, self.storage.by_address)
+
+        with self.subTest('last link deletes block'):
+            self.storage.del_data(1)
+            self.assertEqual(self.stub.data, {})
+            self.assertEqual(len(self.storage.by_hash.keys()), 0)
+
+        with self.subTest('no block found'):
+            with self.assertRaises(StorageBackendError):
+                self.storage.del_data(1)
+
+    def test_put_data_batch_dedupe(self):
+        test_data = rand_bytes(8)
+        self.storage.put_data_batch([(0, test_data), (1, test_data), (2, rand_bytes(8)), (2, test_data)])
+        self.assertEqual(list(self.stub.data.values()), [test_data])
+        self.assertEqual(self.storage.links[self.storage.by_address[0]], 3)
+
+    def test_verify_modes(self):
+        test_data = rand_bytes(8)
+        reads = []
+        get_data = self.stub.get_data
+        self.stub.get_data = lambda address: reads.append(address) or get_data(address)
+
+        with self.subTest('trust strong hash without reading back'):
+            storage = DedupeProxy(self.stub, DictKVStorage, get_hasher('blake2b', 16), verify=False)
+            storage.put_data(0, test_data)
+            storage.put_data(1, test_data)
+            self.assertEqual(storage.by_address[0], storage.by_address[1])
+            self.assertEqual(reads, [])
+
+        with self.subTest('prefilter reads back on match'):
+            self.stub.data.clear()
+            storage = DedupeProxy(self.stub, DictKVStorage, get_hasher('crc32'))
+            storage.put_data(0, test_data)
+            storage.put_data(1, test_data)
+            self.assertEqual(storage.by_address[0], storage.by_address[1])
+            self.assertEqual(len(reads), 1)
+
+        with self.subTest('weak hash can not be trusted'):
+            with self.assertRaises(HasherError):
+                DedupeProxy(self.stub, DictKVStorage, get_hasher('crc32'), verify=False)
+
+    def test_hash_workers(self):
+        blocks = [rand_bytes(8, unique=True) for i in range(10)]
+        items = [(rand_range(50), blocks[rand_range(len(blocks))]) for i in range(1000)]
+        expected = dict(items)
+        for hash_processes in (False, True):
+            stub = StubStorage()
+            storage = DedupeProxy(stub, DictKVStorage, hash_workers=2, hash_processes=hash_processes)
+            try:
+                with self.subTest('ingest keeps order of writes: hash_processes={}'.format(hash_processes)):
+                    self.assertEqual(storage.ingest(items, batch=16), len(items))
+                    self.assertEqual(dict((address, storage.get_data(address)) for address in expected), expected)
+                    self.assertEqual(set(stub.data.values()), set(expected.values()))
+
+                with self.subTest('batch hashed by pool: hash_processes={}'.format(hash_processes)):
+                    storage.put_data_batch([(address, blocks[0]) for address in range(50)])
+                    self.assertEqual(storage.get_data_batch(range(50)), [blocks[0]] * 50)
+                    self.assertEqual(list(stub.data.values()), [blocks[0]])
+            finally:
+                storage.close()
@@ -0,0 +1,153 @@
+from unittest import TestCase
+import os
+import threading
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.readahead import get_next_address
+from blob.backends.storage import FileStorage
+from blob.exceptions import StorageBackendError
+from test.rand import rand_bytes, rand_range
+
+
+class CountingStorage(FileStorage):
+    # FileStorage counting storage reads, prefetches are batch reads
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = 0
+        self.batch_reads = []
+
+    def get_data(self, address: int):
+        self.reads += 1
+        return super().get_data(address)
+
+    def get_data_batch(self, addresses):
+        addresses = list(addresses)
+        self.batch_reads.append(len(addresses))
+        return super().get_data_batch(addresses)
+
+
+class TestReadAhead(TestCase):
+    def setUp(self):
+        self.path = './blob_test_storage'
+        self.storage = CountingStorage(16, 64, self.path, DictKVStorage)
+        self.proxy = DedupeProxy(self.storage, DictKVStorage, read_ahead=16)
+        self.read_ahead = self.proxy.read_ahead
+
+    def tearDown(self):
+        self.proxy.close()
+        for file_name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, file_name))
+        os.rmdir(self.path)
+
+    def wait(self):
+        for loaded in set(self.read_ahead.loading.values()):
+            loaded.wait()
+
+    def test_sequential(self):
+        data = [rand_bytes(16, unique=True) for i in range(200)]
+        self.proxy.put_data_batch(list(enumerate(data)))
+        for address in range(200):
+            with self.subTest('sequential read: address={}'.format(address)):
+                self.assertEqual(self.proxy.get_data(address), data[address])
+            self.wait()
+
+        with self.subTest('prefetched blocks are hit'):
+            self.assertEqual(self.read_ahead.misses, 1)
+            self.assertEqual(self.read_ahead.hits, 198)
+            self.assertEqual(self.storage.reads, 2)
+            self.assertEqual(self.read_ahead.wasted, 0)
+        with self.subTest('window grows up to max_depth'):
+            self.assertLessEqual(max(self.storage.batch_reads), 16)
+            self.assertGreater(len(self.storage.batch_reads), 10)
+            self.assertEqual(self.read_ahead.get_stats()['depths'], [16])
+
+    def test_random(self):
+        data = [rand_bytes(16, unique=True) for i in range(100)]
+        self.proxy.put_data_batch(list(enumerate(data)))
+        for i in range(100):
+            address = rand_range(50) * 2
+            self.assertEqual(self.proxy.get_data(address), data[address])
+        self.wait()
+        self.assertEqual(self.read_ahead.prefetched, 0)
+        self.assertEqual(self.read_ahead.get_hit_rate(), 0.0)
+
+    def test_interleaved_runs(self):
+        data = [rand_bytes(16, unique=True) for i in range(300)]
+        self.proxy.put_data_batch(list(enumerate(data)))
+        buffer = bytearray(16)
+        for i in range(100):
+            for start in (0, 100, 200):
+                self.assertEqual(self.proxy.get_data_into(start + i, buffer), 16)
+                self.assertEqual(buffer, data[start + i])
+                self.wait()
+        self.assertGreater(self.read_ahead.get_hit_rate(), 0.9)
+
+    def test_batches(self):
+        data = dict((('key', 0, i), rand_bytes(16, unique=True)) for i in range(100))
+        self.proxy.put_data_batch(list(data.items()))
+        addresses = list(data)
+        for i in range(0, 100, 4):
+            self.assertEqual(self.proxy.get_data_batch(addresses[i:i + 4]), [data[a] for a in addresses[i:i + 4]])
+            self.wait()
+        self.assertGreater(self.read_ahead.hits, 80)
+
+    def test_writes(self):
+        data = [rand_bytes(16, unique=True) for i in range(100)]
+        self.proxy.put_data_batch(list(enumerate(data)))
+        for address in range(100):
+            if address % 3 == 0 and address + 5 < 100:
+                # prefetched blocks of changed and deleted addresses are not served
+                data[address + 5] = rand_bytes(16, unique=True)
+                self.proxy.put_data(address + 5, data[address + 5])
+                self.proxy.del_data(address + 4)
+                self.proxy.put_data(address + 4, data[address + 4])
+            with self.subTest('read after writes: address={}'.format(address)):
+                self.assertEqual(self.proxy.get_data(address), data[address])
+            self.wait()
+        self.assertEqual(self.proxy.pins, dict())
+
+    def test_next_address(self):
+        for address, expected in [(1, 2), (('key', 1, 5), ('key', 1, 6)), ('key', None), (('key',), None)]:
+            with self.subTest('next address: address={}'.format(address)):
+                self.assertEqual(get_next_address(address), expected)
+        with self.assertRaises(StorageBackendError):
+            DedupeProxy(self.storage, DictKVStorage, read_ahead=1.5)
+
+    def test_concurrent_writes(self):
+        blocks = [rand_bytes(16, unique=True) for i in range(10)]
+        self.proxy.put_data_batch([(address, blocks[address % 10]) for address in range(200)])
+        errors = []
+
+        def read():
+            for i in range(3):
+                for address in range(200):
+                    if self.proxy.get_data(address) not in blocks:
+                        errors.append(address)
+
+        readers = [threading.Thread(target=read) for i in range(2)]
+        for reader in readers:
+            reader.start()
+        for i in range(500):
+            address = rand_range(200)
+            self.proxy.put_data(address, blocks[rand_range(10)])
+        for reader in readers:
+            reader.join()
+        self.wait()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.proxy.pins, dict())
+        for address in range(200):
+            self.assertEqual(self.proxy.get_data(address), self.proxy.storage.get_data(self.proxy.by_address[address]))
+
+    def test_executor_shut_down(self):
+        data = [rand_bytes(16, unique=True) for i in range(20)]
+        self.proxy.put_data_batch(list(enumerate(data)))
+        self.read_ahead.executor.shutdown()
+        self.assertEqual(self.proxy.get_data(0), data[0])
+        with self.assertRaises(RuntimeError):
+            self.proxy.get_data(1)
+        with self.subTest('failed prefetch releases blocks'):
+            self.assertEqual(self.proxy.pins, dict())
+            self.assertEqual(self.read_ahead.loading, dict())
+            self.proxy.del_data(2)
+            self.assertEqual(self.proxy.get_data(3), data[3])
@@ -0,0 +1,68 @@
+from unittest import TestCase
+import os
+import shutil
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.sharded import ShardedStorage
+from blob.exceptions import StorageBackendError
+from test.rand import rand_bytes, rand_range
+
+
+class TestShardedStorage(TestCase):
+    def setUp(self):
+        self.block_size = 16
+        self.blob_size = 4
+        self.path = './blob_test_storage'
+        self.paths = [os.path.join(self.path, 'shard_{}'.format(i)) for i in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def check_storage(self, storage):
+        proxy = DedupeProxy(storage, DictKVStorage)
+        blocks = [rand_bytes(self.block_size, unique=True) for i in range(20)]
+        data = dict()
+        for i in range(10):
+            batch = [(rand_range(60), blocks[rand_range(len(blocks))]) for j in range(10)]
+            proxy.put_data_batch(batch)
+            data.update(batch)
+            address = rand_range(60)
+            data[address] = blocks[rand_range(len(blocks))]
+            proxy.put_data(address, data[address])
+
+        with self.subTest('put-get test'):
+            addresses = list(data)
+            self.assertEqual(proxy.get_data_batch(addresses), [data[address] for address in addresses])
+            for address in addresses:
+                self.assertEqual(proxy.get_data(address), data[address])
+
+        with self.subTest('dedupe across shards'):
+            self.assertEqual(len(proxy.by_storage_address.keys()), len(set(data.values())))
+
+        with self.subTest('blocks spread across shards'):
+            for path in self.paths:
+                self.assertTrue(os.listdir(path))
+
+        with self.subTest('errors are passed through'):
+            with self.assertRaises(StorageBackendError):
+                storage.get_data(10 ** 6)
+        proxy.close()
+
+    def test_file_storage_shards(self):
+        self.check_storage(ShardedStorage.create(self.block_size, self.blob_size, self.paths))
+
+    def test_process_shards(self):
+        self.check_storage(ShardedStorage.create(self.block_size, self.blob_size, self.paths, processes=True))
+
+    def test_free_addresses(self):
+        storage = ShardedStorage.create(self.block_size, self.blob_size, self.paths)
+        storage.put_data_batch([(address, rand_bytes(4)) for address in (0, 1, 2, 4)])
+        storage.del_data(1)
+
+        with self.subTest('lowest free address'):
+            self.assertEqual(storage.get_free_address(), 1)
+
+        with self.subTest('lowest free addresses'):
+            self.assertEqual(storage.get_free_addresses(4), [1, 3, 5, 6])
+        storage.close()
@@ -1,9 +1,11 @@
 from unittest import TestCase
+import mmap
 import os
 
 from blob.backends.key_value import DictKVStorage
 from blob.backends.storage import FileStorage
 from blob.exceptions import StorageBackendError
+from blob.metrics import Metrics
 from test.rand import rand_bytes, rand_range
 
 
@@ -17,6 +19,7 @@ class TestFileStorage(TestCase):
             os.mkdir(self.path)
 
     def tearDown(self):
+        self.storage.close()
         for path in os.listdir(self.path):
             os.remove(os.path.join(self.path, path))
         os.rmdir(self.path)
@@ -28,12 +31,33 @@ class TestFileStorage(TestCase):
         with self.subTest('test file exists'):
             self.assertTrue(os.path.exists(test_file))
 
-        with self.subTest('test file filled with zeros'):
+        with self.subTest('test file filled with zero bytes'):
             with open(test_file, 'rb') as file:
                 test_data = file.read()
-                expected = bytes('0', encoding='utf-8') * self.block_size * self.blob_size
+                expected = bytes(self.block_size * self.blob_size)
                 self.assertEqual(test_data, expected)
 
+    def test_init_blob_sparse(self):
+        block_size = 4096
+        blob_size = 256
+        blob_len = block_size * blob_size
+        for preallocate in (False, True):
+            storage = FileStorage(block_size, blob_size, self.path, DictKVStorage, preallocate=preallocate)
+            test_file = storage.get_file_name(0)
+            storage.put_data(3, rand_bytes(16))
+            with self.subTest('blob file size: preallocate={}'.format(preallocate)):
+                self.assertEqual(os.path.getsize(test_file), blob_len)
+
+            if hasattr(os.stat_result, 'st_blocks'):
+                with self.subTest('disk usage: preallocate={}'.format(preallocate)):
+                    allocated = os.stat(test_file).st_blocks * 512
+                    if preallocate:
+                        self.assertGreaterEqual(allocated, blob_len)
+                    else:
+                        self.assertLess(allocated, blob_len)
+            storage.close()
+            os.remove(test_file)
+
     def test_get_data(self):
         test_blob = 0
         test_block = 3
@@ -90,5 +114,165 @@ class TestFileStorage(TestCase):
                 got_data = self.storage.get_data(address)
                 self.assertEqual(got_data, block)
 
+    def test_put_data_in_place(self):
+        test_address = 3
+        test_blob, test_block = self.storage.get_physical_address(test_address)
+        test_file = self.storage.get_file_name(test_blob)
+        self.storage.init_blob(test_blob)
+        inode = os.stat(test_file).st_ino
+
+        with self.subTest('blob file is updated in place'):
+            self.storage.put_data(test_address, rand_bytes(self.block_size))
+            self.assertEqual(os.stat(test_file).st_ino, inode)
+
+        with self.subTest('short data stays aligned to the end of slot'):
+            test_data = bytes('abcd', encoding='utf-8')
+            self.storage.put_data(test_address, test_data)
+            with open(test_file, 'rb') as file:
+                raw_blob = file.read()
+            self.assertEqual(len(raw_blob), self.block_size * self.blob_size)
+            self.assertEqual(self.storage.get_data(test_address), test_data)
+
+    def test_put_data_atomic(self):
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, atomic=True)
+        addr_block = [(address, rand_bytes(self.block_size)) for address in range(self.blob_size)]
+        for address, block in addr_block:
+            storage.put_data(address, block)
+
+        for address, block in addr_block:
+            with self.subTest('atomic put-get test: address={}'.format(address)):
+                self.assertEqual(storage.get_data(address), block)
+
+        with self.subTest('no temporary files left'):
+            self.assertEqual(os.listdir(self.path), [os.path.basename(storage.get_file_name(0))])
+        storage.close()
+
+    def test_put_data_cost(self):
+        # block is written in place, rest of blob is neither read nor rewritten
+        block_size = 4096
+        num_of_writes = 50
+        for blob_size in (8, 4096):
+            storage = FileStorage(block_size, blob_size, self.path, DictKVStorage)
+            storage.init_blob(0)
+            io = {'read': 0, 'write': 0}
+            read, write = storage.pool.read, storage.pool.write
+
+            def counting_read(blob, file_name, offset, length):
+                io['read'] += length
+                return read(blob, file_name, offset, length)
+
+            def counting_write(blob, file_name, offset, data):
+                io['write'] += len(data)
+                return write(blob, file_name, offset, data)
+
+            storage.pool.read, storage.pool.write = counting_read, counting_write
+            block = rand_bytes(block_size)
+            for i in range(num_of_writes):
+                storage.put_data(i % blob_size, block)
+            with self.subTest('written bytes do not depend on blob size: blob_size={}'.format(blob_size)):
+                self.assertEqual(io, {'read': 0, 'write': block_size * num_of_writes})
+            storage.close()
+            os.remove(storage.get_file_name(0))
+
+    def test_file_pool(self):
+        pool_size = 2
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, pool_size=pool_size)
+        addr_block = [(address, rand_bytes(self.block_size)) for address in range(self.blob_size * 4)]
+        for address, block in addr_block:
+            storage.put_data(address, block)
+
+        with self.subTest('pool is bounded'):
+            self.assertEqual(len(storage.pool), pool_size)
+
+        with self.subTest('reads reuse open files'):
+            opens = storage.pool.opens
+            for i in range(10):
+                storage.get_data(addr_block[-1][0])
+            self.assertEqual(storage.pool.opens, opens)
+
+        with self.subTest('pooled file invalidated on init_blob'):
+            blob, block = storage.get_physical_address(addr_block[-1][0])
+            del storage.blobs[blob]
+            storage.init_blob(blob)
+            self.assertTrue(blob not in storage.pool.handles)
+        storage.close()
+
+    def test_mmap_reads(self):
+        for atomic in (False, True):
+            storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage,
+                                  atomic=atomic, use_mmap=True)
+            for address in range(self.blob_size * 2):
+                with self.subTest('mmap put-get test: atomic={}, address={}'.format(atomic, address)):
+                    for block in (rand_bytes(self.block_size), rand_bytes(self.block_size // 2)):
+                        storage.put_data(address, block)
+                        self.assertEqual(storage.get_data(address), block)
+            with self.subTest('mmap view is not copied: atomic={}'.format(atomic)):
+                block = rand_bytes(self.block_size)
+                storage.put_data(0, block)
+                blob, block_index = storage.get_physical_address(0)
+                offset = block_index * self.block_size
+                with storage.pool.view(blob, storage.get_file_name(blob), offset, self.block_size) as view:
+                    self.assertIs(type(view.obj), mmap.mmap)
+                    self.assertEqual(bytes(view), block)
+                    self.assertEqual(storage.get_data_batch([0]), [block])
+            storage.close()
+
+    def test_put_get_data_batch(self):
+        num_of_tests = 5
+        for atomic in (False, True):
+            storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, atomic=atomic)
+            for i in range(num_of_tests):
+                addr_block = dict((rand_range(64), rand_bytes(rand_range(1, self.block_size + 1))) for i in range(20))
+                with self.subTest('random batch test: atomic={}, addresses={}'.format(atomic, sorted(addr_block))):
+                    storage.put_data_batch(addr_block.items())
+                    addresses = list(addr_block)
+                    self.assertEqual(storage.get_data_batch(addresses), [addr_block[a] for a in addresses])
+                    self.assertEqual([storage.get_data(a) for a in addresses], [addr_block[a] for a in addresses])
+            storage.close()
+
+        with self.subTest('invalid batch is not written'):
+            with self.assertRaises(StorageBackendError):
+                self.storage.put_data_batch([(0, rand_bytes(self.block_size)), (1, rand_bytes(self.block_size + 1))])
+            self.assertNotIn(0, self.storage.blocks_metadata)
+
+    def test_get_data_batch_sparse(self):
+        metrics = Metrics()
+        storage = FileStorage(self.block_size, 64, self.path, DictKVStorage, metrics=metrics)
+        data = [rand_bytes(self.block_size) for address in range(64)]
+        storage.put_data_batch(enumerate(data))
+        for addresses, blocks_read in [([0, 63], 2), ([0, 3], 4), ([10, 0, 20, 7], 6), ([5], 1)]:
+            with self.subTest('only nearby blocks read: addresses={}'.format(addresses)):
+                metrics.reset()
+                self.assertEqual(storage.get_data_batch(addresses), [data[address] for address in addresses])
+                self.assertEqual(metrics.snapshot()['counters']['storage.bytes_read'], blocks_read * self.block_size)
+        storage.close()
+
+    def test_get_data_into(self):
+        for use_mmap in (False, True):
+            storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, use_mmap=use_mmap)
+            buffer = bytearray(self.block_size)
+            for address in range(self.blob_size * 2):
+                block = rand_bytes(rand_range(self.block_size + 1))
+                storage.put_data(address, block)
+                with self.subTest('read into buffer: use_mmap={}, address={}'.format(use_mmap, address)):
+                    self.assertEqual(storage.get_data_into(address, buffer), len(block))
+                    self.assertEqual(buffer[:len(block)], block)
+
+            with self.subTest('read into memoryview of larger buffer'):
+                block = rand_bytes(self.block_size)
+                storage.put_data(0, block)
+                buffer = bytearray(self.block_size * 2)
+                storage.get_data_into(0, memoryview(buffer)[self.block_size:])
+                self.assertEqual(buffer[self.block_size:], block)
 
+            with self.subTest('buffer too small'):
+                with self.assertRaises(StorageBackendError):
+                    storage.get_data_into(0, bytearray(self.block_size - 1))
+            storage.close()
 
+    def test_put_data_batch_coalesced(self):
+        storage = FileStorage(self.block_size, self.blob_size, self.path, DictKVStorage, pool_size=1)
+        storage.put_data_batch([(address, rand_bytes(self.block_size)) for address in range(self.blob_size * 3)])
+        with self.subTest('each blob file opened once'):
+            self.assertEqual(storage.pool.opens, 3)
+        storage.close()
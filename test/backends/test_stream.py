@@ -0,0 +1,100 @@
+from unittest import TestCase
+import io
+import os
+
+import blob
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.backends.stream import StreamStore
+from blob.exceptions import StorageBackendError
+
+
+class TestStreamStore(TestCase):
+    def setUp(self):
+        self.path = './blob_test_storage'
+        self.proxy = DedupeProxy(FileStorage(4096, 64, self.path, DictKVStorage), DictKVStorage)
+        self.streams = StreamStore(self.proxy, DictKVStorage, 1024, batch=4, max_pending_batches=2)
+
+    def tearDown(self):
+        self.streams.close()
+        self.proxy.close()
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def test_put_get_stream(self):
+        data = os.urandom(200000)
+        with self.subTest('object read back'):
+            self.assertEqual(self.streams.put_stream('a', io.BytesIO(data)), len(data))
+            with self.streams.get_stream('a') as stream:
+                self.assertEqual(stream.read(), data)
+            self.assertEqual(self.streams.get_size('a'), len(data))
+
+        with self.subTest('small reads'):
+            with self.streams.get_stream('a') as stream:
+                self.assertEqual(b''.join(iter(lambda: stream.read(777), b'')), data)
+
+        with self.subTest('empty object'):
+            self.streams.put_stream('empty', io.BytesIO(b''))
+            self.assertEqual(self.streams.get_stream('empty').read(), b'')
+
+        with self.subTest('missing object'):
+            with self.assertRaises(StorageBackendError):
+                self.streams.get_stream('b')
+
+    def test_dedupe(self):
+        data = os.urandom(100000)
+        self.streams.put_stream('a', io.BytesIO(data))
+        stored = len(self.proxy.links.keys())
+
+        with self.subTest('shifted copy shares chunks'):
+            self.streams.put_stream('b', io.BytesIO(data[:50000] + b'inserted' + data[50000:]))
+            self.assertLessEqual(len(self.proxy.links.keys()), stored + 3)
+
+        with self.subTest('overwrite releases old version'):
+            self.streams.put_stream('b', io.BytesIO(os.urandom(1000)))
+            self.streams.del_stream('a')
+            self.assertEqual(len(self.proxy.by_address.keys()), len(self.streams.manifests['b'][1]))
+            self.assertEqual(self.streams.keys(), ['b'])
+
+    def test_failed_put(self):
+        class FailingFile(io.RawIOBase):
+            def __init__(self):
+                self.reads = 0
+
+            def read(self, size=-1):
+                self.reads += 1
+                if self.reads > 3:
+                    raise OSError('read failed')
+                return os.urandom(size)
+
+        with self.subTest('error raised'):
+            with self.assertRaises(OSError):
+                self.streams.put_stream('a', FailingFile())
+
+        with self.subTest('written chunks removed'):
+            self.assertEqual(len(self.proxy.by_address.keys()), 0)
+            self.assertEqual(self.streams.keys(), [])
+
+
+class TestBlobStreams(TestCase):
+    def test_blob_streams(self):
+        path = './blob_test_storage'
+        data = os.urandom(100000)
+        try:
+            blob.init(4096, 16, path, persistent=True)
+            self.assertEqual(blob.put_stream('a', io.BytesIO(data)), 0)
+            blob.close()
+
+            blob.init(4096, 16, path, persistent=True)
+            output = io.BytesIO()
+            with self.subTest('object read after reopen'):
+                self.assertEqual(blob.get_stream('a', output), 0)
+                self.assertEqual(output.getvalue(), data)
+
+            with self.subTest('deleted object'):
+                self.assertEqual(blob.del_stream('a'), 0)
+                self.assertEqual(blob.get_stream('a', output), 1)
+        finally:
+            blob.delete()
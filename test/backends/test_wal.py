@@ -0,0 +1,163 @@
+from unittest import TestCase
+import os
+import threading
+
+from blob.backends.key_value import LogKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.backends.wal import LoggedStorage, WriteAheadLog
+from blob.exceptions import StorageBackendError
+from test.rand import rand_bytes, rand_range
+
+
+class TestLoggedStorage(TestCase):
+    def setUp(self):
+        self.block_size = 64
+        self.blob_size = 8
+        self.path = './blob_test_storage'
+        self.storage = self.open()
+
+    def tearDown(self):
+        self.storage.close()
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    def open(self, **kwargs):
+        kv_storage = LogKVStorage.factory(self.path)
+        proxy = DedupeProxy(FileStorage(self.block_size, self.blob_size, self.path, kv_storage), kv_storage)
+        return LoggedStorage(proxy, self.path, **kwargs)
+
+    def crash(self):
+        # stops checkpointer and drops memtable without applying it
+        with self.storage.lock:
+            self.storage.closed = True
+            self.storage.changed.notify_all()
+        self.storage.checkpointer.join()
+        self.storage.log.close()
+        self.storage.storage.close()
+
+    def test_put_get(self):
+        self.storage.close()
+        self.storage = self.open(checkpoint_interval=60)
+        data = dict()
+        for i in range(100):
+            address = rand_range(40)
+            data[address] = rand_bytes(self.block_size)
+            self.storage.put_data(address, data[address])
+
+        with self.subTest('blocks served from memtable'):
+            for address, block_data in data.items():
+                self.assertEqual(self.storage.get_data(address), block_data)
+            self.assertEqual(self.storage.get_data_batch(list(data)), list(data.values()))
+
+        with self.subTest('blocks served from storage after checkpoint'):
+            self.storage.checkpoint()
+            self.assertEqual(len(self.storage.memtable), 0)
+            for address, block_data in data.items():
+                self.assertEqual(self.storage.storage.get_data(address), block_data)
+                self.assertEqual(self.storage.get_data(address), block_data)
+
+        with self.subTest('checkpoint drops old logs'):
+            self.assertEqual(self.storage.get_generations(), [self.storage.generation])
+
+    def test_group_commit(self):
+        self.storage.close()
+        self.storage = self.open(commit_window=0.01)
+        errors = []
+
+        def worker(number):
+            try:
+                for i in range(10):
+                    self.storage.put_data(number * 10 + i, rand_bytes(self.block_size))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self.subTest('no errors'):
+            self.assertEqual(errors, [])
+
+        with self.subTest('commits share fsync'):
+            log = self.storage.log
+            self.storage.checkpoint()
+            self.assertLess(log.syncs, 80)
+
+    def test_replay(self):
+        self.storage.close()
+        self.storage = self.open(checkpoint_interval=60)
+        data = dict()
+        for address in range(20):
+            data[address] = rand_bytes(self.block_size)
+            self.storage.put_data(address, data[address])
+        file_name = self.storage.log.file_name
+        self.crash()
+
+        with open(file_name, 'ab') as file:
+            file.write(WriteAheadLog.record_header.pack(100, 0) + b'torn')  # emulating interrupted write
+
+        self.storage = self.open()
+        with self.subTest('log replayed into storage'):
+            self.assertEqual(len(self.storage.memtable), 0)
+            for address, block_data in data.items():
+                self.assertEqual(self.storage.get_data(address), block_data)
+
+        with self.subTest('replayed log removed'):
+            self.assertFalse(os.path.exists(file_name))
+
+        with self.subTest('data persists after clean close'):
+            self.storage.close()
+            self.storage = self.open()
+            for address, block_data in data.items():
+                self.assertEqual(self.storage.get_data(address), block_data)
+
+    def test_delete(self):
+        self.storage.close()
+        self.storage = self.open(checkpoint_interval=60)
+        data = dict((address, rand_bytes(self.block_size)) for address in range(10))
+        self.storage.put_data_batch(list(data.items()))
+        self.storage.checkpoint()
+        for address in (2, 3):
+            del data[address]
+            self.storage.del_data(address)
+        self.storage.put_data(20, rand_bytes(self.block_size))
+        self.storage.del_data(20)
+
+        def check():
+            for address in (2, 3, 20):
+                with self.assertRaises(StorageBackendError):
+                    self.storage.get_data(address)
+            self.assertEqual(self.storage.get_data_batch(list(data)), list(data.values()))
+
+        with self.subTest('deleted blocks are not served from memtable'):
+            check()
+            with self.assertRaises(StorageBackendError):
+                self.storage.del_data(2)
+            with self.assertRaises(StorageBackendError):
+                self.storage.del_data(30)
+
+        with self.subTest('deletes are replayed after crash'):
+            self.crash()
+            self.storage = self.open(checkpoint_interval=60)
+            check()
+
+        with self.subTest('deletes are applied by checkpoint'):
+            self.storage.put_data(2, data[0])
+            self.storage.del_data(2)
+            self.storage.checkpoint()
+            self.assertEqual(len(self.storage.memtable), 0)
+            check()
+            self.assertEqual(len(self.storage.storage.by_address.keys()), len(data))
+
+    def test_block_size(self):
+        with self.assertRaises(StorageBackendError):
+            self.storage.put_data(0, rand_bytes(self.block_size + 1))
+        self.assertEqual(len(self.storage.memtable), 0)
+        self.storage.close()
+        self.storage = self.open()
+        with self.assertRaises(StorageBackendError):
+            self.storage.get_data(0)
@@ -4,12 +4,12 @@ import random
 rand_range = random.randrange
 
 
-def rand_bytes(length, unique=False, cache=[]):
+def rand_bytes(length, unique=False, cache=set()):
     while True:
-        data = bytes([random.randrange(0, 256) for i in range(length)])
+        data = random.getrandbits(length * 8).to_bytes(length, 'little') if length else b''
         if unique:
             if data not in cache:
-                cache.append(data)
+                cache.add(data)
                 return data
         else:
             return data
@@ -0,0 +1,109 @@
+from unittest import IsolatedAsyncioTestCase
+import asyncio
+import os
+import threading
+
+from blob.aio import AsyncBlobStorage
+from blob.exceptions import StorageBackendError
+from test.rand import rand_bytes, rand_range
+
+
+class TestAsyncBlobStorage(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.block_size = 16
+        self.path = './blob_test_storage'
+        self.storage = AsyncBlobStorage.open(self.block_size, 8, self.path, max_pending_writes=4)
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+        for path in os.listdir(self.path):
+            os.remove(os.path.join(self.path, path))
+        os.rmdir(self.path)
+
+    async def test_put_get_block(self):
+        blocks = [rand_bytes(self.block_size, unique=True) for i in range(5)]
+        data = dict((address, blocks[rand_range(len(blocks))]) for address in range(50))
+        await asyncio.gather(*(self.storage.put_block(address, block) for address, block in data.items()))
+
+        with self.subTest('read back'):
+            got_data = await self.storage.get_blocks(list(data))
+            self.assertEqual(got_data, list(data.values()))
+
+        with self.subTest('data is deduplicated'):
+            self.assertEqual(len(self.storage.storage.storage.blocks_metadata.keys()), len(set(data.values())))
+
+        with self.subTest('unknown block'):
+            with self.assertRaises(StorageBackendError):
+                await self.storage.get_block(1000)
+
+    async def test_put_blocks(self):
+        blocks = [(address, rand_bytes(self.block_size)) for address in range(10)]
+        await self.storage.put_blocks(blocks)
+        self.assertEqual(await self.storage.get_blocks(range(10)), [block for address, block in blocks])
+        self.assertEqual(self.storage.pending_writes, 0)
+
+    async def test_merged_reads(self):
+        test_data = rand_bytes(self.block_size)
+        for address in range(10):
+            await self.storage.put_block(address, test_data)
+
+        reads = []
+        release = threading.Event()
+        file_storage = self.storage.storage.storage
+        get_data = file_storage.get_data
+
+        def slow_get_data(address):
+            reads.append(address)
+            release.wait(5)
+            return get_data(address)
+
+        file_storage.get_data = slow_get_data
+        tasks = [asyncio.ensure_future(self.storage.get_block(address)) for address in range(10)]
+        await asyncio.sleep(0.05)
+        release.set()
+        self.assertEqual(await asyncio.gather(*tasks), [test_data] * 10)
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(self.storage.reads, dict())
+        self.assertEqual(self.storage.storage.pins, dict())
+
+    async def test_loop_does_not_wait_for_proxy_lock(self):
+        await self.storage.put_block(0, rand_bytes(self.block_size))
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with self.storage.storage.lock:  # writer holding proxy lock
+                locked.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait(5)
+        task = asyncio.ensure_future(self.storage.get_block(0))
+        ticks = 0
+        for i in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        self.assertFalse(task.done())
+        self.assertEqual(ticks, 5)
+        release.set()
+        holder.join()
+        await task
+        self.assertEqual(self.storage.storage.pins, dict())
+
+    async def test_backpressure(self):
+        max_pending = 0
+        put_data_batch = self.storage.storage.put_data_batch
+
+        def checked_put_data_batch(items):
+            nonlocal max_pending
+            max_pending = max(max_pending, self.storage.pending_writes)
+            put_data_batch(items)
+
+        self.storage.storage.put_data_batch = checked_put_data_batch
+        await asyncio.gather(*(self.storage.put_block(address, rand_bytes(self.block_size)) for address in range(40)))
+        self.assertLessEqual(max_pending, 4)
+
+        with self.subTest('batch larger than limit'):
+            await self.storage.put_blocks([(address, rand_bytes(self.block_size)) for address in range(10)])
+            self.assertEqual(self.storage.pending_writes, 0)
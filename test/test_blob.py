@@ -46,3 +46,74 @@ class TestBlob(TestCase):
 
                 finally:
                     blob.delete()
+
+    def test_persistent(self):
+        block_size = 16
+        storage_path = './blob_test_storage'
+        data = {address: rand_bytes(block_size) for address in range(20)}
+        try:
+            blob.init(block_size, 4, storage_path, persistent=True)
+            for address, block in data.items():
+                blob.put_block(address, block)
+            self.assertEqual(blob.close(), 0)
+
+            blob.init(block_size, 4, storage_path, persistent=True)
+            for address, block in data.items():
+                with self.subTest('read after reopen: address={}'.format(address)):
+                    got_data = bytearray()
+                    self.assertEqual(blob.get_block(address, got_data), 0)
+                    self.assertEqual(got_data, block)
+        finally:
+            blob.delete()
+
+    def test_batch(self):
+        block_size = 16
+        storage_path = './blob_test_storage'
+        blocks = [(address, rand_bytes(block_size)) for address in range(20)]
+        blocks += [(address + 20, data) for address, data in blocks]
+        try:
+            blob.init(block_size, 4, storage_path)
+            self.assertEqual(blob.put_blocks(blocks), 0)
+            got_data = []
+            self.assertEqual(blob.get_blocks([address for address, data in blocks], got_data), 0)
+            self.assertEqual(got_data, [data for address, data in blocks])
+            self.assertEqual(len(blob.storage.storage.blocks_metadata.keys()), 20)
+        finally:
+            blob.delete()
+
+    def test_get_block_into(self):
+        block_size = 16
+        storage_path = './blob_test_storage'
+        for cache_size in (0, 1024):
+            try:
+                blob.init(block_size, 4, storage_path, cache_size=cache_size)
+                buffer = bytearray(block_size)
+                length = []
+                for block in (rand_bytes(block_size), rand_bytes(block_size // 2)):
+                    blob.put_block(0, block)
+                    for i in range(2):
+                        with self.subTest('read into buffer: cache_size={}, block={}'.format(cache_size, block)):
+                            self.assertEqual(blob.get_block_into(0, buffer, length), 0)
+                            self.assertEqual(buffer[:length[0]], block)
+
+                with self.subTest('missing block'):
+                    self.assertEqual(blob.get_block_into(1, buffer), 1)
+            finally:
+                blob.delete()
+
+    def test_compact(self):
+        block_size = 16
+        storage_path = './blob_test_storage'
+        blocks = [(address, rand_bytes(block_size)) for address in range(20)]
+        blocks += [(address + 20, data) for address, data in blocks]
+        with self.subTest('compact maps are not persistent'):
+            self.assertEqual(blob.init(block_size, 4, storage_path, persistent=True, compact=True), 1)
+        try:
+            self.assertEqual(blob.init(block_size, 4, storage_path, hasher='blake2b', compact=True), 0)
+            self.assertEqual(blob.put_blocks(blocks), 0)
+            got_data = []
+            self.assertEqual(blob.get_blocks([address for address, data in blocks], got_data), 0)
+            self.assertEqual(got_data, [data for address, data in blocks])
+            self.assertEqual(len(blob.storage.storage.blocks_metadata.keys()), 20)
+        finally:
+            blob.delete()
@@ -0,0 +1,59 @@
+from unittest import TestCase
+import io
+import itertools
+import os
+
+from blob.chunking import chunk_stream, get_chunk_sizes, get_masks, roll_boundary
+from blob.exceptions import BlobError
+
+
+class TestChunking(TestCase):
+    def test_chunk_sizes(self):
+        data = os.urandom(2 ** 20)
+        chunks = list(chunk_stream(io.BytesIO(data), 4096, read_size=10000))
+        with self.subTest('chunks join into input'):
+            self.assertEqual(b''.join(chunks), data)
+
+        with self.subTest('chunk sizes within bounds'):
+            self.assertTrue(all(1024 <= len(chunk) <= 16384 for chunk in chunks[:-1]))
+            self.assertLess(abs(len(data) / len(chunks) - 4096 * 1.25), 2048)
+
+        with self.subTest('incorrect sizes'):
+            for sizes in ((1000,), (4096, 8192), (4096, None, 2048)):
+                with self.assertRaises(BlobError):
+                    get_chunk_sizes(*sizes)
+
+    def test_scanned_boundaries(self):
+        # boundaries found by scanning hashes of 32 bytes at once are those of hash rolled byte by byte
+        data = os.urandom(2 ** 18) + bytes(2 ** 15) + os.urandom(3000) * 20
+        for avg_size in (512, 4096, 65536):
+            min_size, avg_size, max_size = get_chunk_sizes(avg_size)
+            mask_s, mask_l = get_masks(avg_size)
+            expected = []
+            start = 0
+            while start < len(data):
+                end = min(len(data), start + max_size)
+                boundary = None
+                if end - start > min_size:
+                    boundary = roll_boundary(data, start + min_size, min(end, start + avg_size), end, mask_s, mask_l)
+                start = end if boundary is None else boundary
+                expected.append(start)
+            with self.subTest('same boundaries: avg_size={}'.format(avg_size)):
+                chunks = chunk_stream(io.BytesIO(data), avg_size, read_size=100000)
+                self.assertEqual(list(itertools.accumulate(len(chunk) for chunk in chunks)), expected)
+
+    def test_shift_resistance(self):
+        data = os.urandom(2 ** 19)
+        chunks = list(chunk_stream(io.BytesIO(data), 4096))
+        for position in (0, 1000, 2 ** 18):
+            with self.subTest('one byte inserted: position={}'.format(position)):
+                shifted = list(chunk_stream(io.BytesIO(data[:position] + b'x' + data[position:]), 4096))
+                self.assertGreaterEqual(len(set(chunks) & set(shifted)), len(chunks) - 3)
+
+    def test_edge_cases(self):
+        with self.subTest('empty stream'):
+            self.assertEqual(list(chunk_stream(io.BytesIO(b''))), [])
+
+        with self.subTest('zeroes are cut at max_size'):
+            chunks = list(chunk_stream(io.BytesIO(bytes(100000)), 4096))
+            self.assertEqual([len(chunk) for chunk in chunks], [16384] * 6 + [1696])
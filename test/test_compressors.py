@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+from blob.compressors import get_compressor, register_compressor, compressors
+from blob.exceptions import CompressorError
+from test.rand import rand_bytes
+
+
+class TestCompressors(TestCase):
+    def test_get_compressor(self):
+        data = rand_bytes(64) * 4
+        for name in ('zlib', 'lzma', 'bz2'):
+            with self.subTest('round trip: name={}'.format(name)):
+                compress, decompress = get_compressor(name, 1)
+                self.assertEqual(decompress(compress(data)), data)
+
+        with self.subTest('unknown compressor'):
+            with self.assertRaises(CompressorError):
+                get_compressor('lz4')
+
+    def test_register_compressor(self):
+        register_compressor('reverse', lambda data: data[::-1], lambda data: data[::-1])
+        try:
+            compress, decompress = get_compressor('reverse')
+            self.assertEqual(compress(b'ab'), b'ba')
+            with self.assertRaises(CompressorError):
+                get_compressor('reverse', 1)
+        finally:
+            del compressors['reverse']
@@ -0,0 +1,60 @@
+from unittest import TestCase
+import functools
+
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import Storage
+from blob.exceptions import HasherError
+from blob.hashers import blake2b, get_hasher, is_strong, register_hasher, hashers, strong_hashers
+from test.rand import rand_bytes
+
+
+class TestHashers(TestCase):
+    def test_get_hasher(self):
+        data = rand_bytes(64)
+        for name in ('sha256', 'blake2b', 'blake2s', 'crc32'):
+            with self.subTest('hasher is deterministic: name={}'.format(name)):
+                hasher = get_hasher(name)
+                self.assertEqual(hasher(data), hasher(bytes(data)))
+                self.assertNotEqual(hasher(data), hasher(data + b'0'))
+
+        with self.subTest('raw digest bytes'):
+            self.assertIsInstance(get_hasher('blake2b')(data), bytes)
+            self.assertEqual(len(get_hasher('blake2s')(data)), 32)
+
+        with self.subTest('unknown hasher'):
+            with self.assertRaises(HasherError):
+                get_hasher('md4')
+
+    def test_digest_size(self):
+        data = rand_bytes(64)
+        with self.subTest('truncated digest'):
+            self.assertEqual(len(get_hasher('blake2b', 16)(data)), 16)
+            self.assertEqual(len(get_hasher('blake2s', 8)(data)), 8)
+
+        with self.subTest('digest_size is not supported'):
+            with self.assertRaises(HasherError):
+                get_hasher('sha256', 16)
+
+    def test_strong(self):
+        self.assertTrue(is_strong(get_hasher('sha256')))
+        self.assertTrue(is_strong(get_hasher('blake2b', 16)))
+        self.assertFalse(is_strong(get_hasher('crc32')))
+        with self.subTest('truncated digest is not strong'):
+            self.assertFalse(is_strong(get_hasher('blake2b', 1)))
+            self.assertFalse(is_strong(get_hasher('blake2s', 15)))
+            self.assertFalse(is_strong(functools.partial(blake2b, digest_size=8)))
+            with self.assertRaises(HasherError):
+                DedupeProxy(Storage(), DictKVStorage, get_hasher('blake2b', 1), verify=False)
+
+    def test_register_hasher(self):
+        def first_byte(data):
+            return data[:1]
+
+        register_hasher('first_byte', first_byte)
+        try:
+            self.assertIs(get_hasher('first_byte'), first_byte)
+            self.assertFalse(is_strong(first_byte))
+        finally:
+            del hashers['first_byte']
+            strong_hashers.discard(first_byte)
@@ -0,0 +1,100 @@
+from unittest import TestCase
+import os
+
+import blob
+from blob.backends.key_value import DictKVStorage
+from blob.backends.proxy import DedupeProxy
+from blob.backends.storage import FileStorage
+from blob.metrics import Histogram, Metrics
+from test.rand import rand_bytes
+
+
+class TestMetrics(TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        for i in range(99):
+            histogram.add(0.00001)
+        histogram.add(0.5)
+
+        with self.subTest('percentiles are bucket upper bounds'):
+            self.assertLessEqual(0.00001, histogram.get_percentile(0.5))
+            self.assertLess(histogram.get_percentile(0.5), 0.00002)
+            self.assertEqual(histogram.get_percentile(1.0), 0.5)
+
+        with self.subTest('snapshot'):
+            snapshot = histogram.snapshot()
+            self.assertEqual(snapshot['count'], 100)
+            self.assertEqual(sum(snapshot['buckets']), 100)
+
+    def test_sinks(self):
+        events = []
+        metrics = Metrics([lambda *event: events.append(event)])
+        metrics.count('a')
+        metrics.count('a', 2)
+        metrics.observe('b', 0.1)
+
+        with self.subTest('events passed to sinks'):
+            self.assertEqual(events, [('count', 'a', 1), ('count', 'a', 2), ('observe', 'b', 0.1)])
+
+        with self.subTest('in-memory snapshot'):
+            snapshot = metrics.snapshot()
+            self.assertEqual(snapshot['counters'], {'a': 3})
+            self.assertEqual(snapshot['histograms']['b']['count'], 1)
+
+        with self.subTest('reset'):
+            metrics.reset()
+            self.assertEqual(metrics.snapshot(), {'counters': {}, 'histograms': {}})
+
+
+class TestStackMetrics(TestCase):
+    def setUp(self):
+        self.path = './blob_test_storage'
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            for path in os.listdir(self.path):
+                os.remove(os.path.join(self.path, path))
+            os.rmdir(self.path)
+
+    def test_proxy(self):
+        metrics = Metrics()
+        storage = FileStorage(16, 4, self.path, DictKVStorage, metrics=metrics)
+        proxy = DedupeProxy(storage, DictKVStorage, lambda data: 'same', metrics=metrics)  # every block collides
+        blocks = [rand_bytes(16, unique=True) for i in range(3)]
+        proxy.put_data_batch([(0, blocks[0]), (1, blocks[0]), (2, blocks[1])])
+        proxy.put_data(3, blocks[2])
+        proxy.get_data(3)
+        proxy.close()
+
+        counters = metrics.snapshot()['counters']
+        with self.subTest('counters'):
+            self.assertEqual(counters['proxy.puts'], 4)
+            self.assertEqual(counters['proxy.dedupe_hits'], 1)
+            self.assertEqual(counters['proxy.collisions'], 2)
+            self.assertEqual(counters['proxy.bytes_written'], 48)
+            self.assertEqual(counters['storage.bytes_written'], 48)
+            self.assertEqual(counters['storage.file_opens'], 1)
+
+        with self.subTest('phases'):
+            histograms = metrics.snapshot()['histograms']
+            for name in ('proxy.hash', 'proxy.index', 'proxy.write', 'proxy.read_back', 'proxy.get',
+                         'storage.write', 'storage.read', 'storage.init_blob'):
+                self.assertIn(name, histograms)
+
+    def test_blob(self):
+        snapshot = dict()
+        with self.subTest('metrics disabled'):
+            blob.init(16, 4, self.path)
+            self.assertEqual(blob.get_metrics(snapshot), 1)
+            blob.delete()
+
+        blob.init(16, 4, self.path, metrics_sink=Metrics())
+        blob.put_block(0, rand_bytes(16))
+        blob.get_block(0, bytearray())
+        blob.get_block(1, bytearray())
+        with self.subTest('blob calls and errors'):
+            self.assertEqual(blob.get_metrics(snapshot), 0)
+            self.assertEqual(snapshot['histograms']['blob.get_block']['count'], 2)
+            self.assertEqual(snapshot['counters']['blob.errors'], 1)
+            self.assertEqual(snapshot['counters']['proxy.puts'], 1)
+        blob.delete()
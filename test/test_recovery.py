@@ -0,0 +1,42 @@
+from unittest import TestCase
+import os
+
+import blob
+from blob.backends.mapped import MappedKVStorage
+from blob.recovery import check_index, rebuild_index
+from test.rand import rand_bytes
+
+
+class TestRecovery(TestCase):
+    def test_rebuild_index(self):
+        block_size = 16
+        storage_path = './blob_test_storage'
+        blocks = [rand_bytes(block_size - i % 4, unique=True) for i in range(20)]
+        data = dict((address, blocks[address % len(blocks)]) for address in range(50))
+        try:
+            self.assertEqual(blob.init(block_size, 4, storage_path, persistent=True, mapped=True), 0)
+            self.assertEqual(blob.put_blocks(list(data.items())), 0)
+            blob.close()
+
+            with self.subTest('consistent index'):
+                self.assertEqual(check_index(storage_path, block_size, 4), [])
+
+            with self.subTest('missing index is detected'):
+                for name in ('by_hash', 'links'):
+                    os.remove(os.path.join(storage_path, name + MappedKVStorage.checkpoint_suffix))
+                self.assertNotEqual(check_index(storage_path, block_size, 4), [])
+
+            with self.subTest('index is rebuilt from blob files'):
+                result = rebuild_index(storage_path, block_size, 4, workers=2)
+                self.assertEqual(result, {'blocks': len(blocks), 'dangling': 0, 'orphans': 0})
+                self.assertEqual(check_index(storage_path, block_size, 4), [])
+
+            with self.subTest('rebuilt volume reads and deduplicates'):
+                self.assertEqual(blob.init(block_size, 4, storage_path, persistent=True, mapped=True), 0)
+                got_data = []
+                self.assertEqual(blob.get_blocks(list(data), got_data), 0)
+                self.assertEqual(got_data, list(data.values()))
+                self.assertEqual(blob.put_block(100, blocks[0]), 0)
+                self.assertEqual(len(blob.storage.storage.blocks_metadata.keys()), len(blocks))
+        finally:
+            blob.delete()
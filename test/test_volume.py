@@ -0,0 +1,136 @@
+from unittest import TestCase
+import io
+import os
+import subprocess
+import sys
+
+import blob
+from blob.exceptions import BlobError, StorageBackendError
+from blob.volume import Resources, open_volume
+from test.rand import rand_bytes, rand_range
+
+
+class TestVolume(TestCase):
+    def test_volumes(self):
+        paths = ['./blob_test_storage/a', './blob_test_storage/b']
+        resources = Resources(pool_size=4, cache_size=64 * 10, hash_workers=2)
+        volumes = [open_volume(path, 64, 4, resources=resources) for path in paths]
+        try:
+            data = [dict(), dict()]
+            for i in range(200):
+                n = rand_range(2)
+                address = rand_range(50)
+                data[n][address] = rand_bytes(64 - rand_range(4), unique=True)
+                volumes[n].put_block(address, data[n][address])
+
+            with self.subTest('volumes are independent'):
+                for volume, volume_data in zip(volumes, data):
+                    self.assertEqual(volume.get_blocks(list(volume_data)), list(volume_data.values()))
+                    with self.assertRaises(Exception):
+                        volume.get_block(50)
+
+            with self.subTest('volumes share pool and cache budget'):
+                self.assertLessEqual(len(resources.pool), 4)
+                self.assertLessEqual(resources.cache.size, 64 * 10)
+                self.assertGreater(resources.cache.size, 0)
+                self.assertLessEqual(len(set(key[0] for key in resources.cache.blocks)), 2)
+
+            with self.subTest('batch hashed on shared workers'):
+                blocks = [(address, rand_bytes(64, unique=True)) for address in range(100, 120)]
+                volumes[0].put_blocks(blocks)
+                self.assertEqual(volumes[0].get_blocks([address for address, block in blocks]),
+                                 [block for address, block in blocks])
+
+            with self.subTest('streams'):
+                stream_data = rand_bytes(1000)
+                volumes[1].put_stream('key', io.BytesIO(stream_data))
+                with volumes[1].get_stream('key') as stream:
+                    self.assertEqual(stream.read(), stream_data)
+                with self.assertRaises(Exception):
+                    volumes[0].get_stream('key')
+
+            with self.subTest('closed volume leaves others usable'):
+                owner = volumes[0].storage.storage.owner
+                volumes[0].close()
+                self.assertEqual(volumes[1].get_blocks(list(data[1])), list(data[1].values()))
+                self.assertNotIn(owner, set(key[0] for key in resources.cache.blocks))
+        finally:
+            for volume in volumes:
+                volume.delete()
+            resources.close()
+            os.rmdir('./blob_test_storage')
+
+    def test_read_ahead(self):
+        resources = Resources()
+        try:
+            with open_volume('./blob_test_storage', 64, 16, resources=resources, read_ahead=8) as volume:
+                data = [rand_bytes(64, unique=True) for i in range(100)]
+                volume.put_blocks(list(enumerate(data)))
+                self.assertEqual([volume.get_block(address) for address in range(100)], data)
+                stats = volume.get_read_ahead_stats()
+                self.assertEqual(stats['hits'] + stats['misses'], 99)
+                self.assertGreater(stats['prefetched'], 0)
+                volume.delete()
+            with open_volume('./blob_test_storage', 64, 16, resources=resources) as volume:
+                with self.assertRaises(BlobError):
+                    volume.get_read_ahead_stats()
+                volume.delete()
+        finally:
+            resources.close()
+
+    def test_wal(self):
+        path = './blob_test_storage'
+        with self.subTest('write-ahead log needs persistent maps'):
+            with self.assertRaises(StorageBackendError):
+                open_volume(path, 64, 4, wal=True)
+            self.assertEqual(blob.init(64, 4, path, wal=True), 1)
+
+        with self.subTest('logged blocks and deletes persist'):
+            block_data = rand_bytes(64)
+            with open_volume(path, 64, 4, persistent=True, wal=True) as volume:
+                volume.put_blocks([(1, block_data), (2, block_data)])
+                volume.storage.del_data(2)
+            with open_volume(path, 64, 4, persistent=True, wal=True) as volume:
+                self.assertEqual(volume.get_block(1), block_data)
+                with self.assertRaises(StorageBackendError):
+                    volume.get_block(2)
+                volume.delete()
+
+    def test_crash_reopen(self):
+        # blocks written after checkpoint are replayed from log of mapped maps, packed block
+        # locations do not match int schema of checkpoint and are kept aside as extra items
+        path = './blob_test_storage'
+        options = dict(persistent=True, mapped=True, compressor='zlib')
+        blocks = [rand_bytes(64, unique=True) for i in range(20)]
+        with open_volume(path, 64, 8, **options) as volume:
+            volume.put_blocks(list(enumerate(blocks[:10])))
+        script = ('import os\n'
+                  'from blob.volume import open_volume\n'
+                  'volume = open_volume({!r}, 64, 8, **{!r})\n'
+                  'volume.put_blocks(list(enumerate({!r}, 10)))\n'
+                  'os._exit(0)\n').format(path, options, blocks[10:])
+        subprocess.run([sys.executable, '-c', script], check=True)
+
+        with open_volume(path, 64, 8, **options) as volume:
+            with self.subTest('top after replay'):
+                self.assertEqual(volume.proxy.storage.blocks_metadata.get_top(), 20)
+            with self.subTest('new block does not overwrite replayed ones'):
+                volume.put_block(100, rand_bytes(64, unique=True))
+                self.assertEqual(volume.get_blocks(list(range(20))), blocks)
+            volume.delete()
+
+    def test_compatibility(self):
+        path = './blob_test_storage'
+        try:
+            self.assertEqual(blob.init(64, 4, path, cache_size=1024), 0)
+            with self.subTest('second init fails'):
+                self.assertEqual(blob.init(64, 4, path), 1)
+            with self.subTest('module functions use volume'):
+                self.assertEqual(blob.put_block(1, b'data'), 0)
+                self.assertEqual(blob.volume.get_block(1), b'data')
+            with self.subTest('metrics need metrics_sink'):
+                with self.assertRaises(BlobError):
+                    blob.volume.get_metrics()
+        finally:
+            self.assertEqual(blob.delete(), 0)
+            self.assertEqual(blob.delete(), 1)